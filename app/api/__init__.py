@@ -2,5 +2,8 @@
 from .authors import router as authors
 from .books import router as books
 from .categories import router as categories
-from .users import APIRouter as users
-from .borrowed_books import router as borrowed_books
\ No newline at end of file
+from .users import users
+from .borrowed_books import router as borrowed_books
+from .internal import router as internal
+from .stats import router as stats
+from .metrics import router as metrics
@@ -1,82 +1,143 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.db.database import get_session
-from app.models.authors import AuthorCreate, AuthorRead, AuthorUpdate
+from app.db.database import get_async_session
+from app.models.authors import Author, AuthorCreate, AuthorRead, AuthorUpdate
 from app.crud.authors import crud_authors
+from app.utils.etag import etag_matches, has_validator, make_etag, not_modified, page_etag, set_etag
+from app.utils.fieldsets import FIELDS_HELP, INCLUDE_HELP, sparse_response
+from app.utils.pagination import (
+    IDS_HELP, TOTAL_HELP, parse_ids, set_missing_ids_header, set_pagination_headers, set_total_count_header
+)
+from app.utils.serialization import render
 
 router = APIRouter()
 
 
 @router.post("/", response_model=AuthorRead, status_code=status.HTTP_201_CREATED)
-def create_author(
+async def create_author(
         author: AuthorCreate,
-        db: Session = Depends(get_session)
+        db: AsyncSession = Depends(get_async_session)
 ):
-    return crud_authors.create(db=db, obj_in=author)
+    return await crud_authors.acreate(db=db, obj_in=author)
 
 
 @router.get("/", response_model=List[AuthorRead])
-def read_authors(
+async def read_authors(
         *,
-        db: Session = Depends(get_session),
+        request: Request,
+        response: Response,
+        db: AsyncSession = Depends(get_async_session),
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        fields: Optional[str] = Query(None, description=FIELDS_HELP),
+        include: Optional[str] = Query(None, description=INCLUDE_HELP),
+        ids: Optional[str] = Query(None, description=IDS_HELP),
+        total: bool = Query(False, description=TOTAL_HELP)
 ):
-    return crud_authors.get_multi(db=db, skip=skip, limit=limit)
+    projection = crud_authors.projection(fields=fields, include=include)
+    if ids is not None:
+        authors, missing = await crud_authors.aget_many(
+            db, parse_ids(ids), with_relations=True, projection=None if projection.is_default else projection
+        )
+        set_missing_ids_header(response, missing)
+        if not projection.is_default:
+            return sparse_response(request, response, List[projection.response_model], authors)
+        etag = page_etag(request, crud_authors.page_version_of(authors))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        return render(List[AuthorRead], authors, response)
+    if total:
+        set_total_count_header(response, *await crud_authors.atotal_count(db))
+    if not projection.is_default:
+        authors = await crud_authors.aget_multi_projected(db, projection, skip=skip, limit=limit, cursor=cursor)
+        set_pagination_headers(request, response, crud_authors.next_cursor(authors, limit))
+        return sparse_response(request, response, List[projection.response_model], authors)
+
+    if has_validator(request):
+        etag = page_etag(request, await crud_authors.apage_version(db, skip=skip, limit=limit, cursor=cursor))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    authors = await crud_authors.aget_multi(db=db, skip=skip, limit=limit, cursor=cursor)
+    set_pagination_headers(request, response, crud_authors.next_cursor(authors, limit))
+    set_etag(response, page_etag(request, crud_authors.page_version_of(authors)))
+    return render(List[AuthorRead], authors, response)
 
 
 @router.get("/{author_id}", response_model=AuthorRead)
-def read_author(
+async def read_author(
         *,
         author_id: int,
-        db: Session = Depends(get_session)
+        request: Request,
+        response: Response,
+        db: AsyncSession = Depends(get_async_session),
+        fields: Optional[str] = Query(None, description=FIELDS_HELP),
+        include: Optional[str] = Query(None, description=INCLUDE_HELP)
 ):
-    author = crud_authors.get(db=db, id=author_id)
+    projection = crud_authors.projection(fields=fields, include=include)
+    if not projection.is_default:
+        author = await crud_authors.aget_projected(db, author_id, projection)
+        if not author:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Author with ID {author_id} not found"
+            )
+        return sparse_response(request, response, projection.response_model, author)
+
+    if has_validator(request):
+        version = await crud_authors.aversion(db, author_id)
+        if version is not None and etag_matches(request, make_etag(*version)):
+            return not_modified(make_etag(*version))
+
+    author = await crud_authors.aget(db=db, id=author_id)
     if not author:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Author with ID {author_id} not found"
         )
-    return author
+    set_etag(response, make_etag(*crud_authors.version_of(author)))
+    return render(AuthorRead, author, response)
 
 
 @router.put("/{author_id}", response_model=AuthorRead)
-def update_author(
+async def update_author(
         *,
         author_id: int,
         author: AuthorUpdate,
-        db: Session = Depends(get_session)
+        db: AsyncSession = Depends(get_async_session)
 ):
-    db_author = crud_authors.get(db=db, id=author_id)
+    db_author = await crud_authors.aget_for_write(db=db, id=author_id)
     if not db_author:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Author with ID {author_id} not found"
         )
 
-    return crud_authors.update(db=db, db_obj=db_author, obj_in=author)
+    return await crud_authors.aupdate(db=db, db_obj=db_author, obj_in=author)
 
 
 @router.delete("/{author_id}", response_model=AuthorRead)
-def delete_author(
+async def delete_author(
         *,
         author_id: int,
-        db: Session = Depends(get_session)
+        db: AsyncSession = Depends(get_async_session)
 ):
-    author = crud_authors.get(db=db, id=author_id)
+    author = await crud_authors.aget_for_write(db=db, id=author_id)
     if not author:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Author with ID {author_id} not found"
         )
 
-    # Check if author has books
-    if author.books:
+    # One EXISTS over the links instead of loading every book of the author
+    has_books = await crud_authors.aexists(db, Author.id == author_id, Author.books.any())
+    if has_books:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Cannot delete author with ID {author_id} because they have associated books"
         )
 
-    return crud_authors.remove(db=db, id=author_id)
+    return await crud_authors.aremove(db=db, id=author_id)
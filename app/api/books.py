@@ -1,145 +1,255 @@
 # app/api/books.py
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.db.database import get_session
-from app.models.books import BookCreate, BookRead, BookUpdate
+from app.db.database import get_async_session, get_read_engine
+from app.models.books import BookCreate, BookRead, BookUpdate, BookUpsert
 from app.crud.books import crud_books
-from app.services import book_service
+from app.services.book_service import book_service
+from app.services.export import FORMATS, export_service
+from app.utils.exceptions import DuplicateEntityException
+from app.utils.etag import etag_matches, has_validator, make_etag, not_modified, page_etag, set_etag
+from app.utils.fieldsets import FIELDS_HELP, INCLUDE_HELP, sparse_response
+from app.utils.pagination import (
+    IDS_HELP, TOTAL_HELP, parse_ids, set_missing_ids_header, set_pagination_headers, set_total_count_header
+)
+from app.utils.serialization import render
 
 router = APIRouter()
 
 @router.post("/", response_model=BookRead, status_code=status.HTTP_201_CREATED)
-def create_book(
+async def create_book(
     book: BookCreate,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
-    # Check if a book with the same ISBN already exists
-    existing_books = crud_books.search_books(db, title=None, author_id=None)
-    for existing_book in existing_books:
-        if existing_book.isbn == book.isbn:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Book with ISBN {book.isbn} already exists"
-            )
-
-    created_book = crud_books.create_with_relations(db=db, obj_in=book)
+    # ISBN uniqueness is enforced by the unique index on insert
+    try:
+        created_book = await crud_books.acreate_with_relations(db=db, obj_in=book)
+    except DuplicateEntityException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     # Явне завантаження зв’язків
-    created_book.authors  # Завантажуємо авторів
-    created_book.categories  # Завантажуємо категорії
-    return created_book
+    return await crud_books.aget_with_relations(db=db, id=created_book.id)
 
 @router.get("/", response_model=List[BookRead])
-def read_books(
+async def read_books(
     *,
-    db: Session = Depends(get_session),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_session),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     title: Optional[str] = None,
     author_id: Optional[int] = None,
-    category_id: Optional[int] = None
+    category_id: Optional[int] = None,
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
+    include: Optional[str] = Query(None, description=INCLUDE_HELP),
+    ids: Optional[str] = Query(None, description=IDS_HELP),
+    total: bool = Query(False, description=TOTAL_HELP)
 ):
-    books = crud_books.search_books(
+    projection = crud_books.projection(fields=fields, include=include)
+    if ids is not None:
+        books, missing = await crud_books.aget_many(
+            db, parse_ids(ids), with_relations=True, projection=None if projection.is_default else projection
+        )
+        set_missing_ids_header(response, missing)
+        if not projection.is_default:
+            return sparse_response(request, response, List[projection.response_model], books)
+        etag = page_etag(request, crud_books.page_version_of(books))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        return render(List[BookRead], books, response)
+    if total:
+        set_total_count_header(response, *await crud_books.asearch_total(
+            db=db, title=title, author_id=author_id, category_id=category_id
+        ))
+    if not projection.is_default:
+        books = await crud_books.asearch_books(
+            db=db,
+            title=title,
+            author_id=author_id,
+            category_id=category_id,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            projection=projection
+        )
+        set_pagination_headers(request, response, crud_books.next_cursor(books, limit))
+        return sparse_response(request, response, List[projection.response_model], books)
+
+    if has_validator(request):
+        version = await crud_books.asearch_version(
+            db=db,
+            title=title,
+            author_id=author_id,
+            category_id=category_id,
+            skip=skip,
+            limit=limit,
+            cursor=cursor
+        )
+        etag = page_etag(request, version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+    books = await crud_books.asearch_books(
         db=db,
         title=title,
         author_id=author_id,
         category_id=category_id,
         skip=skip,
-        limit=limit
+        limit=limit,
+        cursor=cursor
+    )
+    set_pagination_headers(request, response, crud_books.next_cursor(books, limit))
+    set_etag(response, page_etag(request, crud_books.page_version_of(books)))
+    return render(List[BookRead], books, response)
+
+@router.get("/search", response_model=List[BookRead])
+async def search_books(
+    *,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_session),
+    q: str = Query(..., min_length=1),
+    skip: int = 0,
+    limit: int = 20,
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
+    include: Optional[str] = Query(None, description=INCLUDE_HELP)
+):
+    projection = crud_books.projection(fields=fields, include=include)
+    if not projection.is_default:
+        books = await crud_books.afull_text_search(db=db, q=q, skip=skip, limit=limit, projection=projection)
+        return sparse_response(request, response, List[projection.response_model], books)
+    books = await crud_books.afull_text_search(db=db, q=q, skip=skip, limit=limit)
+    return render(List[BookRead], books, response)
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_books(
+    *,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    updated_since: Optional[datetime] = None,
+    read_engine: AsyncEngine = Depends(get_read_engine)
+):
+    # Streams on its own connection: the rows are read while the response is being sent
+    return StreamingResponse(
+        export_service.stream_books(read_engine, fmt=format, updated_since=updated_since),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="books.{format}"'}
     )
-    # Явне завантаження зв’язків для всіх книг
-    for book in books:
-        book.authors  # Завантажуємо авторів
-        book.categories  # Завантажуємо категорії
-    return books
 
 @router.get("/{book_id}", response_model=BookRead)
-def read_book(
+async def read_book(
     *,
     book_id: int,
-    db: Session = Depends(get_session)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_session),
+    fields: Optional[str] = Query(None, description=FIELDS_HELP),
+    include: Optional[str] = Query(None, description=INCLUDE_HELP)
 ):
-    book = crud_books.get(db=db, id=book_id)
+    projection = crud_books.projection(fields=fields, include=include)
+    if not projection.is_default:
+        book = await crud_books.aget_projected(db, book_id, projection)
+        if not book:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Book with ID {book_id} not found"
+            )
+        return sparse_response(request, response, projection.response_model, book)
+
+    # Answered from book/author/category timestamps before any relationship is loaded
+    if has_validator(request):
+        version = await crud_books.aversion(db, book_id)
+        if version is not None and etag_matches(request, make_etag(*version)):
+            return not_modified(make_etag(*version))
+
+    # Зв’язки завантажуються разом із книгою (selectinload)
+    book = await crud_books.aget_with_relations(db=db, id=book_id)
     if not book:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Book with ID {book_id} not found"
         )
-    # Явне завантаження зв’язків
-    book.authors  # Завантажуємо авторів
-    book.categories  # Завантажуємо категорії
-    return book
+    set_etag(response, make_etag(*crud_books.version_of(book)))
+    return render(BookRead, book, response)
 
 @router.put("/{book_id}", response_model=BookRead)
-def update_book(
+async def update_book(
     *,
     book_id: int,
     book: BookUpdate,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
-    db_book = crud_books.get(db=db, id=book_id)
+    db_book = await crud_books.aget_for_write(db=db, id=book_id)
     if not db_book:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Book with ID {book_id} not found"
         )
 
-    # Check ISBN uniqueness if it's being updated
-    if book.isbn and book.isbn != db_book.isbn:
-        existing_books = crud_books.search_books(db, title=None, author_id=None, category_id=None)
-        for existing_book in existing_books:
-            if existing_book.isbn == book.isbn:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Book with ISBN {book.isbn} already exists"
-                )
-
-    updated_book = crud_books.update_with_relations(db=db, db_obj=db_book, obj_in=book)
+    # A new ISBN that is taken is reported by the unique index on update
+    try:
+        updated_book = await crud_books.aupdate_with_relations(db=db, db_obj=db_book, obj_in=book)
+    except DuplicateEntityException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     # Явне завантаження зв’язків
-    updated_book.authors  # Завантажуємо авторів
-    updated_book.categories  # Завантажуємо категорії
-    return updated_book
+    return await crud_books.aget_with_relations(db=db, id=updated_book.id)
+
+@router.put("/by-isbn/{isbn}", response_model=BookRead)
+async def upsert_book_by_isbn(
+    *,
+    isbn: str,
+    book: BookUpsert,
+    response: Response,
+    db: AsyncSession = Depends(get_async_session)
+):
+    try:
+        db_book, created = await db.run_sync(
+            lambda session: crud_books.upsert_by_isbn(session, isbn=isbn, obj_in=book)
+        )
+    except DuplicateEntityException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if created:
+        response.status_code = status.HTTP_201_CREATED
+    # Явне завантаження зв’язків
+    return await crud_books.aget_with_relations(db=db, id=db_book.id)
 
 @router.delete("/{book_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_book(
+async def delete_book(
     *,
     book_id: int,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
-    book = crud_books.get(db=db, id=book_id)
-    if not book:
+    # The book is read (and locked) by the delete itself, which also refuses one with active borrows
+    if not await crud_books.aremove(db=db, id=book_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Book with ID {book_id} not found"
         )
-
-    # Check if the book has active borrows
-    '''
-    if book_service.has_active_borrows(db=db, book_id=book_id):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Cannot delete book with ID {book_id} because it has active borrows"
-        )
-    '''
-    crud_books.remove(db=db, id=book_id)
     return {"message": "Book deleted successfully"}  # Повертаємо відповідь для відповідності status_code
 
 
 @router.get("/{book_id}/available", response_model=dict)
-def check_book_availability(
+async def check_book_availability(
     *,
     book_id: int,
-    db: Session = Depends(get_session)
+    db: AsyncSession = Depends(get_async_session)
 ):
-    book = crud_books.get(db=db, id=book_id)
+    book = await crud_books.aget(db=db, id=book_id)
     if not book:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Book with ID {book_id} not found"
         )
 
-    available_copies = book_service.get_available_copies(db=db, book_id=book_id)
+    available_copies = await db.run_sync(
+        lambda session: book_service.get_available_copies(db=session, book_id=book_id)
+    )
 
     return {
         "book_id": book_id,
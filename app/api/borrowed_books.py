@@ -1,53 +1,113 @@
 # app/api/borrowed_books.py
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session
-from app.models.books import Book
-from app.db.database import get_session
-from app.models.borrowed_books import BorrowedBookCreate, BorrowedBookRead, BorrowedBookUpdate
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.db.database import get_async_session, get_read_engine
+from app.models.borrowed_books import (
+    BorrowBatchCreate,
+    BorrowBatchResult,
+    BorrowBatchReturn,
+    BorrowedBookCreate,
+    BorrowedBookRead,
+    BorrowedBookUpdate,
+)
 from app.crud.borrowed_books import crud_borrowed_books
+from app.services.circulation import circulation
+from app.services.export import FORMATS, export_service
+from app.utils.exceptions import LibraryException
+from app.utils.etag import etag_matches, has_validator, make_etag, not_modified, page_etag, set_etag
+from app.utils.pagination import set_pagination_headers
+from app.utils.serialization import render
 
 router = APIRouter()
 
 @router.post("/", response_model=BorrowedBookRead, status_code=status.HTTP_201_CREATED)
-def create_borrowed_book(borrow: BorrowedBookCreate, db: Session = Depends(get_session)):
-    # Додати логіку перевірки доступності книги (наприклад, quantity > 0)
-    book = db.get(Book, borrow.book_id)
-    if not book or book.quantity <= 0:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Book with ID {borrow.book_id} is not available")
-    book.quantity -= 1
-    db.add(book)
-    return crud_borrowed_books.create(db=db, obj_in=borrow)
+async def create_borrowed_book(borrow: BorrowedBookCreate, db: AsyncSession = Depends(get_async_session)):
+    # Доступність і ліміт користувача перевіряються атомарно умовними UPDATE
+    try:
+        return await db.run_sync(lambda session: circulation.checkout(
+            session,
+            book_id=borrow.book_id,
+            user_id=borrow.user_id,
+            borrow_date=borrow.borrow_date,
+            due_date=borrow.due_date
+        ))
+    except LibraryException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.post("/batch", response_model=BorrowBatchResult)
+async def create_borrowed_books_batch(batch: BorrowBatchCreate, db: AsyncSession = Depends(get_async_session)):
+    # Стопка книг одного користувача: одна транзакція, результат для кожної книги
+    try:
+        return await db.run_sync(lambda session: circulation.checkout_batch(
+            session,
+            user_id=batch.user_id,
+            book_ids=batch.book_ids,
+            borrow_date=batch.borrow_date,
+            due_date=batch.due_date
+        ))
+    except LibraryException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.post("/batch-return", response_model=BorrowBatchResult)
+async def return_borrowed_books_batch(batch: BorrowBatchReturn, db: AsyncSession = Depends(get_async_session)):
+    return await db.run_sync(lambda session: circulation.return_batch(
+        session, borrow_ids=batch.borrow_ids, return_date=batch.return_date
+    ))
 
 @router.get("/", response_model=List[BorrowedBookRead])
-def read_borrowed_books(skip: int = 0, limit: int = 100, db: Session = Depends(get_session)):
-    return crud_borrowed_books.get_multi(db=db, skip=skip, limit=limit)
+async def read_borrowed_books(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_session)):
+    if has_validator(request):
+        etag = page_etag(request, await crud_borrowed_books.apage_version(db, skip=skip, limit=limit, cursor=cursor))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    borrows = await crud_borrowed_books.aget_multi(db=db, skip=skip, limit=limit, cursor=cursor)
+    set_pagination_headers(request, response, crud_borrowed_books.next_cursor(borrows, limit))
+    set_etag(response, page_etag(request, crud_borrowed_books.page_version_of(borrows)))
+    return render(List[BorrowedBookRead], borrows, response)
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_borrowed_books(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), updated_since: Optional[datetime] = None, read_engine: AsyncEngine = Depends(get_read_engine)):
+    return StreamingResponse(
+        export_service.stream_borrows(read_engine, fmt=format, updated_since=updated_since),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="borrowed-books.{format}"'}
+    )
 
 @router.get("/{borrow_id}", response_model=BorrowedBookRead)
-def read_borrowed_book(borrow_id: int, db: Session = Depends(get_session)):
-    borrow = crud_borrowed_books.get(db=db, id=borrow_id)
+async def read_borrowed_book(borrow_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_session)):
+    if has_validator(request):
+        version = await crud_borrowed_books.aversion(db, borrow_id)
+        if version is not None and etag_matches(request, make_etag(*version)):
+            return not_modified(make_etag(*version))
+    borrow = await crud_borrowed_books.aget(db=db, id=borrow_id)
     if not borrow:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Borrow with ID {borrow_id} not found")
-    return borrow
+    set_etag(response, make_etag(*crud_borrowed_books.version_of(borrow)))
+    return render(BorrowedBookRead, borrow, response)
 
 @router.put("/{borrow_id}", response_model=BorrowedBookRead)
-def update_borrowed_book(borrow_id: int, borrow: BorrowedBookUpdate, db: Session = Depends(get_session)):
-    db_borrow = crud_borrowed_books.get(db=db, id=borrow_id)
+async def update_borrowed_book(borrow_id: int, borrow: BorrowedBookUpdate, db: AsyncSession = Depends(get_async_session)):
+    db_borrow = await crud_borrowed_books.aget_for_write(db=db, id=borrow_id)
     if not db_borrow:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Borrow with ID {borrow_id} not found")
     if borrow.return_date and not db_borrow.return_date:
-        book = db.get(Book, db_borrow.book_id)
-        book.quantity += 1
-        db.add(book)
-    return crud_borrowed_books.update(db=db, db_obj=db_borrow, obj_in=borrow)
+        try:
+            return await db.run_sync(lambda session: circulation.return_borrow(
+                session, borrow_id=borrow_id, return_date=borrow.return_date
+            ))
+        except LibraryException as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return await crud_borrowed_books.aupdate(db=db, db_obj=db_borrow, obj_in=borrow)
 
 @router.delete("/{borrow_id}", response_model=BorrowedBookRead)
-def delete_borrowed_book(borrow_id: int, db: Session = Depends(get_session)):
-    borrow = crud_borrowed_books.get(db=db, id=borrow_id)
+async def delete_borrowed_book(borrow_id: int, db: AsyncSession = Depends(get_async_session)):
+    borrow = await crud_borrowed_books.aget_for_write(db=db, id=borrow_id)
     if not borrow:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Borrow with ID {borrow_id} not found")
-    if not borrow.return_date:
-        book = db.get(Book, borrow.book_id)
-        book.quantity += 1
-        db.add(book)
-    return crud_borrowed_books.remove(db=db, id=borrow_id)
\ No newline at end of file
+    # Видалення активної видачі повертає примірник
+    await db.run_sync(lambda session: circulation.remove(session, borrow_id=borrow_id))
+    return borrow
\ No newline at end of file
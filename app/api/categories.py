@@ -1,40 +1,84 @@
 # app/api/categories.py
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session
-from app.db.database import get_session
-from app.models.categories import CategoryCreate, CategoryRead, CategoryUpdate
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.db.database import get_async_session
+from app.models.categories import Category, CategoryCreate, CategoryRead, CategoryUpdate
 from app.crud.categories import crud_categories
+from app.utils.etag import etag_matches, has_validator, make_etag, not_modified, page_etag, set_etag
+from app.utils.fieldsets import FIELDS_HELP, INCLUDE_HELP, sparse_response
+from app.utils.pagination import (
+    IDS_HELP, TOTAL_HELP, parse_ids, set_missing_ids_header, set_pagination_headers, set_total_count_header
+)
+from app.utils.serialization import render
 
 router = APIRouter()
 
 @router.post("/", response_model=CategoryRead, status_code=status.HTTP_201_CREATED)
-def create_category(category: CategoryCreate, db: Session = Depends(get_session)):
-    return crud_categories.create(db=db, obj_in=category)
+async def create_category(category: CategoryCreate, db: AsyncSession = Depends(get_async_session)):
+    return await crud_categories.acreate(db=db, obj_in=category)
 
 @router.get("/", response_model=List[CategoryRead])
-def read_categories(skip: int = 0, limit: int = 100, db: Session = Depends(get_session)):
-    return crud_categories.get_multi(db=db, skip=skip, limit=limit)
+async def read_categories(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = Query(None, description=FIELDS_HELP), include: Optional[str] = Query(None, description=INCLUDE_HELP), ids: Optional[str] = Query(None, description=IDS_HELP), total: bool = Query(False, description=TOTAL_HELP), db: AsyncSession = Depends(get_async_session)):
+    projection = crud_categories.projection(fields=fields, include=include)
+    if ids is not None:
+        categories, missing = await crud_categories.aget_many(
+            db, parse_ids(ids), with_relations=True, projection=None if projection.is_default else projection
+        )
+        set_missing_ids_header(response, missing)
+        if not projection.is_default:
+            return sparse_response(request, response, List[projection.response_model], categories)
+        etag = page_etag(request, crud_categories.page_version_of(categories))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        return render(List[CategoryRead], categories, response)
+    if total:
+        set_total_count_header(response, *await crud_categories.atotal_count(db))
+    if not projection.is_default:
+        categories = await crud_categories.aget_multi_projected(db, projection, skip=skip, limit=limit, cursor=cursor)
+        set_pagination_headers(request, response, crud_categories.next_cursor(categories, limit))
+        return sparse_response(request, response, List[projection.response_model], categories)
+    if has_validator(request):
+        etag = page_etag(request, await crud_categories.apage_version(db, skip=skip, limit=limit, cursor=cursor))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    categories = await crud_categories.aget_multi(db=db, skip=skip, limit=limit, cursor=cursor)
+    set_pagination_headers(request, response, crud_categories.next_cursor(categories, limit))
+    set_etag(response, page_etag(request, crud_categories.page_version_of(categories)))
+    return render(List[CategoryRead], categories, response)
 
 @router.get("/{category_id}", response_model=CategoryRead)
-def read_category(category_id: int, db: Session = Depends(get_session)):
-    category = crud_categories.get(db=db, id=category_id)
+async def read_category(category_id: int, request: Request, response: Response, fields: Optional[str] = Query(None, description=FIELDS_HELP), include: Optional[str] = Query(None, description=INCLUDE_HELP), db: AsyncSession = Depends(get_async_session)):
+    projection = crud_categories.projection(fields=fields, include=include)
+    if not projection.is_default:
+        category = await crud_categories.aget_projected(db, category_id, projection)
+        if not category:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Category with ID {category_id} not found")
+        return sparse_response(request, response, projection.response_model, category)
+    if has_validator(request):
+        version = await crud_categories.aversion(db, category_id)
+        if version is not None and etag_matches(request, make_etag(*version)):
+            return not_modified(make_etag(*version))
+    category = await crud_categories.aget(db=db, id=category_id)
     if not category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Category with ID {category_id} not found")
-    return category
+    set_etag(response, make_etag(*crud_categories.version_of(category)))
+    return render(CategoryRead, category, response)
 
 @router.put("/{category_id}", response_model=CategoryRead)
-def update_category(category_id: int, category: CategoryUpdate, db: Session = Depends(get_session)):
-    db_category = crud_categories.get(db=db, id=category_id)
+async def update_category(category_id: int, category: CategoryUpdate, db: AsyncSession = Depends(get_async_session)):
+    db_category = await crud_categories.aget_for_write(db=db, id=category_id)
     if not db_category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Category with ID {category_id} not found")
-    return crud_categories.update(db=db, db_obj=db_category, obj_in=category)
+    return await crud_categories.aupdate(db=db, db_obj=db_category, obj_in=category)
 
 @router.delete("/{category_id}", response_model=CategoryRead)
-def delete_category(category_id: int, db: Session = Depends(get_session)):
-    category = crud_categories.get(db=db, id=category_id)
+async def delete_category(category_id: int, db: AsyncSession = Depends(get_async_session)):
+    category = await crud_categories.aget_for_write(db=db, id=category_id)
     if not category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Category with ID {category_id} not found")
-    if category.books:
+    has_books = await crud_categories.aexists(db, Category.id == category_id, Category.books.any())
+    if has_books:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Cannot delete category with ID {category_id} because it has associated books")
-    return crud_categories.remove(db=db, id=category_id)
\ No newline at end of file
+    return await crud_categories.aremove(db=db, id=category_id)
\ No newline at end of file
@@ -0,0 +1,92 @@
+# app/api/internal.py
+import secrets
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import get_settings
+from app.crud.cache import get_cache_backend
+from app.db.database import async_engine, engine, get_async_session, replicas
+from app.models.jobs import JobRun, JobRunRead
+from app.models.stats import LibraryStatsRead
+from app.services.stats_service import stats_service
+from app.db.pool import pool_status
+from app.utils.logger import logging_stats
+
+
+
+async def require_internal_token(x_internal_token: Optional[str] = Header(None)) -> None:
+    """
+    /internal/* answers only requests carrying INTERNAL_API_TOKEN in X-Internal-Token;
+    without a configured token the routes do not exist
+    """
+    expected = get_settings().INTERNAL_API_TOKEN
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_internal_token or not secrets.compare_digest(x_internal_token.encode(), expected.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid internal API token")
+
+
+router = APIRouter(dependencies=[Depends(require_internal_token)])
+
+
+@router.get("/pool", response_model=dict)
+async def read_pool_stats():
+    """
+    Live connection pool statistics of this worker process
+    """
+    return {
+        "sync": pool_status(engine),
+        "async": pool_status(async_engine.sync_engine),
+    }
+
+
+@router.get("/replicas", response_model=dict)
+async def read_replica_status():
+    """
+    Health, lag and reads served of the read replicas, as this worker process sees them
+    """
+    return replicas.status()
+
+
+@router.get("/cache", response_model=dict)
+async def read_cache_stats():
+    """
+    Hit/miss/eviction counters of the CRUD cache in this worker process
+    """
+    backend = get_cache_backend()
+    return {"backend": type(backend).__name__, **backend.stats()}
+
+
+@router.get("/logging", response_model=dict)
+async def read_logging_stats():
+    """
+    Log queue usage and records dropped because it was full, in this worker process
+    """
+    return logging_stats()
+
+
+@router.get("/startup", response_model=dict)
+async def read_startup_profile(request: Request):
+    """
+    Import and lifespan phase timings of this worker's start
+    """
+    return getattr(request.app.state, "startup", {})
+
+
+@router.get("/jobs", response_model=List[JobRunRead])
+async def read_job_runs(limit: int = 20, db: AsyncSession = Depends(get_async_session)):
+    """
+    Latest background job runs across all workers
+    """
+    results = await db.exec(select(JobRun).order_by(JobRun.id.desc()).limit(limit))
+    return results.all()
+
+
+@router.post("/stats/rebuild", response_model=LibraryStatsRead)
+async def rebuild_stats(db: AsyncSession = Depends(get_async_session)):
+    """
+    Recompute the statistics rollups from the borrow history
+    """
+    return await db.run_sync(lambda session: stats_service.rebuild(session))
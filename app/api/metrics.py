@@ -0,0 +1,15 @@
+# app/api/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.utils.metrics import exporter
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    """
+    Request metrics of all worker processes in Prometheus text format
+    """
+    return PlainTextResponse(await exporter.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
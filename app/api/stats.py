@@ -0,0 +1,51 @@
+# app/api/stats.py
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.db.database import get_async_session
+from app.models.stats import BookStatsRead, CategoryStatsRead, LibraryStatsRead, UserStatsRead
+from app.services.stats_service import stats_service
+
+router = APIRouter()
+
+
+@router.get("/library", response_model=LibraryStatsRead)
+async def read_library_stats(db: AsyncSession = Depends(get_async_session)):
+    # Borrow totals and current utilization
+    return await db.run_sync(lambda session: stats_service.library(session))
+
+
+@router.get("/books/top", response_model=List[BookStatsRead])
+async def read_top_books(
+        limit: int = Query(10, ge=1, le=100),
+        db: AsyncSession = Depends(get_async_session)
+):
+    return await db.run_sync(lambda session: stats_service.top_books(session, limit=limit))
+
+
+@router.get("/categories", response_model=List[CategoryStatsRead])
+async def read_category_stats(
+        limit: int = Query(100, ge=1, le=1000),
+        db: AsyncSession = Depends(get_async_session)
+):
+    return await db.run_sync(lambda session: stats_service.categories(session, limit=limit))
+
+
+@router.get("/users/top", response_model=List[UserStatsRead])
+async def read_top_users(
+        limit: int = Query(10, ge=1, le=100),
+        db: AsyncSession = Depends(get_async_session)
+):
+    return await db.run_sync(lambda session: stats_service.top_users(session, limit=limit))
+
+
+@router.get("/users/{user_id}", response_model=UserStatsRead)
+async def read_user_stats(user_id: int, db: AsyncSession = Depends(get_async_session)):
+    stats = await db.run_sync(lambda session: stats_service.user(session, user_id))
+    if stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with ID {user_id} not found"
+        )
+    return stats
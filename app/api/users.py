@@ -1,38 +1,81 @@
 # app/api/users.py
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import Session
-from app.db.database import get_session
-from app.models.users import UserCreate, UserRead, UserUpdate
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.db.database import get_async_session
+from app.models.users import User, UserCreate, UserRead, UserUpdate
 from app.crud.users import crud_users
+from app.utils.etag import etag_matches, has_validator, make_etag, not_modified, page_etag, set_etag
+from app.utils.fieldsets import FIELDS_HELP, INCLUDE_HELP, sparse_response
+from app.utils.pagination import (
+    IDS_HELP, TOTAL_HELP, parse_ids, set_missing_ids_header, set_pagination_headers, set_total_count_header
+)
+from app.utils.serialization import render
 
 users = APIRouter()
 
 @users.post("/", response_model=UserRead, status_code=status.HTTP_201_CREATED)
-def create_user(user: UserCreate, db: Session = Depends(get_session)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_session)):
     try:
-        return crud_users.create(db=db, obj_in=user)
+        return await crud_users.acreate(db=db, obj_in=user)
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @users.get("/", response_model=List[UserRead])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_session)):
-    return crud_users.get_multi(db=db, skip=skip, limit=limit)
+async def read_users(request: Request, response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = Query(None, description=FIELDS_HELP), include: Optional[str] = Query(None, description=INCLUDE_HELP), ids: Optional[str] = Query(None, description=IDS_HELP), total: bool = Query(False, description=TOTAL_HELP), db: AsyncSession = Depends(get_async_session)):
+    projection = crud_users.projection(fields=fields, include=include)
+    if ids is not None:
+        users_page, missing = await crud_users.aget_many(
+            db, parse_ids(ids), with_relations=True, projection=None if projection.is_default else projection
+        )
+        set_missing_ids_header(response, missing)
+        if not projection.is_default:
+            return sparse_response(request, response, List[projection.response_model], users_page)
+        etag = page_etag(request, crud_users.page_version_of(users_page))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+        return render(List[UserRead], users_page, response)
+    if total:
+        set_total_count_header(response, *await crud_users.atotal_count(db))
+    if not projection.is_default:
+        users_page = await crud_users.aget_multi_projected(db, projection, skip=skip, limit=limit, cursor=cursor)
+        set_pagination_headers(request, response, crud_users.next_cursor(users_page, limit))
+        return sparse_response(request, response, List[projection.response_model], users_page)
+    if has_validator(request):
+        etag = page_etag(request, await crud_users.apage_version(db, skip=skip, limit=limit, cursor=cursor))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    users_page = await crud_users.aget_multi(db=db, skip=skip, limit=limit, cursor=cursor)
+    set_pagination_headers(request, response, crud_users.next_cursor(users_page, limit))
+    set_etag(response, page_etag(request, crud_users.page_version_of(users_page)))
+    return render(List[UserRead], users_page, response)
 
 @users.get("/{user_id}", response_model=UserRead)
-def read_user(user_id: int, db: Session = Depends(get_session)):
-    user = crud_users.get(db=db, id=user_id)
+async def read_user(user_id: int, request: Request, response: Response, fields: Optional[str] = Query(None, description=FIELDS_HELP), include: Optional[str] = Query(None, description=INCLUDE_HELP), db: AsyncSession = Depends(get_async_session)):
+    projection = crud_users.projection(fields=fields, include=include)
+    if not projection.is_default:
+        user = await crud_users.aget_projected(db, user_id, projection)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with ID {user_id} not found")
+        return sparse_response(request, response, projection.response_model, user)
+    if has_validator(request):
+        version = await crud_users.aversion(db, user_id)
+        if version is not None and etag_matches(request, make_etag(*version)):
+            return not_modified(make_etag(*version))
+    user = await crud_users.aget(db=db, id=user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with ID {user_id} not found")
-    return user
+    set_etag(response, make_etag(*crud_users.version_of(user)))
+    return render(UserRead, user, response)
 
 @users.put("/{user_id}", response_model=UserRead)
-def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_session)):
-    db_user = crud_users.get(db=db, id=user_id)
+async def update_user(user_id: int, user: UserUpdate, db: AsyncSession = Depends(get_async_session)):
+    db_user = await crud_users.aget_for_write(db=db, id=user_id)
     if not db_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with ID {user_id} not found")
     try:
-        updated_user = crud_users.update(db=db, db_obj=db_user, obj_in=user)
+        updated_user = await crud_users.aupdate(db=db, db_obj=db_user, obj_in=user)
         return updated_user
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -40,10 +83,11 @@ def update_user(user_id: int, user: UserUpdate, db: Session = Depends(get_sessio
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to update user: {str(e)}")
 
 @users.delete("/{user_id}", response_model=UserRead)
-def delete_user(user_id: int, db: Session = Depends(get_session)):
-    user = crud_users.get(db=db, id=user_id)
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_session)):
+    user = await crud_users.aget_for_write(db=db, id=user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with ID {user_id} not found")
-    if user.borrowed_books:
+    has_borrows = await crud_users.aexists(db, User.id == user_id, User.borrowed_books.any())
+    if has_borrows:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Cannot delete user with ID {user_id} because they have active borrows")
-    return crud_users.remove(db=db, id=user_id)
\ No newline at end of file
+    return await crud_users.aremove(db=db, id=user_id)
\ No newline at end of file
@@ -3,20 +3,81 @@ import os
 import logging
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import List
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-logger.info(f"DATABASE_URL environment variable: {os.getenv('DATABASE_URL')}")
-
 class Settings(BaseSettings):
     DATABASE_URL: str  # Береться з environment або .env
     ENVIRONMENT: str = "development"
+
+    # Старт воркера: full - create_all, індекс пошуку та перевірка всіх таблиць;
+    # fast - один запит до alembic_version замість інтроспекції схеми
+    STARTUP_MODE: str = "full"  # full | fast
+    SCHEMA_REVISION: str = ""  # очікувана ревізія для fast; порожньо - остання в migrations/versions
     LOG_LEVEL: str = "info"
     MAX_BORROWS_PER_USER: int = 5
     BORROW_DURATION_DAYS: int = 14
     OVERDUE_FINE_RATE: float = 0.5
+    OVERDUE_SWEEP_ENABLED: bool = True
+    OVERDUE_SWEEP_INTERVAL_SECONDS: int = 300
+    OVERDUE_SWEEP_BATCH_SIZE: int = 500
+    OVERDUE_SWEEP_LEASE_SECONDS: int = 3600  # найдовший очікуваний прогін; стільки діє оренда, поки він триває
     LOG_DIR: str = "logs"
+    LOG_FORMAT: str = "json"  # json | text
+    LOG_QUEUE_SIZE: int = 10000  # записи понад цю кількість відкидаються й рахуються
+
+    # Connection pool (per worker process)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_TIMEOUT_MS: int = 0  # 0 - без обмеження
+    DB_ECHO: bool = False
+
+    # Репліки для читання (app/db/replicas.py): URL через кому; порожньо - усе йде на основну базу
+    DATABASE_REPLICA_URLS: str = ""
+    REPLICA_MAX_LAG_SECONDS: float = 5.0  # репліка, що відстає більше, не отримує читань
+    REPLICA_CHECK_INTERVAL_SECONDS: float = 5.0
+    READ_YOUR_WRITES_SECONDS: float = 10.0  # найдовше після запису, поки читання клієнта чекають на репліку
+
+    # In-process cache of the CRUD layer (per worker process)
+    CACHE_ENABLED: bool = True
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_TTL_SECONDS: float = 30.0
+
+    # Серіалізація відповідей: default | adapter | trusted (див. app/utils/serialization.py)
+    RESPONSE_SERIALIZATION: str = "default"
+
+    # Метрики запитів (/metrics); знімки воркерів пишуться в METRICS_DIR
+    METRICS_ENABLED: bool = True
+    # Окремий каталог для кожного розгортання (спільний для його воркерів); порожньо - /metrics лише
+    # того воркера, що відповідає
+    METRICS_DIR: str = ""
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 5.0
+
+    # Облік SQL-запитів на запит (app/utils/query_accounting.py)
+    QUERY_DEBUG_HEADERS: bool = False  # X-Query-Count / X-Query-Time-Ms / X-Query-Max-Repeat
+    QUERY_REPEAT_THRESHOLD: int = 5  # з якої кількості повторів однієї форми запиту писати про N+1
+    QUERY_BUDGET_DEFAULT: int = 10  # для маршрутів, яких немає в QUERY_BUDGETS
+    QUERY_BUDGET_STRICT: bool = False  # True - перевищення бюджету дає 500 (для тестів)
+
+    # X-Total-Count (total=true на списках): понад цю кількість рядків - оцінка планувальника
+    # (PostgreSQL reltuples) замість COUNT(*) по всій таблиці; 0 - завжди точний підрахунок
+    TOTAL_COUNT_ESTIMATE_THRESHOLD: int = 100000
+
+    # /internal/* (пул, кеш, репліки, задачі, перебудова статистики) лише із заголовком X-Internal-Token;
+    # порожньо - ці маршрути вимкнено (404)
+    INTERNAL_API_TOKEN: str = ""
+
+    # Потоковий експорт (/api/books/export, /api/borrowed-books/export): рядків на одну вибірку курсора
+    EXPORT_CHUNK_SIZE: int = 1000
+
+    @property
+    def replica_urls(self) -> List[str]:
+        return [url.strip() for url in self.DATABASE_REPLICA_URLS.split(",") if url.strip()]
 
     class Config:
         env_file = os.path.join(os.path.dirname(__file__), "../../../../../.env")  # Шлях до .env
@@ -27,7 +88,7 @@ class Settings(BaseSettings):
 def get_settings() -> Settings:
     try:
         settings = Settings()
-        logger.info(f"Loaded settings: DATABASE_URL={settings.DATABASE_URL}, ENVIRONMENT={settings.ENVIRONMENT}")
+        logger.info(f"Loaded settings: ENVIRONMENT={settings.ENVIRONMENT}, STARTUP_MODE={settings.STARTUP_MODE}")
         return settings
     except Exception as e:
         logger.error(f"Error loading settings: {e}")
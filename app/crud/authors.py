@@ -1,9 +1,15 @@
-from app.models.authors import Author, AuthorCreate, AuthorUpdate
+from app.models.authors import Author, AuthorCreate, AuthorRead, AuthorUpdate
+from app.models.books import BookRead
 from app.crud.base import CRUDBase
+from app.crud.books import crud_books
+from app.services.book_search import get_book_search
 from datetime import datetime, timezone
 
 
 class CRUDAuthor(CRUDBase[Author, AuthorCreate, AuthorUpdate]):
+    read_model = AuthorRead
+    expansions = {"books": BookRead}
+
     def update(self, db, *, db_obj, obj_in):
         update_data = obj_in.model_dump(exclude_unset=True)
 
@@ -12,8 +18,12 @@ class CRUDAuthor(CRUDBase[Author, AuthorCreate, AuthorUpdate]):
 
         db_obj.updated_at = datetime.now(timezone.utc)
         db.add(db_obj)
+        # Author names are part of the book search documents and cached book payloads
+        book_ids = get_book_search(db).index_author_books(db, db_obj.id)
         db.commit()
         db.refresh(db_obj)
+        self.cache.invalidate([db_obj.id])
+        crud_books.cache.invalidate(book_ids)
 
         return db_obj
 
@@ -1,8 +1,20 @@
 # app/crud/base.py
-from typing import Generic, List, Optional, Type, TypeVar
+from datetime import datetime
+from typing import Dict, Generic, Iterable, List, Mapping, Optional, Sequence, Tuple, Type, TypeVar
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
+from sqlalchemy import Select, and_, func, or_, text
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
+
+from app.config import get_settings
+from app.crud.cache import EntityCache, from_replica, restore
+from app.crud.loader import BatchLoader
+from app.crud.relations import LinkManager
+from app.utils.fieldsets import Projection
+from app.utils.pagination import decode_cursor, encode_cursor
 
 ModelType = TypeVar("ModelType", bound=SQLModel)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -10,25 +22,190 @@ UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
-    def __init__(self, model: Type[ModelType]):
+    # Relationships stored along with a cached entity
+    cached_relations: Sequence[str] = ()
+    # Linked rows embedded in the read model, as (relationship, LinkManager); part of the version
+    versioned_links: Sequence[Tuple[str, LinkManager]] = ()
+    # The model responses are built from, and the relationships a client may expand
+    # with include= (name -> read model of the items); default_includes are the ones
+    # the read model embeds when neither fields= nor include= is given
+    read_model: Optional[Type[BaseModel]] = None
+    expansions: Mapping[str, Type[BaseModel]] = {}
+    default_includes: Sequence[str] = ()
+
+    def __init__(self, model: Type[ModelType], sort_key: str = "id"):
         self.model = model
+        self.sort_key = sort_key
+        self.cache = EntityCache(model, self.cached_relations)
 
     def get(self, db: Session, id: int) -> Optional[ModelType]:
-        return db.get(self.model, id)
+        if not self.cache.enabled:
+            return db.get(self.model, id)
+        cached = self.cache.get_entity(id)
+        if cached is not None:
+            return restore(db, self.model, cached)
+        generation = self.cache.generation
+        db_obj = db.get(self.model, id)
+        # A replica may not have replayed the latest write; its rows are served but not cached
+        if db_obj is not None and not from_replica(db):
+            self.cache.set_entity(id, db_obj, generation)
+        return db_obj
+
+    def get_for_write(self, db: Session, id: int) -> Optional[ModelType]:
+        # Updates and deletes start from the row as it is now, never from a cache snapshot
+        return db.get(self.model, id, populate_existing=True)
+
+    def get_many(
+            self,
+            db: Session,
+            ids: Iterable[int],
+            *,
+            with_relations: bool = False,
+            projection: Optional[Projection] = None
+    ) -> Tuple[List[ModelType], List[int]]:
+        """
+        The entities with the given IDs in the order asked for (repeats dropped) and the
+        IDs that do not exist. Whatever the cache does not have comes from one IN query;
+        with_relations also loads what the read model embeds, a projection only its columns.
+        """
+        ids = list(dict.fromkeys(ids))
+        found: Dict[int, ModelType] = {}
+        use_cache = self.cache.enabled and projection is None
+        for id in ids:
+            if use_cache:
+                cached = self.cache.get_entity(id)
+                if cached is not None:
+                    found[id] = restore(db, self.model, cached)
+            elif not with_relations and projection is None:
+                # Already loaded in this session, as get() would answer from the identity map
+                loaded = db.identity_map.get(db.identity_key(self.model, id))
+                if loaded is not None:
+                    found[id] = loaded
+
+        rest = [id for id in ids if id not in found]
+        populate = use_cache and not from_replica(db)
+        generation = self.cache.generation
+        if rest:
+            if projection is not None:
+                statement = self.projected_statement(projection)
+            else:
+                # Cached entities carry their relations; loading them here keeps snapshots from lazy loading
+                relations = dict.fromkeys([*(self.cached_relations if use_cache else ()),
+                                           *(self.default_includes if with_relations else ())])
+                statement = select(self.model).options(
+                    *(selectinload(getattr(self.model, name)) for name in relations)
+                )
+            for obj in db.exec(statement.where(self.model.id.in_(rest))):
+                found[obj.id] = obj
+                if populate:
+                    self.cache.set_entity(obj.id, obj, generation)
+        return [found[id] for id in ids if id in found], [id for id in ids if id not in found]
 
     def get_multi(
-            self, db: Session, *, skip: int = 0, limit: int = 100
+            self, db: Session, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
     ) -> List[ModelType]:
-        statement = select(self.model).offset(skip).limit(limit)
+        statement = self.paginate(select(self.model), skip=skip, limit=limit, cursor=cursor)
         results = db.exec(statement)
         return [item for item in results]
 
+    def paginate(
+            self, statement: SelectOfScalar, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
+    ) -> SelectOfScalar:
+        """
+        Order by (sort_key, id) and page either by keyset cursor or by offset
+        """
+        sort_column = getattr(self.model, self.sort_key)
+        id_column = self.model.id
+        if self.sort_key == "id":
+            statement = statement.order_by(id_column)
+        else:
+            statement = statement.order_by(sort_column, id_column)
+
+        if cursor:
+            sort_value, last_id = decode_cursor(cursor)
+            if self.sort_key == "id":
+                statement = statement.where(id_column > last_id)
+            else:
+                statement = statement.where(or_(
+                    sort_column > sort_value,
+                    and_(sort_column == sort_value, id_column > last_id)
+                ))
+            return statement.limit(limit)
+
+        return statement.offset(skip).limit(limit)
+
+    # Existence checks and counts: one EXISTS / COUNT query instead of loading rows or collections,
+    # e.g. crud_authors.exists(db, Author.id == id, Author.books.any())
+
+    def exists_statement(self, *criteria) -> Select:
+        return select(select(self.model.id).where(*criteria).exists())
+
+    def count_statement(self, *criteria, statement: Optional[SelectOfScalar] = None) -> Select:
+        """
+        Rows of the table matching the criteria, or rows a listing statement returns before paging
+        """
+        if statement is None:
+            return select(func.count()).select_from(self.model).where(*criteria)
+        return select(func.count()).select_from(
+            statement.with_only_columns(self.model.id).where(*criteria).order_by(None).subquery()
+        )
+
+    def exists(self, db: Session, *criteria) -> bool:
+        return bool(db.exec(self.exists_statement(*criteria)).one())
+
+    def count(self, db: Session, *criteria) -> int:
+        return db.exec(self.count_statement(*criteria)).one()
+
+    def estimated_count(self, db: Session) -> Optional[int]:
+        """
+        Planner's row estimate of the whole table (PostgreSQL reltuples, kept by
+        ANALYZE/autovacuum); None where there is none or the table was never analyzed
+        """
+        if db.get_bind().dialect.name != "postgresql":
+            return None
+        estimate = db.exec(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+            params={"name": db.get_bind().dialect.identifier_preparer.quote(self.model.__tablename__)}
+        ).scalar()
+        return estimate if estimate is not None and estimate >= 0 else None
+
+    def total_count(self, db: Session, statement: Optional[SelectOfScalar] = None) -> Tuple[int, bool]:
+        """
+        (total, estimated) for X-Total-Count. Exact COUNT of the listing statement, or of the
+        table when there is none; an unfiltered table above TOTAL_COUNT_ESTIMATE_THRESHOLD
+        rows gets the planner's estimate instead of a full scan.
+        """
+        threshold = get_settings().TOTAL_COUNT_ESTIMATE_THRESHOLD
+        if statement is None and threshold > 0:
+            estimate = self.estimated_count(db)
+            if estimate is not None and estimate >= threshold:
+                return estimate, True
+        return db.exec(self.count_statement(statement=statement)).one(), False
+
+    def next_cursor(self, items: Sequence[ModelType], limit: int) -> Optional[str]:
+        # A short page means there is nothing after it
+        if not items or len(items) < limit:
+            return None
+        last = items[-1]
+        return encode_cursor(getattr(last, self.sort_key), last.id)
+
+    def projection(self, *, fields: Optional[str] = None, include: Optional[str] = None) -> Projection:
+        # Pagination reads the sort key of the last row, so it is always loaded
+        return Projection.parse(
+            self.model, self.read_model, self.expansions, self.default_includes, fields, include,
+            required=(self.sort_key,)
+        )
+
+    def projected_statement(self, projection: Projection) -> SelectOfScalar:
+        return select(self.model).options(*projection.load_options())
+
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
         db_obj = self.model(**obj_in_data)
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        self.cache.invalidate([db_obj.id])
         return db_obj
 
     def update(
@@ -41,13 +218,136 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             if field in update_data:
                 setattr(db_obj, field, update_data[field])
 
+        db_obj.updated_at = datetime.utcnow()
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        self.cache.invalidate([db_obj.id])
         return db_obj
 
     def remove(self, db: Session, *, id: int) -> ModelType:
         obj = db.get(self.model, id)
         db.delete(obj)
         db.commit()
-        return obj
\ No newline at end of file
+        self.cache.invalidate([id])
+        return obj
+
+    # Version fingerprints for ETags. The SQL forms let a conditional GET be answered
+    # without loading the rows; the *_of forms compute the same values from loaded objects.
+
+    def version_statement(self, id: int) -> Select:
+        columns = [self.model.id, self.model.updated_at]
+        columns += [links.newest_target_change([id]) for _, links in self.versioned_links]
+        return select(*columns).where(self.model.id == id)
+
+    def page_version_statement(self, statement: SelectOfScalar) -> Select:
+        """
+        The rows of a (paginated) listing query in page order: id, updated_at and the newest
+        change of each versioned link, the same for every row
+        """
+        columns = [self.model.id, self.model.updated_at]
+        if self.sort_key not in ("id", "updated_at"):
+            columns.append(getattr(self.model, self.sort_key))
+        page = statement.with_only_columns(*columns).cte("page")
+        columns = [page.c.id, page.c.updated_at]
+        columns += [links.newest_target_change(select(page.c.id)) for _, links in self.versioned_links]
+        order = [page.c.id] if self.sort_key == "id" else [page.c[self.sort_key], page.c.id]
+        return select(*columns).select_from(page).order_by(*order)
+
+    def page_version_from_rows(self, rows: Sequence[tuple]) -> tuple:
+        # Row count, newest updated_at, link changes and the ids in order: a row leaving or joining the page changes it
+        values = [len(rows), max((row[1] for row in rows), default=None)]
+        values += [rows[0][2 + i] if rows else None for i in range(len(self.versioned_links))]
+        values.append(tuple(row[0] for row in rows))
+        return tuple(values)
+
+    def version_of(self, obj: ModelType) -> tuple:
+        values = [obj.id, obj.updated_at]
+        for name, _ in self.versioned_links:
+            values.append(max((target.updated_at for target in getattr(obj, name)), default=None))
+        return tuple(values)
+
+    def page_version_of(self, items: Sequence[ModelType]) -> tuple:
+        values = [len(items), max((item.updated_at for item in items), default=None)]
+        for name, _ in self.versioned_links:
+            values.append(max(
+                (target.updated_at for item in items for target in getattr(item, name)), default=None
+            ))
+        values.append(tuple(item.id for item in items))
+        return tuple(values)
+
+    # Async variants for handlers running on the event loop
+
+    async def aversion(self, db: AsyncSession, id: int) -> Optional[tuple]:
+        row = (await db.exec(self.version_statement(id))).first()
+        return tuple(row) if row is not None else None
+
+    async def apage_version(
+            self, db: AsyncSession, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
+    ) -> tuple:
+        statement = self.paginate(select(self.model), skip=skip, limit=limit, cursor=cursor)
+        return self.page_version_from_rows((await db.exec(self.page_version_statement(statement))).all())
+
+    async def aexists(self, db: AsyncSession, *criteria) -> bool:
+        return bool((await db.exec(self.exists_statement(*criteria))).one())
+
+    async def acount(self, db: AsyncSession, *criteria) -> int:
+        return (await db.exec(self.count_statement(*criteria))).one()
+
+    async def atotal_count(self, db: AsyncSession) -> Tuple[int, bool]:
+        # The estimate depends on the dialect of the bound connection
+        return await db.run_sync(lambda session: self.total_count(session))
+
+    async def aget(self, db: AsyncSession, id: int) -> Optional[ModelType]:
+        # Loads started together in one request share a single query (app/crud/loader.py)
+        return await BatchLoader.of(self, db).load(id)
+
+    async def aget_for_write(self, db: AsyncSession, id: int) -> Optional[ModelType]:
+        return await db.get(self.model, id, populate_existing=True)
+
+    async def aget_many(
+            self,
+            db: AsyncSession,
+            ids: Iterable[int],
+            *,
+            with_relations: bool = False,
+            projection: Optional[Projection] = None
+    ) -> Tuple[List[ModelType], List[int]]:
+        # Synchronous underneath: restoring cached entities and snapshotting new ones touch relationships
+        return await db.run_sync(lambda session: self.get_many(
+            session, ids, with_relations=with_relations, projection=projection
+        ))
+
+    async def aget_multi(
+            self, db: AsyncSession, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
+    ) -> List[ModelType]:
+        statement = self.paginate(select(self.model), skip=skip, limit=limit, cursor=cursor)
+        results = await db.exec(statement)
+        return list(results.all())
+
+    async def aget_projected(self, db: AsyncSession, id: int, projection: Projection) -> Optional[ModelType]:
+        statement = self.projected_statement(projection).where(self.model.id == id)
+        return (await db.exec(statement)).first()
+
+    async def aget_multi_projected(
+            self,
+            db: AsyncSession,
+            projection: Projection,
+            *,
+            skip: int = 0,
+            limit: int = 100,
+            cursor: Optional[str] = None
+    ) -> List[ModelType]:
+        statement = self.paginate(self.projected_statement(projection), skip=skip, limit=limit, cursor=cursor)
+        return list((await db.exec(statement)).all())
+
+    async def acreate(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
+        return await db.run_sync(lambda session: self.create(session, obj_in=obj_in))
+
+    async def aupdate(
+            self, db: AsyncSession, *, db_obj: ModelType, obj_in: UpdateSchemaType
+    ) -> ModelType:
+        return await db.run_sync(lambda session: self.update(session, db_obj=db_obj, obj_in=obj_in))
+
+    async def aremove(self, db: AsyncSession, *, id: int) -> ModelType:
+        return await db.run_sync(lambda session: self.remove(session, id=id))
@@ -1,18 +1,41 @@
 # app/crud/books.py
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
 from datetime import datetime
 
-from app.models.books import Book, BookCreate, BookUpdate
-from app.models.authors import Author
-from app.models.categories import Category
+from app.models.books import Book, BookCreate, BookRead, BookUpdate, BookUpsert
+from app.models.authors import Author, AuthorRead
+from app.models.categories import Category, CategoryRead
 from app.models.links import BookAuthorLink, BookCategoryLink
 from app.crud.base import CRUDBase
-from app.utils.exceptions import LibraryException
+from app.crud.cache import from_replica, restore
+from app.crud.relations import LinkManager
+from app.services.book_search import get_book_search
+from app.services.stats_service import stats_service
+from app.utils.exceptions import DuplicateEntityException, EntityNotFoundException, LibraryException
+from app.utils.fieldsets import Projection
 
 class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
+    author_links = LinkManager(BookAuthorLink, "book_id", Author, "author_id")
+    category_links = LinkManager(BookCategoryLink, "book_id", Category, "category_id")
+    # Everything BookRead needs, so a cache hit costs no queries
+    cached_relations = ("authors", "categories")
+    versioned_links = (("authors", author_links), ("categories", category_links))
+    read_model = BookRead
+    expansions = {"authors": AuthorRead, "categories": CategoryRead}
+    default_includes = ("authors", "categories")
+
+    def get_by_isbn(self, db: Session, *, isbn: str) -> Optional[Book]:
+        # Lookup by the unique index on book.isbn
+        statement = select(Book).where(Book.isbn == isbn)
+        return db.exec(statement).first()
+
     def create_with_relations(
             self, db: Session, *, obj_in: BookCreate
     ) -> Book:
@@ -20,69 +43,139 @@ class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
             title=obj_in.title,
             publication_year=obj_in.publication_year,
             isbn=obj_in.isbn,
-            quantity=obj_in.quantity
+            quantity=obj_in.quantity,
+            available_copies=obj_in.quantity
         )
         db.add(book)
-        db.flush()
+        try:
+            db.flush()
+        except IntegrityError as e:
+            self._raise_for_isbn_conflict(db, obj_in.isbn, e)
 
-        self._set_authors(db, book, obj_in.author_ids)
+        self.author_links.sync(db, book.id, obj_in.author_ids, is_new=True)
 
         if hasattr(obj_in, 'category_ids') and obj_in.category_ids is not None:
-            self._set_categories(db, book, obj_in.category_ids)
+            self.category_links.sync(db, book.id, obj_in.category_ids, is_new=True)
 
+        get_book_search(db).index_books(db, [book.id], is_new=True)
+        stats_service.record_copies(db, book.quantity)
         db.commit()
-        db.refresh(book)
+        # No refresh: callers read the book back with its relations, and that read loads the
+        # timestamps as stored (their defaults here are timezone-aware, the columns are not)
+        db.expire(book, ["created_at", "updated_at"])
+        self.cache.invalidate([book.id])
         return book
 
     def update_with_relations(
             self, db: Session, *, db_obj: Book, obj_in: BookUpdate
     ) -> Book:
         update_data = obj_in.model_dump(exclude_unset=True)
-        simple_fields = ["title", "publication_year", "isbn", "quantity"]
+        if update_data.get("quantity") is not None:
+            self.set_quantity(db, db_obj.id, update_data["quantity"])
+
+        simple_fields = ["title", "publication_year", "isbn"]
         for field in simple_fields:
             if field in update_data:
                 setattr(db_obj, field, update_data[field])
 
         db_obj.updated_at = datetime.utcnow()
+        # A taken ISBN is reported by the unique index, before any link is touched
+        book_id, isbn = db_obj.id, db_obj.isbn
+        try:
+            db.flush()
+        except IntegrityError as e:
+            self._raise_for_isbn_conflict(db, isbn, e, book_id=book_id)
 
         if obj_in.author_ids is not None:
-            self._set_authors(db, db_obj, obj_in.author_ids)
+            self.author_links.sync(db, db_obj.id, obj_in.author_ids)
+            db.expire(db_obj, ["authors"])
 
         if hasattr(obj_in, 'category_ids') and obj_in.category_ids is not None:
-            self._set_categories(db, db_obj, obj_in.category_ids)
+            self.category_links.sync(db, db_obj.id, obj_in.category_ids)
+            db.expire(db_obj, ["categories"])
 
         db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
+        get_book_search(db).index_books(db, [db_obj.id])
+        try:
+            db.commit()
+        except IntegrityError as e:
+            self._raise_for_isbn_conflict(db, isbn, e, book_id=book_id)
+        # Changed in SQL by set_quantity(); the caller's read of the book loads them again
+        db.expire(db_obj, ["quantity", "available_copies"])
+        # Covers link changes as well, they are part of the cached payload
+        self.cache.invalidate([db_obj.id])
         return db_obj
 
-    def _set_authors(self, db: Session, book: Book, author_ids: List[int]) -> None:
-        statement = select(BookAuthorLink).where(BookAuthorLink.book_id == book.id)
-        existing_links = db.exec(statement).all()
-        for link in existing_links:
-            db.delete(link)
-        db.flush()
-
-        for author_id in author_ids:
-            author = db.get(Author, author_id)
-            if not author:
-                raise LibraryException(f"Author with ID {author_id} not found")
-            link = BookAuthorLink(book_id=book.id, author_id=author_id)
-            db.add(link)
-
-    def _set_categories(self, db: Session, book: Book, category_ids: List[int]) -> None:
-        statement = select(BookCategoryLink).where(BookCategoryLink.book_id == book.id)
-        existing_links = db.exec(statement).all()
-        for link in existing_links:
-            db.delete(link)
-        db.flush()
-
-        for category_id in category_ids:
-            category = db.get(Category, category_id)
-            if not category:
-                raise LibraryException(f"Category with ID {category_id} not found")
-            link = BookCategoryLink(book_id=book.id, category_id=category_id)
-            db.add(link)
+    def set_quantity(self, db: Session, book_id: int, quantity: int) -> None:
+        """
+        Change the number of copies of a book. The copies on loan stay on loan, so
+        available_copies moves by the same amount, computed in SQL from the stored row;
+        the update only applies while the stored quantity is the one the change was
+        computed from, so concurrent checkouts, returns and updates are not lost.
+        Fewer copies than are on loan is refused.
+        """
+        # The row the caller loaded for this write (identity map), otherwise read now
+        book = db.get(Book, book_id)
+        locked = False
+        while book is not None:
+            old_quantity = book.quantity
+            delta = quantity - Book.quantity
+            changed = db.execute(
+                update(Book)
+                .where(Book.id == book_id, Book.quantity == old_quantity, Book.available_copies + delta >= 0)
+                .values(quantity=quantity, available_copies=Book.available_copies + delta)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if changed:
+                stats_service.record_copies(db, quantity - old_quantity)
+                return
+            if locked:
+                break
+            # Changed since it was read, or too many copies on loan: look again, locked on PostgreSQL until commit
+            book = db.exec(
+                select(Book).where(Book.id == book_id).with_for_update().execution_options(populate_existing=True)
+            ).first()
+            locked = True
+            if book is not None and book.quantity == old_quantity:
+                # Not changed since, so the copies on loan are what stopped it
+                break
+        db.rollback()
+        if book is None:
+            raise EntityNotFoundException(f"Book with ID {book_id} not found")
+        raise LibraryException(
+            f"Book with ID {book_id} has more copies on loan than the new quantity of {quantity}"
+        )
+
+    def upsert_by_isbn(
+            self, db: Session, *, isbn: str, obj_in: BookUpsert
+    ) -> Tuple[Book, bool]:
+        """
+        Create the book with the given ISBN or replace the existing one: every field and
+        both link lists, a missing one taking its default (one copy, no authors or categories).
+        Returns the book and whether it was created.
+        """
+        data = obj_in.model_dump()
+        db_obj = self.get_by_isbn(db, isbn=isbn)
+        if db_obj is None:
+            try:
+                return self.create_with_relations(db, obj_in=BookCreate(isbn=isbn, **data)), True
+            except DuplicateEntityException:
+                # A concurrent writer inserted the same ISBN first
+                db_obj = self.get_by_isbn(db, isbn=isbn)
+                if db_obj is None:
+                    raise
+        return self.update_with_relations(db, db_obj=db_obj, obj_in=BookUpdate(**data)), False
+
+    def _raise_for_isbn_conflict(
+            self, db: Session, isbn: str, error: IntegrityError, *, book_id: Optional[int] = None
+    ) -> None:
+        # Distinguish the unique index on isbn from other constraint failures; the book being
+        # updated (book_id) holding the ISBN is not a conflict
+        db.rollback()
+        existing = self.get_by_isbn(db, isbn=isbn)
+        if existing is not None and existing.id != book_id:
+            raise DuplicateEntityException(f"Book with ISBN {isbn} already exists")
+        raise error
 
     def search_books(
             self,
@@ -92,15 +185,51 @@ class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
             author_id: Optional[int] = None,
             category_id: Optional[int] = None,
             skip: int = 0,
-            limit: int = 100
+            limit: int = 100,
+            cursor: Optional[str] = None,
+            projection: Optional[Projection] = None
     ) -> List[Book]:
-        query = select(Book).options(
+        params = (title.lower() if title else None, author_id, category_id, skip, limit, cursor)
+        if self.cache.enabled:
+            # Cached books are complete, so they serve any projection
+            cached = self.cache.get_query(params)
+            if cached is not None:
+                return [restore(db, Book, item) for item in cached]
+        generation = self.cache.generation
+
+        query = self.search_statement(db, title=title, author_id=author_id, category_id=category_id)
+        if projection is not None and not projection.is_default:
+            query = self.paginate(query.options(*projection.load_options()), skip=skip, limit=limit, cursor=cursor)
+            # Partial rows are not cached
+            return db.exec(query).all()
+        query = query.options(
             selectinload(Book.authors),
             selectinload(Book.categories)
         )
+        query = self.paginate(query, skip=skip, limit=limit, cursor=cursor)
+        results = db.exec(query).all()
+        # Додаткова перевірка: переконаємося, що зв’язки завантажені
+        for book in results:
+            if book.authors is None:
+                book.authors = []
+            if book.categories is None:
+                book.categories = []
+        if self.cache.enabled and not from_replica(db):
+            self.cache.set_query(params, results, generation)
+        return results
+
+    def search_statement(
+            self,
+            db: Session,
+            *,
+            title: Optional[str] = None,
+            author_id: Optional[int] = None,
+            category_id: Optional[int] = None
+    ) -> SelectOfScalar:
+        query = select(Book)
 
         if title:
-            query = query.where(Book.title.ilike(f"%{title}%"))
+            query = query.where(get_book_search(db).title_filter(db, title))
 
         if author_id:
             query = query.join(BookAuthorLink).where(BookAuthorLink.author_id == author_id)
@@ -108,14 +237,170 @@ class CRUDBook(CRUDBase[Book, BookCreate, BookUpdate]):
         if category_id:
             query = query.join(BookCategoryLink).where(BookCategoryLink.category_id == category_id)
 
-        query = query.offset(skip).limit(limit)
-        results = db.exec(query).all()
-        # Додаткова перевірка: переконаємося, що зв’язки завантажені
-        for book in results:
-            if book.authors is None:
-                book.authors = []
-            if book.categories is None:
-                book.categories = []
-        return results
+        return query
+
+    def search_version(
+            self,
+            db: Session,
+            *,
+            title: Optional[str] = None,
+            author_id: Optional[int] = None,
+            category_id: Optional[int] = None,
+            skip: int = 0,
+            limit: int = 100,
+            cursor: Optional[str] = None
+    ) -> tuple:
+        query = self.search_statement(db, title=title, author_id=author_id, category_id=category_id)
+        query = self.paginate(query, skip=skip, limit=limit, cursor=cursor)
+        return self.page_version_from_rows(db.exec(self.page_version_statement(query)).all())
+
+    def search_total(
+            self,
+            db: Session,
+            *,
+            title: Optional[str] = None,
+            author_id: Optional[int] = None,
+            category_id: Optional[int] = None
+    ) -> Tuple[int, bool]:
+        if not (title or author_id or category_id):
+            return self.total_count(db)
+        return self.total_count(
+            db, self.search_statement(db, title=title, author_id=author_id, category_id=category_id)
+        )
+
+    def full_text_search(
+            self, db: Session, *, q: str, skip: int = 0, limit: int = 100, projection: Optional[Projection] = None
+    ) -> List[Book]:
+        """
+        Ranked search over title, author and category names
+        """
+        book_ids = get_book_search(db).search(db, q, skip=skip, limit=limit)
+        if not book_ids:
+            return []
+        if projection is not None:
+            query = self.projected_statement(projection).where(Book.id.in_(book_ids))
+        else:
+            query = select(Book).where(Book.id.in_(book_ids)).options(
+                selectinload(Book.authors),
+                selectinload(Book.categories)
+            )
+        books = {book.id: book for book in db.exec(query)}
+        return [books[book_id] for book_id in book_ids if book_id in books]
+
+    def remove(self, db: Session, *, id: int) -> Optional[Book]:
+        """
+        Delete a book with its links and search document; None when there is no such book.
+        A book with copies on loan is refused, their borrows still count as active.
+        """
+        # The copies leave the totals as stored now, not as a copy in the session has them
+        book = db.exec(
+            select(Book).where(Book.id == id).with_for_update().execution_options(populate_existing=True)
+        ).first()
+        if book is None:
+            return None
+        # The counters are kept by every checkout and return, and the row is locked until commit
+        if book.available_copies < book.quantity:
+            db.rollback()
+            raise LibraryException(f"Cannot delete book with ID {id} because it has active borrows")
+        get_book_search(db).remove_books(db, [id])
+        stats_service.record_copies(db, -book.quantity)
+        # One DELETE per link table; db.delete() would first load both collections
+        self.author_links.clear(db, id)
+        self.category_links.clear(db, id)
+        db.execute(delete(Book).where(Book.id == id))
+        db.commit()
+        self.cache.invalidate([id])
+        return book
+
+    # Async variants; relationships are always eager-loaded since lazy IO is not allowed
+
+    async def aget_with_relations(self, db: AsyncSession, id: int) -> Optional[Book]:
+        if self.cache.enabled:
+            # Cached books carry their authors and categories
+            return await self.aget(db, id)
+        query = select(Book).where(Book.id == id).options(
+            selectinload(Book.authors),
+            selectinload(Book.categories)
+        ).execution_options(populate_existing=True)
+        results = await db.exec(query)
+        return results.first()
+
+    async def asearch_books(
+            self,
+            db: AsyncSession,
+            *,
+            title: Optional[str] = None,
+            author_id: Optional[int] = None,
+            category_id: Optional[int] = None,
+            skip: int = 0,
+            limit: int = 100,
+            cursor: Optional[str] = None,
+            projection: Optional[Projection] = None
+    ) -> List[Book]:
+        return await db.run_sync(lambda session: self.search_books(
+            session,
+            title=title,
+            author_id=author_id,
+            category_id=category_id,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            projection=projection
+        ))
+
+    async def asearch_version(
+            self,
+            db: AsyncSession,
+            *,
+            title: Optional[str] = None,
+            author_id: Optional[int] = None,
+            category_id: Optional[int] = None,
+            skip: int = 0,
+            limit: int = 100,
+            cursor: Optional[str] = None
+    ) -> tuple:
+        # The title filter needs the dialect of the bound connection
+        return await db.run_sync(lambda session: self.search_version(
+            session,
+            title=title,
+            author_id=author_id,
+            category_id=category_id,
+            skip=skip,
+            limit=limit,
+            cursor=cursor
+        ))
+
+    async def asearch_total(
+            self,
+            db: AsyncSession,
+            *,
+            title: Optional[str] = None,
+            author_id: Optional[int] = None,
+            category_id: Optional[int] = None
+    ) -> Tuple[int, bool]:
+        return await db.run_sync(lambda session: self.search_total(
+            session, title=title, author_id=author_id, category_id=category_id
+        ))
+
+    async def afull_text_search(
+            self, db: AsyncSession, *, q: str, skip: int = 0, limit: int = 100, projection: Optional[Projection] = None
+    ) -> List[Book]:
+        return await db.run_sync(
+            lambda session: self.full_text_search(session, q=q, skip=skip, limit=limit, projection=projection)
+        )
+
+    async def aget_by_isbn(self, db: AsyncSession, *, isbn: str) -> Optional[Book]:
+        results = await db.exec(select(Book).where(Book.isbn == isbn))
+        return results.first()
+
+    async def acreate_with_relations(self, db: AsyncSession, *, obj_in: BookCreate) -> Book:
+        return await db.run_sync(lambda session: self.create_with_relations(session, obj_in=obj_in))
+
+    async def aupdate_with_relations(
+            self, db: AsyncSession, *, db_obj: Book, obj_in: BookUpdate
+    ) -> Book:
+        return await db.run_sync(
+            lambda session: self.update_with_relations(session, db_obj=db_obj, obj_in=obj_in)
+        )
 
 crud_books = CRUDBook(Book)
\ No newline at end of file
@@ -10,6 +10,7 @@ class CRUDBorrowedBook(CRUDBase[BorrowedBook, BorrowedBookCreate, BorrowedBookUp
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        self.cache.invalidate([db_obj.id])
         return db_obj
 
     def update(self, db: Session, *, db_obj: BorrowedBook, obj_in: BorrowedBookUpdate) -> BorrowedBook:
@@ -20,6 +21,7 @@ class CRUDBorrowedBook(CRUDBase[BorrowedBook, BorrowedBookCreate, BorrowedBookUp
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        self.cache.invalidate([db_obj.id])
         return db_obj
 
 crud_borrowed_books = CRUDBorrowedBook(BorrowedBook)
\ No newline at end of file
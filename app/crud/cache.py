@@ -0,0 +1,231 @@
+# app/crud/cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Type
+
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session, SQLModel
+
+from app.config import get_settings
+
+
+class CacheBackend:
+    """
+    Storage interface for the CRUD cache. Values are plain snapshots (dicts/lists),
+    so a backend may keep them in-process or serialize them elsewhere.
+    """
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: Hashable) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class NullCacheBackend(CacheBackend):
+    def get(self, key: Hashable) -> Optional[Any]:
+        return None
+
+    def set(self, key: Hashable, value: Any) -> None:
+        pass
+
+    def delete(self, key: Hashable) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class LRUCacheBackend(CacheBackend):
+    """
+    Bounded in-process LRU with a per-entry TTL
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def _default_backend() -> CacheBackend:
+    settings = get_settings()
+    if not settings.CACHE_ENABLED:
+        return NullCacheBackend()
+    return LRUCacheBackend(settings.CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+
+
+_backend: CacheBackend = _default_backend()
+
+
+def get_cache_backend() -> CacheBackend:
+    return _backend
+
+
+def set_cache_backend(backend: CacheBackend) -> None:
+    """
+    Swap the backend shared by every CRUD cache
+    """
+    global _backend
+    _backend = backend
+
+
+def snapshot(obj: SQLModel, relations: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Copy the loaded column values (and the given relationships) of an ORM object
+    """
+    mapper = sa_inspect(obj).mapper
+    data = {
+        "columns": {attr.key: getattr(obj, attr.key) for attr in mapper.column_attrs},
+        "relations": {},
+    }
+    for name in relations:
+        data["relations"][name] = [snapshot(child) for child in getattr(obj, name)]
+    return data
+
+
+def restore(db: Session, model: Type[SQLModel], data: Dict[str, Any]) -> SQLModel:
+    """
+    Rebuild a snapshot as a persistent object of this session without touching the database
+    """
+    obj = _detached(model, data["columns"])
+    relationships = sa_inspect(model).relationships
+    for name, children in data["relations"].items():
+        child_model = relationships[name].mapper.class_
+        set_committed_value(obj, name, [_detached(child_model, child["columns"]) for child in children])
+    return db.merge(obj, load=False)
+
+
+def from_replica(db: Session) -> bool:
+    """
+    Whether the session reads from a replica (app/db/database.py marks their engines)
+    """
+    return bool(db.get_bind().get_execution_options().get("read_only"))
+
+
+def _detached(model: Type[SQLModel], columns: Dict[str, Any]) -> SQLModel:
+    obj = model(**columns)
+    make_transient_to_detached(obj)
+    return obj
+
+
+class EntityCache:
+    """
+    Per-model view of the cache: entities by ID and query results by normalized
+    parameters. Writes drop the entity keys and bump a generation counter that is
+    part of every query key, so stale query results can no longer be reached.
+    Readers take the generation before they query the database and store what they
+    read only if no write has bumped it since.
+    """
+
+    def __init__(self, model: Type[SQLModel], relations: Sequence[str] = ()):
+        self.namespace = model.__name__
+        self.relations = tuple(relations)
+        self._generation = 0
+        # Orders invalidations against the stores of readers that started before them
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self) -> CacheBackend:
+        return get_cache_backend()
+
+    @property
+    def enabled(self) -> bool:
+        return not isinstance(self.backend, NullCacheBackend)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get_entity(self, id: int) -> Optional[Dict[str, Any]]:
+        return self.backend.get((self.namespace, "id", id))
+
+    def set_entity(self, id: int, obj: SQLModel, generation: int) -> None:
+        # Snapshotting may load relations, so it happens outside the lock
+        self._put((self.namespace, "id", id), snapshot(obj, self.relations), generation)
+
+    def get_query(self, params: Hashable) -> Optional[List[Dict[str, Any]]]:
+        return self.backend.get((self.namespace, "query", self._generation, params))
+
+    def set_query(self, params: Hashable, objs: Iterable[SQLModel], generation: int) -> None:
+        self._put(
+            (self.namespace, "query", generation, params),
+            [snapshot(obj, self.relations) for obj in objs],
+            generation
+        )
+
+    def invalidate(self, ids: Iterable[Optional[int]] = ()) -> None:
+        with self._lock:
+            for id in ids:
+                if id is not None:
+                    self.backend.delete((self.namespace, "id", id))
+            self._generation += 1
+
+    def _put(self, key: Hashable, value: Any, generation: int) -> None:
+        with self._lock:
+            # A write since the read may have changed the rows; what was read is not stored
+            if generation == self._generation:
+                self.backend.set(key, value)
@@ -1,24 +1,46 @@
 # app/crud/categories.py
-from app.models.categories import Category, CategoryCreate, CategoryUpdate
+from app.models.categories import Category, CategoryCreate, CategoryRead, CategoryUpdate
+from app.models.books import BookRead
 from app.crud.base import CRUDBase
-import datetime
+from app.crud.books import crud_books
+from app.services.book_search import get_book_search
+from datetime import datetime, timezone
 from sqlmodel import Session
 class CRUDCategory(CRUDBase[Category, CategoryCreate, CategoryUpdate]):
+    read_model = CategoryRead
+    expansions = {"books": BookRead}
+
+    def update(self, db: Session, *, db_obj: Category, obj_in: CategoryUpdate) -> Category:
+        update_data = obj_in.model_dump(exclude_unset=True)
+        for field in update_data:
+            setattr(db_obj, field, update_data[field])
+        db_obj.updated_at = datetime.now(timezone.utc)
+        db.add(db_obj)
+        # Category names are part of the book search documents and cached book payloads
+        book_ids = get_book_search(db).index_category_books(db, db_obj.id)
+        db.commit()
+        db.refresh(db_obj)
+        self.cache.invalidate([db_obj.id])
+        crud_books.cache.invalidate(book_ids)
+        return db_obj
+
     def create_with_relations(self, db: Session, *, obj_in: CategoryCreate) -> Category:
         db_obj = Category(**obj_in.model_dump())
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        self.cache.invalidate([db_obj.id])
         return db_obj
 
     def update_with_relations(self, db: Session, *, db_obj: Category, obj_in: CategoryUpdate) -> Category:
         update_data = obj_in.model_dump(exclude_unset=True)
         for field in update_data:
             setattr(db_obj, field, update_data[field])
-        db_obj.updated_at = datetime.now(datetime.timezone.utc)
+        db_obj.updated_at = datetime.now(timezone.utc)
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        self.cache.invalidate([db_obj.id])
         return db_obj
 
 crud_categories = CRUDCategory(Category)
\ No newline at end of file
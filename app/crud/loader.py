@@ -0,0 +1,63 @@
+# app/crud/loader.py
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+if TYPE_CHECKING:
+    from app.crud.base import CRUDBase
+
+# Key of the loaders in Session.info; a session lives for one request
+_INFO_KEY = "batch_loaders"
+
+
+class BatchLoader:
+    """
+    Request-scoped DataLoader of one model. IDs asked for with load() during the same
+    turn of the event loop are fetched together by one get_many (a single IN query),
+    so handlers and services may resolve entities one at a time, or concurrently with
+    asyncio.gather, without a query per ID. Lives in the session's info dict, so it
+    shares the session's identity map and goes away with it.
+    """
+
+    def __init__(self, crud: "CRUDBase", db: AsyncSession):
+        self.crud = crud
+        self.db = db
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._scheduled = False
+
+    @classmethod
+    def of(cls, crud: "CRUDBase", db: AsyncSession) -> "BatchLoader":
+        loaders = db.info.setdefault(_INFO_KEY, {})
+        loader = loaders.get(crud.cache.namespace)
+        if loader is None:
+            loader = loaders[crud.cache.namespace] = cls(crud, db)
+        return loader
+
+    async def load(self, id: int) -> Optional[Any]:
+        future = self._pending.get(id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[id] = loop.create_future()
+            if not self._scheduled:
+                # Runs once every coroutine started in this turn has queued its IDs
+                self._scheduled = True
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return await future
+
+    async def load_many(self, ids: Sequence[int]) -> List[Optional[Any]]:
+        return list(await asyncio.gather(*(self.load(id) for id in ids)))
+
+    async def _dispatch(self) -> None:
+        batch, self._pending, self._scheduled = self._pending, {}, False
+        try:
+            found, _ = await self.crud.aget_many(self.db, list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_id = {obj.id: obj for obj in found}
+        for id, future in batch.items():
+            if not future.done():
+                future.set_result(by_id.get(id))
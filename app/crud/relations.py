@@ -0,0 +1,93 @@
+# app/crud/relations.py
+from typing import Iterable, List, Type, Union
+
+from sqlalchemy import Select, delete, func, insert
+from sqlalchemy.sql.selectable import ScalarSelect
+from sqlmodel import Session, SQLModel, select
+
+from app.utils.exceptions import EntityNotFoundException
+
+
+class LinkManager:
+    """
+    Keeps the rows of a many-to-many link table in step with a list of target IDs
+    using set-based queries: one IN lookup to validate, one read of the current
+    links, and bulk DELETE/INSERT of the difference only.
+    """
+
+    def __init__(
+            self,
+            link_model: Type[SQLModel],
+            owner_field: str,
+            target_model: Type[SQLModel],
+            target_field: str
+    ):
+        self.link_model = link_model
+        self.owner_field = owner_field
+        self.target_model = target_model
+        self.target_field = target_field
+
+    @property
+    def _owner_column(self):
+        return getattr(self.link_model, self.owner_field)
+
+    @property
+    def _target_column(self):
+        return getattr(self.link_model, self.target_field)
+
+    def validate(self, db: Session, target_ids: Iterable[int]) -> List[int]:
+        """
+        Return the de-duplicated IDs, raising once for every ID that does not exist
+        """
+        ids = list(dict.fromkeys(target_ids))
+        if not ids:
+            return ids
+        found = set(db.exec(select(self.target_model.id).where(self.target_model.id.in_(ids))))
+        missing = [target_id for target_id in ids if target_id not in found]
+        if missing:
+            name = self.target_model.__name__
+            if len(missing) == 1:
+                raise EntityNotFoundException(f"{name} with ID {missing[0]} not found")
+            raise EntityNotFoundException(
+                f"{name}s with IDs {', '.join(str(target_id) for target_id in missing)} not found"
+            )
+        return ids
+
+    def sync(self, db: Session, owner_id: int, target_ids: Iterable[int], *, is_new: bool = False) -> None:
+        desired = self.validate(db, target_ids)
+
+        current = set()
+        if not is_new:
+            current = set(db.exec(select(self._target_column).where(self._owner_column == owner_id)))
+
+        removed = current.difference(desired)
+        added = [target_id for target_id in desired if target_id not in current]
+
+        if removed:
+            db.execute(
+                delete(self.link_model)
+                .where(self._owner_column == owner_id)
+                .where(self._target_column.in_(removed))
+            )
+        if added:
+            db.execute(
+                insert(self.link_model),
+                [{self.owner_field: owner_id, self.target_field: target_id} for target_id in added]
+            )
+
+    def clear(self, db: Session, owner_id: int) -> None:
+        """
+        Drop every link of the owner in one DELETE
+        """
+        db.execute(delete(self.link_model).where(self._owner_column == owner_id))
+
+    def newest_target_change(self, owner_ids: Union[Iterable[int], Select]) -> ScalarSelect:
+        """
+        Latest updated_at among the targets linked to the given owners
+        """
+        return (
+            select(func.max(self.target_model.updated_at))
+            .join(self.link_model, self._target_column == self.target_model.id)
+            .where(self._owner_column.in_(owner_ids))
+            .scalar_subquery()
+        )
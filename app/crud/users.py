@@ -1,17 +1,22 @@
 # app/crud/users.py
-from app.models.users import User, UserCreate, UserUpdate
+from app.models.users import User, UserCreate, UserRead, UserUpdate
+from app.models.borrowed_books import BorrowedBookRead
 from app.crud.base import CRUDBase
 from datetime import datetime, timezone
 from sqlmodel import Session, select
 from sqlalchemy.exc import IntegrityError
 
 class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
+    read_model = UserRead
+    expansions = {"borrowed_books": BorrowedBookRead}
+
     def create(self, db: Session, *, obj_in: UserCreate) -> User:
         try:
             db_obj = User(**obj_in.model_dump())
             db.add(db_obj)
             db.commit()
             db.refresh(db_obj)
+            self.cache.invalidate([db_obj.id])
             return db_obj
         except IntegrityError:
             db.rollback()
@@ -33,6 +38,7 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             db.add(db_obj)
             db.commit()
             db.refresh(db_obj)
+            self.cache.invalidate([db_obj.id])
             return db_obj
         except IntegrityError:
             db.rollback()
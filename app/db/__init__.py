@@ -1,5 +1,3 @@
-import os
-from sqlmodel import create_engine
-
-DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/library_db")
-engine = create_engine(DATABASE_URL, echo=True)
\ No newline at end of file
+# app/db/__init__.py
+# Єдиний engine, налаштований через Settings (див. app/db/database.py)
+from app.db.database import async_engine, engine
@@ -0,0 +1,95 @@
+# app/db/query_stats.py
+import re
+import time
+from contextvars import ContextVar, Token
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import Engine, event
+
+
+# Expanded IN lists and multi-row VALUES differ only in their number of placeholders
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|\$\d+))+\s*\)")
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(statement: str) -> str:
+    """
+    The statement with placeholder lists collapsed, so repeated lookups of the same
+    kind count as one shape whatever their parameters
+    """
+    return _PLACEHOLDER_LIST.sub("(?)", " ".join(statement.split()))
+
+
+class QueryStats:
+    """
+    Number of statements, time spent in the database driver and statement shapes
+    for one unit of work (a request). Only touched by the task that owns it, so no locking.
+    """
+    __slots__ = ("count", "seconds", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Dict[str, int] = {}
+
+    def most_repeated(self) -> Tuple[Optional[str], int]:
+        """
+        The statement shape executed most often and how often; N+1 loads show up here
+        """
+        if not self.shapes:
+            return None, 0
+        shape = max(self.shapes, key=self.shapes.__getitem__)
+        return shape, self.shapes[shape]
+
+
+# Set by the request middlewares for the duration of a request; SQLAlchemy copies the
+# context into the greenlets of AsyncSession.run_sync, so those statements count too
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def activate(stats: QueryStats) -> Token:
+    return _current.set(stats)
+
+
+def deactivate(token: Token) -> None:
+    _current.reset(token)
+
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._query_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started_at = getattr(context, "_query_started_at", None)
+    if stats is None or started_at is None:
+        return
+    stats.count += 1
+    stats.seconds += time.perf_counter() - started_at
+    if statement is not None:
+        shape = statement_shape(statement)
+        stats.shapes[shape] = stats.shapes.get(shape, 0) + 1
+
+
+def _handle_error(exception_context):
+    # Failed statements still took database time
+    context = exception_context.execution_context
+    if context is not None:
+        _after_cursor_execute(None, None, exception_context.statement, None, context, False)
+
+
+def install(engine: Engine) -> None:
+    """
+    Attach the timing hooks to a (sync) engine; pass async_engine.sync_engine for the async one
+    """
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,229 @@
+# app/db/replicas.py
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.db.pool import pool_status
+from app.utils.logger import setup_logging
+
+logger = setup_logging()
+
+# Methods whose handlers only read and may be served by a replica
+READ_METHODS = frozenset({"GET", "HEAD"})
+# Time of the client's last write; until a replica has replayed past it, its reads stay on the primary
+READ_YOUR_WRITES_COOKIE = "library_last_write"
+
+# Seconds a replica is behind its primary. The receive/replay LSN comparison keeps an idle
+# primary (no new transactions, old replay timestamp) from looking like lag; NULL means not
+# known yet. Dialects without replication report 0, e.g. a SQLite copy standing in locally.
+_LAG_QUERIES = {
+    "postgresql": """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+        END
+    """,
+}
+_DEFAULT_LAG_QUERY = "SELECT 0"
+
+
+class Replica:
+    """
+    A read replica's engine and what the last health check found
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.name = make_url(engine.url).render_as_string(hide_password=True)
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.reads = 0
+        # A connection dropped mid-request takes the replica out until the next check passes
+        event.listen(engine.sync_engine, "handle_error", self._on_error)
+
+    def _on_error(self, context) -> None:
+        if context.is_disconnect:
+            self.mark_down(str(context.original_exception))
+
+    def mark_down(self, error: str) -> None:
+        if self.healthy:
+            logger.warning(f"Read replica {self.name} is down: {error}")
+        self.healthy = False
+        self.error = error[:500]
+
+    def caught_up_to(self) -> Optional[float]:
+        # Wall-clock time up to which the replica had replayed the primary when last checked
+        if self.checked_at is None or self.lag is None:
+            return None
+        return self.checked_at - self.lag
+
+    async def check(self, timeout: float) -> None:
+        query = text(_LAG_QUERIES.get(self.engine.dialect.name, _DEFAULT_LAG_QUERY))
+
+        async def probe() -> Optional[float]:
+            async with self.engine.connect() as conn:
+                return (await conn.execute(query)).scalar()
+
+        try:
+            lag = await asyncio.wait_for(probe(), timeout)
+        except Exception as e:
+            self.mark_down(str(e) or type(e).__name__)
+            return
+        if not self.healthy:
+            logger.info(f"Read replica {self.name} is up")
+        self.healthy = True
+        self.error = None
+        self.lag = float(lag) if lag is not None else None
+        self.checked_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": round(self.lag, 3) if self.lag is not None else None,
+            "checked_at": self.checked_at,
+            "error": self.error,
+            "reads": self.reads,
+            "pool": pool_status(self.engine.sync_engine),
+        }
+
+
+class ReplicaRouter:
+    """
+    Picks the engine of a request's session. Writes, and reads of a client whose last
+    write a replica may not have replayed yet, go to the primary; other reads go round
+    robin to the replicas that passed their last health check and lag at most max_lag
+    seconds. With no usable replica (none configured, all down or behind, or checks not
+    running) everything stays on the primary. Rows read from a replica are not put in the
+    CRUD cache, so a lagging copy never outlives the request that read it.
+    """
+
+    def __init__(
+            self,
+            primary: AsyncEngine,
+            replicas: Sequence[AsyncEngine] = (),
+            *,
+            max_lag: float = 5.0,
+            check_interval: float = 5.0,
+            read_your_writes_seconds: float = 10.0
+    ):
+        self.primary = primary
+        self.replicas: List[Replica] = [Replica(engine) for engine in replicas]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self.primary_reads = 0
+        self._next = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def pick(self, written_at: Optional[float] = None) -> Optional[Replica]:
+        """
+        The next usable replica, or None. With written_at, only one that had replayed past it.
+        """
+        now = time.time()
+        usable = []
+        for replica in self.replicas:
+            caught_up_to = replica.caught_up_to()
+            if not replica.healthy or caught_up_to is None or replica.lag > self.max_lag:
+                continue
+            # Results of a check that stopped running say nothing about the replica now
+            if now - replica.checked_at > 3 * self.check_interval:
+                continue
+            if written_at is not None and caught_up_to < written_at:
+                continue
+            usable.append(replica)
+        if not usable:
+            return None
+        self._next += 1
+        return usable[self._next % len(usable)]
+
+    def engine_for(self, method: str, cookies: Dict[str, str]) -> AsyncEngine:
+        if self.enabled and method in READ_METHODS:
+            replica = self.pick(written_at=self._last_write(cookies))
+            if replica is not None:
+                replica.reads += 1
+                return replica.engine
+        if method in READ_METHODS:
+            self.primary_reads += 1
+        return self.primary
+
+    def _last_write(self, cookies: Dict[str, str]) -> Optional[float]:
+        try:
+            written_at = float(cookies[READ_YOUR_WRITES_COOKIE])
+        except (KeyError, ValueError):
+            return None
+        # Past the window every replica within max_lag has the write
+        if time.time() - written_at > self.read_your_writes_seconds:
+            return None
+        return written_at
+
+    async def check(self) -> None:
+        await asyncio.gather(*(replica.check(timeout=self.check_interval) for replica in self.replicas))
+
+    async def start(self) -> None:
+        """
+        Check the replicas once, so reads can use them from the first request, then keep checking
+        """
+        if not self.enabled:
+            return
+        await self.check()
+        self._task = asyncio.create_task(self._loop(), name="replica-checks")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Read replica check failed")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "max_lag_seconds": self.max_lag,
+            "primary_reads": self.primary_reads,
+            "replicas": [replica.status() for replica in self.replicas],
+        }
+
+
+class ReadYourWritesMiddleware:
+    """
+    Pure ASGI middleware: a successful write sets the read-your-writes cookie with its
+    time, so the same client's next reads are not served by a replica that lags behind it
+    """
+
+    def __init__(self, app, max_age: float):
+        self.app = app
+        self.max_age = max(1, int(max_age))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = (
+                    f"{READ_YOUR_WRITES_COOKIE}={time.time():.3f}; Max-Age={self.max_age}; Path=/; "
+                    "HttpOnly; SameSite=Lax"
+                )
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
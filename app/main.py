@@ -1,20 +1,59 @@
+# Перший імпорт: відлік часу старту воркера
+from app.utils.startup import startup_profile
+
+import asyncio
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
-import time
 
-from app.utils.logger import setup_logging
-from app.api import books, authors, categories, borrowed_books
-from api.users import users
+from app.utils.logger import RequestIdMiddleware, setup_logging, shutdown_logging, start_logging
+from app.api import books, authors, categories, users, borrowed_books, internal, stats, metrics
+from app.utils.exceptions import LibraryException
+from app.config import get_settings
+from app.db.database import check_schema_version, create_db_and_tables, engine, replicas
+from app.db.replicas import ReadYourWritesMiddleware
+from app.db.migrations import head_revision
+from app.services.overdue import overdue_sweeper
+from app.services.scheduler import PeriodicJob, scheduler
+from app.utils.metrics import MetricsMiddleware, exporter, registry
+from app.utils.query_accounting import QueryAccountingMiddleware
 logger = setup_logging()
+settings = get_settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    start_time = time.time()
-    logger.info("Starting application...")
-    logger.info(f"Application started in {time.time() - start_time:.2f} seconds")
+    with startup_profile.phase("logging"):
+        start_logging()
+    logger.info(f"Starting application ({settings.STARTUP_MODE} start)...")
+    with startup_profile.phase("schema"):
+        if settings.STARTUP_MODE == "fast":
+            # Migrations own the schema; only make sure they have been applied
+            await check_schema_version(settings.SCHEMA_REVISION or head_revision())
+        else:
+            await asyncio.to_thread(create_db_and_tables)
+    with startup_profile.phase("replicas"):
+        await replicas.start()
+    with startup_profile.phase("scheduler"):
+        if settings.OVERDUE_SWEEP_ENABLED:
+            # Every worker schedules it; a database lease lets only one of them run per interval
+            scheduler.add(PeriodicJob(
+                "overdue_sweep", settings.OVERDUE_SWEEP_INTERVAL_SECONDS, overdue_sweeper.sweep,
+                lease_seconds=settings.OVERDUE_SWEEP_LEASE_SECONDS
+            ))
+        scheduler.start(engine)
+    with startup_profile.phase("metrics_exporter"):
+        exporter.start()
+    startup_profile.mark_ready()
+    app.state.startup = {"mode": settings.STARTUP_MODE, **startup_profile.as_dict()}
+    logger.info(f"Application started: {startup_profile.summary()}")
     yield
     logger.info("Shutting down application...")
+    await scheduler.stop()
+    await exporter.stop()
+    await replicas.stop()
+    # Last, so the shutdown itself is logged
+    shutdown_logging()
 
 app = FastAPI(
     title="Library API",
@@ -29,14 +68,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "Link", "X-Next-Cursor", "X-Total-Count", "X-Total-Count-Estimated", "X-Missing-Ids", "ETag", "X-Request-ID",
+        "X-Query-Count", "X-Query-Time-Ms", "X-Query-Max-Repeat"
+    ],
 )
+app.add_middleware(QueryAccountingMiddleware)
+if replicas.enabled:
+    app.add_middleware(ReadYourWritesMiddleware, max_age=settings.READ_YOUR_WRITES_SECONDS)
+if settings.METRICS_ENABLED:
+    # Added last so it is the outermost middleware and times everything below it
+    app.add_middleware(MetricsMiddleware, registry=registry)
+# Outermost, so every log record of the request carries its id
+app.add_middleware(RequestIdMiddleware)
+
+@app.exception_handler(LibraryException)
+async def library_exception_handler(request: Request, exc: LibraryException):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
 
 app.include_router(books, prefix="/api/books", tags=["books"])
 app.include_router(authors, prefix="/api/authors", tags=["authors"])
 app.include_router(categories, prefix="/api/categories", tags=["categories"])
 app.include_router(users, prefix="/api/users", tags=["users"])
 app.include_router(borrowed_books, prefix="/api/borrowed-books", tags=["borrowed-books"])
+app.include_router(stats, prefix="/api/stats", tags=["stats"])
+app.include_router(internal, prefix="/internal", tags=["internal"], include_in_schema=False)
+app.include_router(metrics, include_in_schema=False)
 
 @app.get("/", status_code=status.HTTP_200_OK)
 async def root(request: Request):
-    return {"message": "Welcome to the Library API"}
\ No newline at end of file
+    return {"message": "Welcome to the Library API"}
+
+startup_profile.mark_imported()
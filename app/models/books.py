@@ -15,6 +15,8 @@ class BookBase(SQLModel):
 
 class Book(BookBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Лічильник доступних примірників; змінюється лише умовними UPDATE (див. services/circulation.py)
+    available_copies: int = Field(default=0)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -39,8 +41,16 @@ class BookUpdate(SQLModel):
     author_ids: Optional[List[int]] = None
     category_ids: Optional[List[int]] = None
 
+class BookUpsert(SQLModel):
+    title: str
+    publication_year: int
+    quantity: int = 1
+    author_ids: List[int] = []
+    category_ids: List[int] = []
+
 class BookRead(BookBase):
     id: int
+    available_copies: int = 0
     created_at: datetime
     updated_at: datetime
     authors: List[AuthorRead] = []  # Використовуємо AuthorRead напряму
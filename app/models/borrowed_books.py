@@ -1,5 +1,6 @@
 # app/models/borrowed_books.py
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, List, Optional
+from sqlalchemy import Index, text
 from sqlmodel import Field, SQLModel, Relationship
 from datetime import datetime, timezone, timedelta
 from enum import Enum
@@ -21,8 +22,23 @@ class BorrowedBookBase(SQLModel):
     return_date: Optional[datetime] = None
     due_date: datetime = Field(default_factory=lambda: datetime.utcnow() + timedelta(days=14))
 
+# Предикат часткових індексів: лише видачі, що ще тримають примірник
+OPEN_BORROWS_PREDICATE = text("status IN ('ACTIVE', 'OVERDUE')")
+
 class BorrowedBook(BorrowedBookBase, table=True):
+    # Ті самі індекси, що й у міграції 0003 (migrations/versions)
+    __table_args__ = (
+        Index("ix_borrowedbook_book_id_status", "book_id", "status"),
+        Index("ix_borrowedbook_user_id_status", "user_id", "status"),
+        Index(
+            "ix_borrowedbook_open_status_due_date", "status", "due_date",
+            postgresql_where=OPEN_BORROWS_PREDICATE, sqlite_where=OPEN_BORROWS_PREDICATE
+        ),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
+    status: BorrowStatus = Field(default=BorrowStatus.ACTIVE)
+    # Нараховується планувальником прострочень і фіксується при поверненні
+    fine: float = Field(default=0.0)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -36,9 +52,37 @@ class BorrowedBookUpdate(SQLModel):
 
 class BorrowedBookRead(BorrowedBookBase):
     id: int
+    status: BorrowStatus
+    fine: float = 0.0
     created_at: datetime
     updated_at: datetime
     user_id: int
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+# Найбільша стопка книг в одному пакетному запиті
+MAX_BATCH_ITEMS = 50
+
+class BorrowBatchCreate(SQLModel):
+    user_id: int
+    book_ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+    borrow_date: Optional[datetime] = None
+    due_date: Optional[datetime] = None
+
+class BorrowBatchReturn(SQLModel):
+    borrow_ids: List[int] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+    return_date: Optional[datetime] = None
+
+class BorrowBatchItem(SQLModel):
+    # book_id для видачі, borrow_id для повернення
+    book_id: Optional[int] = None
+    borrow_id: Optional[int] = None
+    status_code: int
+    detail: Optional[str] = None
+    borrow: Optional[BorrowedBookRead] = None
+
+class BorrowBatchResult(SQLModel):
+    succeeded: int
+    failed: int
+    items: List[BorrowBatchItem]
@@ -0,0 +1,41 @@
+# app/models/jobs.py
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel
+
+
+class JobLease(SQLModel, table=True):
+    """
+    One row per background job; the worker holding an unexpired lease owns the current run
+    """
+    __tablename__ = "job_lease"
+
+    name: str = Field(primary_key=True)
+    owner: str
+    expires_at: datetime
+
+
+class JobRun(SQLModel, table=True):
+    __tablename__ = "job_run"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_name: str = Field(index=True)
+    owner: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+    rows_updated: int = Field(default=0)
+    batches: int = Field(default=0)
+    error: Optional[str] = None
+
+
+class JobRunRead(SQLModel):
+    id: int
+    job_name: str
+    owner: str
+    started_at: datetime
+    finished_at: Optional[datetime]
+    duration_ms: Optional[float]
+    rows_updated: int
+    batches: int
+    error: Optional[str]
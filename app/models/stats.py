@@ -0,0 +1,105 @@
+# app/models/stats.py
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+# Rollup tables maintained by app/services/stats_service.py. They hold derived data only
+# (no foreign keys) and can always be recomputed from borrowedbook with rebuild().
+
+
+class BookStats(SQLModel, table=True):
+    __tablename__ = "book_stats"
+    # Top-N reads walk this index backwards
+    __table_args__ = (Index("ix_book_stats_rank", "total_borrows", "book_id"),)
+
+    book_id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    total_borrows: int = Field(default=0)
+    active_borrows: int = Field(default=0)
+    last_borrowed_at: Optional[datetime] = None
+
+
+class CategoryStats(SQLModel, table=True):
+    __tablename__ = "category_stats"
+    # Top-N reads walk this index backwards
+    __table_args__ = (Index("ix_category_stats_rank", "total_borrows", "category_id"),)
+
+    category_id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    total_borrows: int = Field(default=0)
+    active_borrows: int = Field(default=0)
+
+
+class UserStats(SQLModel, table=True):
+    __tablename__ = "user_stats"
+    # Top-N reads walk this index backwards
+    __table_args__ = (Index("ix_user_stats_rank", "total_borrows", "user_id"),)
+
+    user_id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    total_borrows: int = Field(default=0)
+    active_borrows: int = Field(default=0)
+    returns: int = Field(default=0)
+    fines_total: float = Field(default=0.0)
+    last_borrowed_at: Optional[datetime] = None
+
+
+class LibraryStatsShard(SQLModel, table=True):
+    """
+    Library-wide counters split over a fixed number of rows so concurrent
+    checkouts do not queue on a single row lock; readers sum all shards.
+    """
+    __tablename__ = "library_stats"
+
+    shard: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    total_borrows: int = Field(default=0)
+    active_borrows: int = Field(default=0)
+    returns: int = Field(default=0)
+    fines_total: float = Field(default=0.0)
+    total_copies: int = Field(default=0)
+
+
+class BorrowCategory(SQLModel, table=True):
+    """
+    The categories the book of a borrow had at checkout, one row each. Not a rollup but
+    history: a return or removal takes the borrow back from exactly these categories,
+    whatever the book's links are by then, and rebuild() attributes borrows through them.
+    """
+    __tablename__ = "borrow_category"
+
+    borrow_id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    category_id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+
+
+class BookStatsRead(SQLModel):
+    book_id: int
+    title: str
+    total_borrows: int
+    active_borrows: int
+    last_borrowed_at: Optional[datetime]
+
+
+class CategoryStatsRead(SQLModel):
+    category_id: int
+    name: str
+    total_borrows: int
+    active_borrows: int
+
+
+class UserStatsRead(SQLModel):
+    user_id: int
+    first_name: str
+    last_name: str
+    total_borrows: int
+    active_borrows: int
+    returns: int
+    fines_total: float
+    last_borrowed_at: Optional[datetime]
+
+
+class LibraryStatsRead(SQLModel):
+    total_borrows: int
+    active_borrows: int
+    returns: int
+    fines_total: float
+    total_copies: int
+    # Share of all copies currently lent out
+    utilization: float
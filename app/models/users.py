@@ -16,6 +16,9 @@ class User(UserBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     registration_date: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = Field(default=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Кількість невернених книг; підтримується сервісом видачі
+    active_borrows: int = Field(default=0)
 
     # Relationships
     borrowed_books: List["BorrowedBook"] = Relationship(
@@ -38,6 +41,7 @@ class UserRead(UserBase):
     id: int
     registration_date: datetime
     is_active: bool
+    updated_at: datetime
 
     class Config:
         orm_mode = True
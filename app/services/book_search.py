@@ -0,0 +1,338 @@
+# app/services/book_search.py
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Union
+
+from sqlalchemy import Connection, Engine, bindparam, literal_column, select, table, text
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import Session
+
+from app.models.books import Book
+from app.utils.logger import setup_logging
+
+logger = setup_logging()
+
+# One row per book: title, author names and category names, kept in step
+# with the catalog by CRUDBook and searched through a real index.
+SEARCH_TABLE = "book_search"
+# SQLite: the words of the documents under each of their one-letter deletions, so a
+# misspelt word finds the words one edit away through the index. Only ever added to.
+TERMS_TABLE = "book_search_terms"
+# Shorter words are left to the trigram match, one edit away from too many others
+MIN_CORRECTED_LENGTH = 4
+# Indexes of the search schema on catalog tables
+SEARCH_INDEXES = frozenset({"ix_book_title_trgm"})
+
+_DOCUMENT_SELECT = """
+SELECT b.id, b.title,
+       coalesce((SELECT {agg}(a.first_name || ' ' || a.last_name, ' ')
+                 FROM book_author_link l JOIN author a ON a.id = l.author_id
+                 WHERE l.book_id = b.id), ''),
+       coalesce((SELECT {agg}(c.name, ' ')
+                 FROM book_category_link l JOIN category c ON c.id = l.category_id
+                 WHERE l.book_id = b.id), '')
+FROM book b
+"""
+
+
+class BookSearchBackend:
+    """
+    Ranked, typo-tolerant book search over title, author and category names
+    """
+    aggregate = "string_agg"
+    key_column = "book_id"
+
+    def __init__(self):
+        self._ready: Set[int] = set()
+
+    def ensure_schema(self, engine: Engine) -> None:
+        """
+        Create the search table and indexes once per engine and backfill missing books.
+        Runs at startup (create_db_and_tables) and from the seed tool, never while serving
+        a request; migration 0004 does the same for databases managed by Alembic.
+        """
+        if id(engine) in self._ready:
+            return
+        with engine.begin() as conn:
+            for statement in self.schema_statements():
+                conn.execute(text(statement))
+            conn.execute(text(
+                f"INSERT INTO {SEARCH_TABLE} ({self.key_column}, title, authors, categories) "
+                + _DOCUMENT_SELECT.format(agg=self.aggregate)
+                + f"WHERE NOT EXISTS (SELECT 1 FROM {SEARCH_TABLE} s WHERE s.{self.key_column} = b.id)"
+            ))
+            self.backfill(conn)
+        self._ready.add(id(engine))
+        logger.info("Book search index ready (%s)", engine.dialect.name)
+
+    def backfill(self, conn: Connection) -> None:
+        """
+        Whatever else the backend derives from the documents, after missing ones were added
+        """
+
+    def index_books(self, db: Session, book_ids: Iterable[int], *, is_new: bool = False) -> None:
+        """
+        Rebuild the search documents of the given books inside the current transaction;
+        is_new books have no document to replace yet
+        """
+        ids = list(set(book_ids))
+        if not ids:
+            return
+        db.flush()
+        if not is_new:
+            self.remove_books(db, ids)
+        statement = text(
+            f"INSERT INTO {SEARCH_TABLE} ({self.key_column}, title, authors, categories) "
+            + _DOCUMENT_SELECT.format(agg=self.aggregate)
+            + "WHERE b.id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        db.execute(statement, {"ids": ids})
+
+    def index_author_books(self, db: Session, author_id: int) -> List[int]:
+        rows = db.execute(
+            text("SELECT book_id FROM book_author_link WHERE author_id = :id"), {"id": author_id}
+        )
+        book_ids = [row[0] for row in rows]
+        self.index_books(db, book_ids)
+        return book_ids
+
+    def index_category_books(self, db: Session, category_id: int) -> List[int]:
+        rows = db.execute(
+            text("SELECT book_id FROM book_category_link WHERE category_id = :id"), {"id": category_id}
+        )
+        book_ids = [row[0] for row in rows]
+        self.index_books(db, book_ids)
+        return book_ids
+
+    def remove_books(self, db: Session, book_ids: Iterable[int]) -> None:
+        ids = list(book_ids)
+        if not ids:
+            return
+        statement = text(
+            f"DELETE FROM {SEARCH_TABLE} WHERE {self.key_column} IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        db.execute(statement, {"ids": ids})
+
+    def schema_statements(self) -> List[str]:
+        raise NotImplementedError
+
+    def search(self, db: Session, q: str, *, skip: int = 0, limit: int = 100) -> List[int]:
+        """
+        Return matching book IDs, best match first
+        """
+        raise NotImplementedError
+
+    def title_filter(self, db: Session, title: str) -> ColumnElement[bool]:
+        """
+        Index-backed replacement for Book.title ILIKE '%title%'
+        """
+        return Book.title.ilike(f"%{title}%")
+
+
+class PostgresBookSearch(BookSearchBackend):
+    """
+    tsvector ranking plus pg_trgm word similarity for typos
+    """
+
+    def schema_statements(self) -> List[str]:
+        return [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            f"""
+            CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+                book_id integer PRIMARY KEY REFERENCES book(id) ON DELETE CASCADE,
+                title text NOT NULL DEFAULT '',
+                authors text NOT NULL DEFAULT '',
+                categories text NOT NULL DEFAULT '',
+                body text GENERATED ALWAYS AS (title || ' ' || authors || ' ' || categories) STORED,
+                document tsvector GENERATED ALWAYS AS (
+                    setweight(to_tsvector('simple', title), 'A') ||
+                    setweight(to_tsvector('simple', authors), 'B') ||
+                    setweight(to_tsvector('simple', categories), 'C')
+                ) STORED
+            )
+            """,
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING gin (document)",
+            f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_body_trgm ON {SEARCH_TABLE} USING gin (body gin_trgm_ops)",
+            # Serves the plain title filter of search_books
+            "CREATE INDEX IF NOT EXISTS ix_book_title_trgm ON book USING gin (title gin_trgm_ops)",
+        ]
+
+    def search(self, db: Session, q: str, *, skip: int = 0, limit: int = 100) -> List[int]:
+        statement = text(f"""
+            SELECT s.book_id
+            FROM {SEARCH_TABLE} s, websearch_to_tsquery('simple', :q) query
+            WHERE s.document @@ query OR :q <% s.body
+            ORDER BY ts_rank_cd(s.document, query) + word_similarity(:q, s.body) DESC, s.book_id
+            LIMIT :limit OFFSET :skip
+        """)
+        rows = db.execute(statement, {"q": q, "limit": limit, "skip": skip})
+        return [row[0] for row in rows]
+
+
+def include_name(name: Optional[str], type_: str, parent_names: Dict[str, Optional[str]]) -> bool:
+    """
+    Autogenerate filter (migrations/env.py). The search schema is built here and by
+    migration 0004, not from the models, so autogenerate must not offer to drop it:
+    the search table, the tables FTS5 keeps behind it and the title index.
+    """
+    if type_ == "table":
+        return not (name or "").startswith(SEARCH_TABLE)
+    if type_ == "index":
+        return name not in SEARCH_INDEXES
+    return True
+
+
+def words(value: str) -> List[str]:
+    return re.findall(r"\w+", value.lower())
+
+
+def deletions(word: str) -> Set[str]:
+    """
+    The word and every string one deleted letter away from it. Two words within one
+    insertion, deletion, substitution or transposition of each other share one of these.
+    """
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    # Optimal string alignment distance of at most 1
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        return len(diff) == 1 or (
+            len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+        )
+    shorter, longer = sorted((a, b), key=len)
+    return any(longer[:i] + longer[i + 1:] == shorter for i in range(len(longer)))
+
+
+class SQLiteBookSearch(BookSearchBackend):
+    """
+    FTS5 trigram index for local and test runs. Long words with a typo still share
+    most trigrams; a word one edit away from a catalog word (Dnue for Dune) is also
+    searched as that word, found through the deletions in TERMS_TABLE.
+    """
+    aggregate = "group_concat"
+    key_column = "rowid"
+
+    def schema_statements(self) -> List[str]:
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            "USING fts5(title, authors, categories, tokenize='trigram')",
+            f"CREATE TABLE IF NOT EXISTS {TERMS_TABLE} "
+            "(variant TEXT NOT NULL, term TEXT NOT NULL, PRIMARY KEY (variant, term)) WITHOUT ROWID",
+        ]
+
+    def backfill(self, conn: Connection) -> None:
+        # The vocabulary of a search table built before it existed
+        if conn.execute(text(f"SELECT 1 FROM {TERMS_TABLE} LIMIT 1")).first() is None:
+            self._add_terms(conn, conn.execute(text(f"SELECT title, authors, categories FROM {SEARCH_TABLE}")))
+
+    def index_books(self, db: Session, book_ids: Iterable[int], *, is_new: bool = False) -> None:
+        ids = list(set(book_ids))
+        super().index_books(db, ids, is_new=is_new)
+        if ids:
+            documents = db.execute(text(
+                f"SELECT title, authors, categories FROM {SEARCH_TABLE} WHERE rowid IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)), {"ids": ids})
+            self._add_terms(db, documents)
+
+    def _add_terms(self, db: Union[Session, Connection], documents: Iterable[Sequence[str]]) -> None:
+        terms = {
+            word for document in documents for field in document
+            for word in words(field) if len(word) >= MIN_CORRECTED_LENGTH
+        }
+        rows = [{"variant": variant, "term": term} for term in terms for variant in deletions(term)]
+        if rows:
+            db.execute(text(f"INSERT OR IGNORE INTO {TERMS_TABLE} (variant, term) VALUES (:variant, :term)"), rows)
+
+    def corrections(self, db: Session, terms: Sequence[str]) -> List[str]:
+        """
+        Catalog words one edit away from the given words, other than the words themselves
+        """
+        terms = [term for term in terms if len(term) >= MIN_CORRECTED_LENGTH]
+        if not terms:
+            return []
+        variants = set().union(*(deletions(term) for term in terms))
+        rows = db.execute(text(
+            f"SELECT DISTINCT term FROM {TERMS_TABLE} WHERE variant IN :variants"
+        ).bindparams(bindparam("variants", expanding=True)), {"variants": sorted(variants)})
+        return sorted(
+            row[0] for row in rows
+            if row[0] not in terms and any(within_one_edit(row[0], term) for term in terms)
+        )
+
+    def _match_query(self, terms: Sequence[str], corrections: Sequence[str] = ()) -> str:
+        trigrams = []
+        for term in terms:
+            trigrams.extend(term[i:i + 3] for i in range(len(term) - 2))
+        # A quoted word matches its trigrams in sequence
+        phrases = [f'"{trigram}"' for trigram in dict.fromkeys(trigrams)] + [f'"{word}"' for word in corrections]
+        return " OR ".join(phrases)
+
+    def search(self, db: Session, q: str, *, skip: int = 0, limit: int = 100) -> List[int]:
+        terms = words(q)
+        match = self._match_query(terms, self.corrections(db, terms))
+        params = {"limit": limit, "skip": skip}
+        if match:
+            # bm25 weights: title, authors, categories
+            statement = text(f"""
+                SELECT rowid FROM {SEARCH_TABLE}
+                WHERE {SEARCH_TABLE} MATCH :match
+                ORDER BY bm25({SEARCH_TABLE}, 10.0, 5.0, 2.0), rowid
+                LIMIT :limit OFFSET :skip
+            """)
+            params["match"] = match
+        else:
+            # Terms shorter than a trigram cannot use the index
+            statement = text(f"""
+                SELECT rowid FROM {SEARCH_TABLE}
+                WHERE title LIKE :pattern OR authors LIKE :pattern OR categories LIKE :pattern
+                ORDER BY rowid
+                LIMIT :limit OFFSET :skip
+            """)
+            params["pattern"] = f"%{q}%"
+        return [row[0] for row in db.execute(statement, params)]
+
+    def title_filter(self, db: Session, title: str) -> ColumnElement[bool]:
+        matches = (
+            select(literal_column("rowid"))
+            .select_from(table(SEARCH_TABLE))
+            .where(literal_column("title").like(f"%{title}%"))
+        )
+        return Book.id.in_(matches)
+
+
+class _FallbackBookSearch(BookSearchBackend):
+    """
+    Unindexed search for dialects without a search index
+    """
+
+    def ensure_schema(self, engine: Engine) -> None:
+        pass
+
+    def index_books(self, db: Session, book_ids: Iterable[int], *, is_new: bool = False) -> None:
+        pass
+
+    def remove_books(self, db: Session, book_ids: Iterable[int]) -> None:
+        pass
+
+    def search(self, db: Session, q: str, *, skip: int = 0, limit: int = 100) -> List[int]:
+        statement = (
+            select(Book.id).where(Book.title.ilike(f"%{q}%"))
+            .order_by(Book.id).offset(skip).limit(limit)
+        )
+        return list(db.exec(statement))
+
+
+_backends = {
+    "postgresql": PostgresBookSearch(),
+    "sqlite": SQLiteBookSearch(),
+}
+_fallback = _FallbackBookSearch()
+
+
+def get_book_search(db: Session) -> BookSearchBackend:
+    return _backends.get(db.get_bind().dialect.name, _fallback)
@@ -0,0 +1,433 @@
+# app/services/circulation.py
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import status
+from sqlalchemy import DateTime, Integer, bindparam, case, cast, delete, extract, func, insert, literal, update
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import Session, select
+
+from app.config import get_settings
+from app.crud.books import crud_books
+from app.crud.borrowed_books import crud_borrowed_books
+from app.crud.users import crud_users
+from app.models.books import Book
+from app.models.borrowed_books import (
+    BorrowBatchItem,
+    BorrowBatchResult,
+    BorrowedBook,
+    BorrowedBookRead,
+    BorrowStatus,
+)
+from app.models.users import User
+from app.services.stats_service import stats_service
+from app.utils.exceptions import (
+    BookNotAvailableException,
+    EntityNotFoundException,
+    LibraryException,
+    UserBorrowLimitException,
+)
+from app.utils.logger import setup_logging
+
+logger = setup_logging()
+settings = get_settings()
+
+# Borrows that still hold a copy
+OPEN_STATUSES = (BorrowStatus.ACTIVE, BorrowStatus.OVERDUE)
+
+# The statuses are rendered into the SQL instead of bound: the planner can only use the
+# partial index over open borrows when it sees the same constants as its predicate
+IS_OPEN = BorrowedBook.status.in_(bindparam(
+    "open_statuses", list(OPEN_STATUSES), expanding=True, literal_execute=True,
+    type_=BorrowedBook.__table__.c.status.type
+))
+
+# A batch checkout that loses a race for a copy re-reads the counters and tries again
+BATCH_ATTEMPTS = 3
+
+
+def fine_as_of(db: Session, as_of: datetime) -> ColumnElement[float]:
+    """
+    SQL expression for the fine of a borrow at the given moment: whole days past
+    due_date times OVERDUE_FINE_RATE. Only meaningful where due_date < as_of.
+    """
+    moment = literal(as_of, DateTime())
+    if db.get_bind().dialect.name == "postgresql":
+        days = func.floor(extract("epoch", moment - BorrowedBook.due_date) / 86400)
+    else:
+        # SQLite keeps timestamps as text
+        days = cast(func.julianday(moment) - func.julianday(BorrowedBook.due_date), Integer)
+    return days * settings.OVERDUE_FINE_RATE
+
+
+class CirculationService:
+    """
+    Borrow/return engine. A copy is reserved with a single conditional UPDATE on
+    book.available_copies and the user's active_borrows counter is bumped the same
+    way, so concurrent checkouts can neither oversell a title nor exceed
+    MAX_BORROWS_PER_USER. Both counters change in the same transaction as the
+    borrow row.
+    """
+
+    def checkout(
+            self,
+            db: Session,
+            *,
+            book_id: int,
+            user_id: int,
+            borrow_date: Optional[datetime] = None,
+            due_date: Optional[datetime] = None
+    ) -> BorrowedBook:
+        borrow_date = borrow_date or datetime.utcnow()
+        due_date = due_date or borrow_date + timedelta(days=settings.BORROW_DURATION_DAYS)
+
+        # updated_at moves with the counter, available_copies is part of the book's ETag
+        reserved = db.execute(
+            update(Book)
+            .where(Book.id == book_id, Book.available_copies > 0)
+            .values(available_copies=Book.available_copies - 1, updated_at=datetime.utcnow())
+            .returning(Book.id)
+        ).first()
+        if reserved is None:
+            db.rollback()
+            if db.get(Book, book_id) is None:
+                raise EntityNotFoundException(f"Book with ID {book_id} not found")
+            raise BookNotAvailableException(f"Book with ID {book_id} is not available")
+
+        admitted = db.execute(
+            update(User)
+            .where(User.id == user_id, User.active_borrows < settings.MAX_BORROWS_PER_USER)
+            .values(active_borrows=User.active_borrows + 1)
+            .returning(User.id)
+        ).first()
+        if admitted is None:
+            # Releases the reserved copy as well
+            db.rollback()
+            if db.get(User, user_id) is None:
+                raise EntityNotFoundException(f"User with ID {user_id} not found")
+            raise UserBorrowLimitException(
+                f"User has reached the maximum borrow limit of {settings.MAX_BORROWS_PER_USER}"
+            )
+
+        borrow = BorrowedBook(
+            book_id=book_id,
+            user_id=user_id,
+            borrow_date=borrow_date,
+            due_date=due_date,
+            status=BorrowStatus.ACTIVE
+        )
+        db.add(borrow)
+        # The id keys the categories recorded for the borrow
+        db.flush()
+        stats_service.record_checkout(
+            db, borrow_id=borrow.id, book_id=book_id, user_id=user_id, borrowed_at=borrow_date
+        )
+        db.commit()
+        db.refresh(borrow)
+        self._invalidate(borrow_id=borrow.id, book_id=book_id, user_id=user_id)
+        return borrow
+
+    def return_borrow(
+            self, db: Session, *, borrow_id: int, return_date: Optional[datetime] = None
+    ) -> BorrowedBook:
+        return_date = return_date or datetime.utcnow()
+
+        closed = db.execute(
+            update(BorrowedBook)
+            .where(BorrowedBook.id == borrow_id, IS_OPEN)
+            .values(
+                status=BorrowStatus.RETURNED,
+                return_date=return_date,
+                updated_at=return_date,
+                fine=case((BorrowedBook.due_date < return_date, fine_as_of(db, return_date)), else_=0.0)
+            )
+            .returning(BorrowedBook.book_id, BorrowedBook.user_id, BorrowedBook.due_date, BorrowedBook.fine)
+        ).first()
+        if closed is None:
+            db.rollback()
+            if db.get(BorrowedBook, borrow_id) is None:
+                raise EntityNotFoundException(f"Borrow record with ID {borrow_id} not found")
+            raise LibraryException("Book has already been returned")
+
+        self._release(db, book_id=closed.book_id, user_id=closed.user_id)
+        stats_service.record_return(
+            db, borrow_id=borrow_id, book_id=closed.book_id, user_id=closed.user_id, fine=closed.fine
+        )
+
+        if closed.fine:
+            days_overdue = (return_date - closed.due_date).days
+            logger.info(f"Book returned {days_overdue} days late. Fine: {closed.fine}")
+
+        db.commit()
+        self._invalidate(borrow_id=borrow_id, book_id=closed.book_id, user_id=closed.user_id)
+        # The fine is computed in SQL; reload rather than trust a copy in the identity map
+        return db.get(BorrowedBook, borrow_id, populate_existing=True)
+
+    def remove(self, db: Session, *, borrow_id: int) -> None:
+        """
+        Delete a borrow record, giving the copy back if it was still out
+        """
+        deleted = db.execute(
+            delete(BorrowedBook)
+            .where(BorrowedBook.id == borrow_id)
+            .returning(BorrowedBook.book_id, BorrowedBook.user_id, BorrowedBook.status, BorrowedBook.fine)
+        ).first()
+        if deleted is None:
+            db.rollback()
+            raise EntityNotFoundException(
+                f"Borrow record with ID {borrow_id} not found", status_code=status.HTTP_404_NOT_FOUND
+            )
+        was_open = deleted.status in OPEN_STATUSES
+        if was_open:
+            self._release(db, book_id=deleted.book_id, user_id=deleted.user_id)
+        stats_service.record_removal(
+            db,
+            borrow_id=borrow_id,
+            book_id=deleted.book_id,
+            user_id=deleted.user_id,
+            was_open=was_open,
+            fine=deleted.fine
+        )
+        db.commit()
+        self._invalidate(borrow_id=borrow_id, book_id=deleted.book_id, user_id=deleted.user_id)
+
+    def checkout_batch(
+            self,
+            db: Session,
+            *,
+            user_id: int,
+            book_ids: List[int],
+            borrow_date: Optional[datetime] = None,
+            due_date: Optional[datetime] = None
+    ) -> BorrowBatchResult:
+        """
+        Check out a stack of books for one user in one transaction. Books are taken in
+        the order given while the title has a copy left and the user is under
+        MAX_BORROWS_PER_USER; the others are reported per item. A book listed twice
+        asks for two copies. Rows are locked in checkout()'s order, books then the user.
+        """
+        borrow_date = borrow_date or datetime.utcnow()
+        due_date = due_date or borrow_date + timedelta(days=settings.BORROW_DURATION_DAYS)
+        for _ in range(BATCH_ATTEMPTS):
+            result = self._try_checkout_batch(
+                db, user_id=user_id, book_ids=book_ids, borrow_date=borrow_date, due_date=due_date
+            )
+            if result is not None:
+                return result
+        raise LibraryException(
+            "Book availability changed during the batch, please retry", status_code=status.HTTP_409_CONFLICT
+        )
+
+    def _try_checkout_batch(
+            self, db: Session, *, user_id: int, book_ids: List[int], borrow_date: datetime, due_date: datetime
+    ) -> Optional[BorrowBatchResult]:
+        """
+        One attempt of checkout_batch; None when the counters changed under it
+        """
+        available = dict(db.execute(
+            select(Book.id, Book.available_copies)
+            .where(Book.id.in_(set(book_ids)))
+            .order_by(Book.id)
+            .with_for_update()
+        ).all())
+        active_borrows = db.execute(
+            select(User.active_borrows).where(User.id == user_id).with_for_update()
+        ).scalar()
+        if active_borrows is None:
+            db.rollback()
+            raise EntityNotFoundException(f"User with ID {user_id} not found", status_code=status.HTTP_404_NOT_FOUND)
+
+        slots = settings.MAX_BORROWS_PER_USER - active_borrows
+        reserved: Counter = Counter()
+        items = []
+        for book_id in book_ids:
+            if book_id not in available:
+                error = EntityNotFoundException(
+                    f"Book with ID {book_id} not found", status_code=status.HTTP_404_NOT_FOUND
+                )
+            elif available[book_id] <= reserved[book_id]:
+                error = BookNotAvailableException(f"Book with ID {book_id} is not available")
+            elif sum(reserved.values()) >= slots:
+                error = UserBorrowLimitException(
+                    f"User has reached the maximum borrow limit of {settings.MAX_BORROWS_PER_USER}"
+                )
+            else:
+                reserved[book_id] += 1
+                items.append(BorrowBatchItem(book_id=book_id, status_code=status.HTTP_201_CREATED))
+                continue
+            items.append(BorrowBatchItem(book_id=book_id, status_code=error.status_code, detail=error.detail))
+
+        if not reserved:
+            db.rollback()
+            return BorrowBatchResult(succeeded=0, failed=len(items), items=items)
+
+        # The conditions repeat the checks above: SQLite takes no row locks, so a
+        # concurrent checkout in between makes the attempt start over instead of overselling
+        taken = sum(reserved.values())
+        copies = case(dict(reserved), value=Book.id)
+        reserved_books = db.execute(
+            update(Book)
+            .where(Book.id.in_(reserved), Book.available_copies >= copies)
+            .values(available_copies=Book.available_copies - copies, updated_at=datetime.utcnow())
+            .returning(Book.id)
+        ).all()
+        admitted = db.execute(
+            update(User)
+            .where(User.id == user_id, User.active_borrows + taken <= settings.MAX_BORROWS_PER_USER)
+            .values(active_borrows=User.active_borrows + taken)
+            .returning(User.id)
+        ).first()
+        if len(reserved_books) != len(reserved) or admitted is None:
+            db.rollback()
+            return None
+
+        # One multi-row INSERT; rows differ only in book_id, so they are matched back by it
+        now = datetime.now(timezone.utc)
+        checked_out = [item.book_id for item in items if item.status_code == status.HTTP_201_CREATED]
+        borrows = db.scalars(
+            insert(BorrowedBook)
+            .values([
+                {
+                    "book_id": book_id,
+                    "user_id": user_id,
+                    "borrow_date": borrow_date,
+                    "due_date": due_date,
+                    "status": BorrowStatus.ACTIVE,
+                    "fine": 0.0,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for book_id in checked_out
+            ])
+            .returning(BorrowedBook)
+        ).all()
+        stats_service.record_checkouts(
+            db, user_id=user_id, borrows=[(borrow.id, borrow.book_id) for borrow in borrows], borrowed_at=borrow_date
+        )
+        # Serialized before the commit: a sync session would otherwise reload every row on access
+        created: Dict[int, List[BorrowedBookRead]] = {}
+        for borrow in borrows:
+            created.setdefault(borrow.book_id, []).append(BorrowedBookRead.model_validate(borrow))
+        db.commit()
+        self._invalidate_many(
+            borrow_ids=[borrow.id for borrow in borrows], book_ids=reserved, user_ids=[user_id]
+        )
+
+        for item in items:
+            if item.status_code == status.HTTP_201_CREATED:
+                item.borrow = created[item.book_id].pop(0)
+        return BorrowBatchResult(succeeded=len(borrows), failed=len(items) - len(borrows), items=items)
+
+    def return_batch(
+            self, db: Session, *, borrow_ids: List[int], return_date: Optional[datetime] = None
+    ) -> BorrowBatchResult:
+        """
+        Return many borrows, of any users, in one transaction: one UPDATE ... RETURNING
+        closes every open borrow, the copies and user counters are released per book
+        and per user. Borrows that are unknown or already returned are reported per item.
+        """
+        return_date = return_date or datetime.utcnow()
+
+        # The fines are computed in SQL; RETURNING the rows also refreshes the identity map
+        closed = {
+            borrow.id: borrow
+            for borrow in db.scalars(
+                update(BorrowedBook)
+                .where(BorrowedBook.id.in_(set(borrow_ids)), IS_OPEN)
+                .values(
+                    status=BorrowStatus.RETURNED,
+                    return_date=return_date,
+                    updated_at=return_date,
+                    fine=case((BorrowedBook.due_date < return_date, fine_as_of(db, return_date)), else_=0.0)
+                )
+                .returning(BorrowedBook)
+                .execution_options(populate_existing=True)
+            )
+        }
+        unknown = set(borrow_ids) - closed.keys()
+        if unknown:
+            unknown -= set(db.execute(select(BorrowedBook.id).where(BorrowedBook.id.in_(unknown))).scalars())
+
+        returned = {}
+        if closed:
+            books = Counter(row.book_id for row in closed.values())
+            users = Counter(row.user_id for row in closed.values())
+            self._release_many(db, books=books, users=users)
+            stats_service.record_returns(
+                db, [(row.id, row.book_id, row.user_id, row.fine) for row in closed.values()]
+            )
+            for row in closed.values():
+                if row.fine:
+                    days_overdue = (return_date - row.due_date).days
+                    logger.info(f"Book returned {days_overdue} days late. Fine: {row.fine}")
+
+            returned = {borrow.id: BorrowedBookRead.model_validate(borrow) for borrow in closed.values()}
+            db.commit()
+            self._invalidate_many(borrow_ids=closed, book_ids=books, user_ids=users)
+        else:
+            db.rollback()
+
+        items = []
+        for borrow_id in borrow_ids:
+            if borrow_id in returned:
+                items.append(BorrowBatchItem(
+                    borrow_id=borrow_id, status_code=status.HTTP_200_OK, borrow=returned.pop(borrow_id)
+                ))
+            elif borrow_id in unknown:
+                items.append(BorrowBatchItem(
+                    borrow_id=borrow_id,
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Borrow record with ID {borrow_id} not found"
+                ))
+            else:
+                # Returned before, or listed twice in this batch
+                items.append(BorrowBatchItem(
+                    borrow_id=borrow_id,
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Book has already been returned"
+                ))
+        return BorrowBatchResult(succeeded=len(closed), failed=len(items) - len(closed), items=items)
+
+    def _release(self, db: Session, *, book_id: int, user_id: int) -> None:
+        db.execute(
+            update(Book)
+            .where(Book.id == book_id)
+            .values(available_copies=Book.available_copies + 1, updated_at=datetime.utcnow())
+        )
+        db.execute(
+            update(User)
+            .where(User.id == user_id, User.active_borrows > 0)
+            .values(active_borrows=User.active_borrows - 1)
+        )
+
+    def _release_many(self, db: Session, *, books: Counter, users: Counter) -> None:
+        """
+        _release for many borrows: one UPDATE per table, counts per book and per user
+        """
+        copies = case(dict(books), value=Book.id)
+        db.execute(
+            update(Book)
+            .where(Book.id.in_(books))
+            .values(available_copies=Book.available_copies + copies, updated_at=datetime.utcnow())
+        )
+        released = case(dict(users), value=User.id)
+        db.execute(
+            update(User)
+            .where(User.id.in_(users), User.active_borrows > 0)
+            .values(active_borrows=case(
+                (User.active_borrows < released, 0), else_=User.active_borrows - released
+            ))
+        )
+
+    def _invalidate(self, *, borrow_id: int, book_id: int, user_id: int) -> None:
+        self._invalidate_many(borrow_ids=[borrow_id], book_ids=[book_id], user_ids=[user_id])
+
+    def _invalidate_many(self, *, borrow_ids: Iterable[int], book_ids: Iterable[int], user_ids: Iterable[int]) -> None:
+        # The counters are changed in SQL, behind the CRUD layer's back
+        crud_borrowed_books.cache.invalidate(borrow_ids)
+        crud_books.cache.invalidate(book_ids)
+        crud_users.cache.invalidate(user_ids)
+
+
+circulation = CirculationService()
@@ -0,0 +1,231 @@
+# app/services/export.py
+import csv
+import io
+import json
+import time
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import DateTime, Enum as SAEnum, Select, or_, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.config import get_settings
+from app.models.authors import Author
+from app.models.books import Book
+from app.models.borrowed_books import BorrowedBook
+from app.models.categories import Category
+from app.models.links import BookAuthorLink, BookCategoryLink
+from app.utils.logger import setup_logging
+from app.utils.serialization import orjson
+
+logger = setup_logging()
+settings = get_settings()
+
+# Media type of every export format
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+BOOK_COLUMNS = (
+    Book.id, Book.title, Book.isbn, Book.publication_year, Book.quantity, Book.available_copies,
+    Book.created_at, Book.updated_at,
+)
+BORROW_COLUMNS = (
+    BorrowedBook.id, BorrowedBook.book_id, BorrowedBook.user_id, BorrowedBook.status, BorrowedBook.borrow_date,
+    BorrowedBook.due_date, BorrowedBook.return_date, BorrowedBook.fine, BorrowedBook.created_at,
+    BorrowedBook.updated_at,
+)
+
+
+def _as_utc_naive(value: datetime) -> datetime:
+    # Timestamps are stored as naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _ndjson(records: List[Dict[str, Any]]) -> bytes:
+    if orjson is not None:
+        return b"".join(orjson.dumps(record) + b"\n" for record in records)
+    return "".join(
+        json.dumps(record, default=_json_default, ensure_ascii=False) + "\n" for record in records
+    ).encode("utf-8")
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _enum_value(value: Optional[Enum]) -> Any:
+    return value.value if value is not None else None
+
+
+def _joined(values: List[Any]) -> str:
+    # Ids and names of the linked rows, e.g. "1;2"
+    return ";".join(str(value) for value in values)
+
+
+def _csv_converters(statement: Select, header: Sequence[str]) -> List[Optional[Callable]]:
+    """
+    One converter per CSV column, chosen once from the column types instead of per value
+    """
+    types = {column.key: column.type for column in statement.selected_columns}
+    converters: List[Optional[Callable]] = []
+    for name in header:
+        column_type = types.get(name)
+        if column_type is None:
+            converters.append(_joined)
+        elif isinstance(column_type, SAEnum):
+            converters.append(_enum_value)
+        elif isinstance(column_type, DateTime):
+            converters.append(_iso)
+        else:
+            converters.append(None)
+    return converters
+
+
+def _csv(
+        header: Sequence[str], converters: Sequence[Optional[Callable]], records: List[Dict[str, Any]],
+        with_header: bool
+) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if with_header:
+        writer.writerow(header)
+    columns = list(zip(header, converters))
+    writer.writerows(
+        [record[name] if convert is None else convert(record[name]) for name, convert in columns]
+        for record in records
+    )
+    return buffer.getvalue().encode("utf-8")
+
+
+class ExportService:
+    """
+    Streams the catalog and the borrow history as NDJSON or CSV. Rows are read from one
+    server-side cursor (yield_per) a chunk at a time and each chunk is encoded and sent
+    before the next is fetched; the authors and categories of a chunk of books come
+    from one query each. Memory is bounded by the chunk size, not the export size.
+    """
+
+    def __init__(self, chunk_size: Optional[int] = None):
+        self.chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+
+    def books_statement(self, *, updated_since: Optional[datetime] = None) -> Select:
+        statement = select(*BOOK_COLUMNS).order_by(Book.id)
+        if updated_since is not None:
+            since = _as_utc_naive(updated_since)
+            # Renaming an author or a category changes the exported book as well
+            statement = statement.where(or_(
+                Book.updated_at >= since,
+                Book.id.in_(
+                    select(BookAuthorLink.book_id).join(Author, Author.id == BookAuthorLink.author_id)
+                    .where(Author.updated_at >= since)
+                ),
+                Book.id.in_(
+                    select(BookCategoryLink.book_id).join(Category, Category.id == BookCategoryLink.category_id)
+                    .where(Category.updated_at >= since)
+                ),
+            ))
+        return statement
+
+    def borrows_statement(self, *, updated_since: Optional[datetime] = None) -> Select:
+        statement = select(*BORROW_COLUMNS).order_by(BorrowedBook.id)
+        if updated_since is not None:
+            statement = statement.where(BorrowedBook.updated_at >= _as_utc_naive(updated_since))
+        return statement
+
+    def stream_books(
+            self, engine: AsyncEngine, *, fmt: str = "ndjson", updated_since: Optional[datetime] = None
+    ) -> AsyncIterator[bytes]:
+        header = [column.key for column in BOOK_COLUMNS] + ["author_ids", "authors", "category_ids", "categories"]
+        return self._stream(
+            engine, "books", self.books_statement(updated_since=updated_since), fmt, header,
+            self._with_relations if fmt == "ndjson" else self._with_relation_labels
+        )
+
+    def stream_borrows(
+            self, engine: AsyncEngine, *, fmt: str = "ndjson", updated_since: Optional[datetime] = None
+    ) -> AsyncIterator[bytes]:
+        header = [column.key for column in BORROW_COLUMNS]
+        return self._stream(engine, "borrows", self.borrows_statement(updated_since=updated_since), fmt, header)
+
+    async def _stream(
+            self,
+            engine: AsyncEngine,
+            name: str,
+            statement: Select,
+            fmt: str,
+            header: Sequence[str],
+            enrich: Optional[Callable] = None
+    ) -> AsyncIterator[bytes]:
+        started_at = time.perf_counter()
+        rows = chunks = 0
+        converters = _csv_converters(statement, header) if fmt == "csv" else None
+        async with engine.connect() as conn:
+            result = await conn.stream(statement.execution_options(yield_per=self.chunk_size))
+            async for partition in result.partitions():
+                records = [dict(row._mapping) for row in partition]
+                if enrich is not None:
+                    await enrich(conn, records)
+                if fmt == "csv":
+                    yield _csv(header, converters, records, with_header=chunks == 0)
+                else:
+                    yield _ndjson(records)
+                rows += len(records)
+                chunks += 1
+        if fmt == "csv" and chunks == 0:
+            yield _csv(header, converters, [], with_header=True)
+        logger.info(
+            f"Exported {rows} {name} as {fmt} in {chunks} chunks",
+            extra={"export": name, "rows": rows, "duration_ms": round((time.perf_counter() - started_at) * 1000, 1)}
+        )
+
+    async def _book_relations(self, conn: AsyncConnection, records: List[Dict[str, Any]]):
+        """
+        The authors and categories of a chunk of books, by book id
+        """
+        book_ids = [record["id"] for record in records]
+        authors: Dict[int, List[Dict[str, Any]]] = {book_id: [] for book_id in book_ids}
+        categories: Dict[int, List[Dict[str, Any]]] = {book_id: [] for book_id in book_ids}
+        author_rows = await conn.execute(
+            select(BookAuthorLink.book_id, Author.id, Author.first_name, Author.last_name)
+            .join(Author, Author.id == BookAuthorLink.author_id)
+            .where(BookAuthorLink.book_id.in_(book_ids))
+            .order_by(BookAuthorLink.book_id, Author.id)
+        )
+        for book_id, author_id, first_name, last_name in author_rows:
+            authors[book_id].append({"id": author_id, "first_name": first_name, "last_name": last_name})
+        category_rows = await conn.execute(
+            select(BookCategoryLink.book_id, Category.id, Category.name)
+            .join(Category, Category.id == BookCategoryLink.category_id)
+            .where(BookCategoryLink.book_id.in_(book_ids))
+            .order_by(BookCategoryLink.book_id, Category.id)
+        )
+        for book_id, category_id, category_name in category_rows:
+            categories[book_id].append({"id": category_id, "name": category_name})
+        return authors, categories
+
+    async def _with_relations(self, conn: AsyncConnection, records: List[Dict[str, Any]]) -> None:
+        authors, categories = await self._book_relations(conn, records)
+        for record in records:
+            record["authors"] = authors[record["id"]]
+            record["categories"] = categories[record["id"]]
+
+    async def _with_relation_labels(self, conn: AsyncConnection, records: List[Dict[str, Any]]) -> None:
+        # CSV has no nesting: ids and names go into "1;2" and "First Last;First Last" columns
+        authors, categories = await self._book_relations(conn, records)
+        for record in records:
+            book_authors, book_categories = authors[record["id"]], categories[record["id"]]
+            record["author_ids"] = [author["id"] for author in book_authors]
+            record["authors"] = [f"{author['first_name']} {author['last_name']}" for author in book_authors]
+            record["category_ids"] = [category["id"] for category in book_categories]
+            record["categories"] = [category["name"] for category in book_categories]
+
+
+export_service = ExportService()
@@ -0,0 +1,75 @@
+# app/services/overdue.py
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import or_, update
+from sqlmodel import Session, select
+
+from app.config import get_settings
+from app.crud.borrowed_books import crud_borrowed_books
+from app.models.borrowed_books import BorrowedBook, BorrowStatus
+from app.services.circulation import IS_OPEN, fine_as_of
+from app.utils.logger import setup_logging
+
+logger = setup_logging()
+settings = get_settings()
+
+
+class SweepResult(NamedTuple):
+    rows_updated: int
+    batches: int
+
+
+class OverdueSweeper:
+    """
+    Marks past-due borrows OVERDUE and brings their fines up to date with
+    set-based UPDATE ... RETURNING statements of at most batch_size rows, each
+    committed on its own so locks stay short. No BorrowedBook objects are loaded.
+    """
+
+    def sweep(
+            self, db: Session, *, as_of: Optional[datetime] = None, batch_size: Optional[int] = None
+    ) -> SweepResult:
+        as_of = as_of or datetime.utcnow()
+        batch_size = batch_size or settings.OVERDUE_SWEEP_BATCH_SIZE
+        fine = fine_as_of(db, as_of)
+
+        # Rows drop out of this set once updated, so the loop ends
+        pending = (
+            select(BorrowedBook.id)
+            .where(
+                IS_OPEN,
+                BorrowedBook.due_date < as_of,
+                or_(BorrowedBook.status == BorrowStatus.ACTIVE, BorrowedBook.fine != fine)
+            )
+            .order_by(BorrowedBook.id)
+            .limit(batch_size)
+        )
+        if db.get_bind().dialect.name == "postgresql":
+            # A concurrent return keeps its row; it is picked up by the next batch or run
+            pending = pending.with_for_update(skip_locked=True)
+
+        statement = (
+            update(BorrowedBook)
+            .where(BorrowedBook.id.in_(pending))
+            .values(status=BorrowStatus.OVERDUE, fine=fine, updated_at=as_of)
+            .returning(BorrowedBook.id)
+            .execution_options(synchronize_session=False)
+        )
+
+        rows_updated = batches = 0
+        while True:
+            ids = db.execute(statement).scalars().all()
+            db.commit()
+            if not ids:
+                break
+            batches += 1
+            rows_updated += len(ids)
+            crud_borrowed_books.cache.invalidate(ids)
+            if len(ids) < batch_size:
+                break
+
+        return SweepResult(rows_updated=rows_updated, batches=batches)
+
+
+overdue_sweeper = OverdueSweeper()
@@ -0,0 +1,148 @@
+# app/services/scheduler.py
+import asyncio
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Optional
+
+from sqlalchemy import Engine, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from app.models.jobs import JobLease, JobRun
+from app.utils.logger import setup_logging
+
+logger = setup_logging()
+
+# Identifies this process in leases and run records
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(db: Session, name: str, ttl_seconds: float, owner: str = WORKER_ID) -> bool:
+    """
+    Take the named lease for ttl_seconds unless another worker holds an unexpired one.
+    Holding it for the whole interval gives one run per interval across all workers.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    taken = db.execute(
+        update(JobLease)
+        .where(JobLease.name == name, JobLease.expires_at <= now)
+        .values(owner=owner, expires_at=expires_at)
+    ).rowcount
+    if taken:
+        db.commit()
+        return True
+
+    if db.get(JobLease, name) is not None:
+        db.rollback()
+        return False
+    db.add(JobLease(name=name, owner=owner, expires_at=expires_at))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker created it first
+        db.rollback()
+        return False
+    return True
+
+
+def release_lease(db: Session, name: str, expires_at: datetime, owner: str = WORKER_ID) -> None:
+    """
+    Shorten a lease this worker holds to expires_at, or to now once that has passed
+    """
+    db.execute(
+        update(JobLease)
+        .where(JobLease.name == name, JobLease.owner == owner)
+        .values(expires_at=max(expires_at, datetime.utcnow()))
+    )
+    db.commit()
+
+
+class PeriodicJob:
+    """
+    A job function taking a Session and returning an object with rows_updated and batches.
+    The lease is held for lease_seconds (at least the interval) while the job runs, so a
+    run longer than the interval is not started again by another worker; once it ends the
+    lease is cut back to the end of the interval.
+    """
+
+    def __init__(
+            self, name: str, interval_seconds: float, func: Callable[[Session], Any],
+            lease_seconds: Optional[float] = None
+    ):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.lease_seconds = max(interval_seconds, lease_seconds or 0)
+
+    def run_once(self, engine: Engine) -> Optional[JobRun]:
+        with Session(engine) as db:
+            started_at = datetime.utcnow()
+            if not acquire_lease(db, self.name, self.lease_seconds):
+                return None
+
+            run = JobRun(job_name=self.name, owner=WORKER_ID, started_at=started_at)
+            start = time.perf_counter()
+            try:
+                result = self.func(db)
+                run.rows_updated = result.rows_updated
+                run.batches = result.batches
+            except Exception as e:
+                db.rollback()
+                run.error = str(e)[:1000]
+                logger.exception(f"Job {self.name} failed")
+            finally:
+                release_lease(db, self.name, started_at + timedelta(seconds=self.interval_seconds))
+            run.duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            run.finished_at = datetime.utcnow()
+
+            db.add(run)
+            db.commit()
+            db.refresh(run)
+            logger.info(
+                f"Job {self.name} finished in {run.duration_ms} ms: "
+                f"{run.rows_updated} rows in {run.batches} batches"
+            )
+            return run
+
+
+class Scheduler:
+    """
+    Runs periodic jobs on the event loop of this worker; the job bodies run in a thread
+    """
+
+    def __init__(self):
+        self.jobs: List[PeriodicJob] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def add(self, job: PeriodicJob) -> None:
+        # Replaces a job of the same name, e.g. when the app is started again in-process
+        self.jobs = [existing for existing in self.jobs if existing.name != job.name]
+        self.jobs.append(job)
+
+    def start(self, engine: Engine) -> None:
+        for job in self.jobs:
+            self._tasks.append(asyncio.create_task(self._loop(job, engine), name=f"job:{job.name}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self, job: PeriodicJob, engine: Engine) -> None:
+        # Spread the workers so they do not all race for the lease at startup
+        await asyncio.sleep(random.uniform(0, min(job.interval_seconds, 10)))
+        # job_lease and job_run come from create_db_and_tables or the migrations, like every other table
+        while True:
+            try:
+                await asyncio.to_thread(job.run_once, engine)
+            except Exception:
+                logger.exception(f"Job {job.name} could not run")
+            await asyncio.sleep(job.interval_seconds)
+
+
+scheduler = Scheduler()
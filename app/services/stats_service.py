@@ -0,0 +1,364 @@
+# app/services/stats_service.py
+import random
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from sqlalchemy import Select, case, delete, func, insert, literal
+from sqlmodel import Session, SQLModel, select
+
+from app.models.books import Book
+from app.models.borrowed_books import BorrowedBook, BorrowStatus
+from app.models.categories import Category
+from app.models.links import BookCategoryLink
+from app.models.stats import (
+    BookStats,
+    BookStatsRead,
+    BorrowCategory,
+    CategoryStats,
+    CategoryStatsRead,
+    LibraryStatsRead,
+    LibraryStatsShard,
+    UserStats,
+    UserStatsRead,
+)
+from app.models.users import User
+from app.utils.logger import setup_logging
+
+logger = setup_logging()
+
+# Number of rows the library-wide counters are spread over
+LIBRARY_SHARDS = 16
+
+
+class StatsService:
+    """
+    Dashboard statistics kept in rollup tables. The record_* methods are called by
+    the circulation engine inside its own transaction and add deltas with
+    INSERT ... ON CONFLICT DO UPDATE, so reads never aggregate borrow history.
+    Borrows are attributed to the categories a book has at checkout time: checkout
+    records them in borrow_category and everything later about the borrow uses that.
+    """
+
+    def record_checkout(
+            self, db: Session, *, borrow_id: int, book_id: int, user_id: int, borrowed_at: datetime
+    ) -> None:
+        deltas = {"total_borrows": 1, "active_borrows": 1}
+        latest = {"last_borrowed_at": borrowed_at}
+        self._record_categories(
+            db, select(literal(borrow_id), BookCategoryLink.category_id).where(BookCategoryLink.book_id == book_id)
+        )
+        self._bump(db, BookStats, "book_id", deltas, key=book_id, latest=latest)
+        self._bump(db, CategoryStats, "category_id", deltas, key_source=self._borrow_categories(borrow_id))
+        self._bump(db, UserStats, "user_id", deltas, key=user_id, latest=latest)
+        self._bump_library(db, deltas)
+
+    def record_return(self, db: Session, *, borrow_id: int, book_id: int, user_id: int, fine: float) -> None:
+        deltas = {"active_borrows": -1, "returns": 1, "fines_total": fine}
+        self._bump(db, BookStats, "book_id", deltas, key=book_id)
+        self._bump(db, CategoryStats, "category_id", deltas, key_source=self._borrow_categories(borrow_id))
+        self._bump(db, UserStats, "user_id", deltas, key=user_id)
+        self._bump_library(db, deltas)
+
+    def record_removal(
+            self, db: Session, *, borrow_id: int, book_id: int, user_id: int, was_open: bool, fine: float = 0.0
+    ) -> None:
+        # A deleted borrow leaves the history too, as rebuild() would see it;
+        # last_borrowed_at keeps its value until the next rebuild
+        deltas: Dict[str, Any] = {"total_borrows": -1}
+        if was_open:
+            deltas["active_borrows"] = -1
+        else:
+            deltas.update(returns=-1, fines_total=-fine)
+        self._bump(db, BookStats, "book_id", deltas, key=book_id)
+        self._bump(db, CategoryStats, "category_id", deltas, key_source=self._borrow_categories(borrow_id))
+        self._bump(db, UserStats, "user_id", deltas, key=user_id)
+        self._bump_library(db, deltas)
+        db.execute(delete(BorrowCategory).where(BorrowCategory.borrow_id == borrow_id))
+
+    def record_checkouts(
+            self, db: Session, *, user_id: int, borrows: List[Tuple[int, int]], borrowed_at: datetime
+    ) -> None:
+        """
+        record_checkout for a stack of (borrow_id, book_id) borrowed by one user, in a
+        fixed number of statements; a book listed twice counts as two borrows
+        """
+        self._record_categories(
+            db,
+            select(BorrowedBook.id, BookCategoryLink.category_id)
+            .join(BookCategoryLink, BookCategoryLink.book_id == BorrowedBook.book_id)
+            .where(BorrowedBook.id.in_([borrow_id for borrow_id, _ in borrows]))
+        )
+        per_book: Dict[int, Dict[str, Any]] = {}
+        for _, book_id in borrows:
+            deltas = per_book.setdefault(book_id, {"total_borrows": 0, "active_borrows": 0})
+            deltas["total_borrows"] += 1
+            deltas["active_borrows"] += 1
+        latest = {"last_borrowed_at": borrowed_at}
+        totals = {"total_borrows": len(borrows), "active_borrows": len(borrows)}
+        per_borrow = {borrow_id: {"total_borrows": 1, "active_borrows": 1} for borrow_id, _ in borrows}
+        self._bump_many(db, BookStats, "book_id", per_book, latest=latest)
+        self._bump_many(db, CategoryStats, "category_id", self._per_category(db, per_borrow))
+        self._bump(db, UserStats, "user_id", totals, key=user_id, latest=latest)
+        self._bump_library(db, totals)
+
+    def record_returns(self, db: Session, returns: List[Tuple[int, int, int, float]]) -> None:
+        """
+        record_return for many (borrow_id, book_id, user_id, fine) at once
+        """
+        per_book: Dict[int, Dict[str, Any]] = {}
+        per_user: Dict[int, Dict[str, Any]] = {}
+        per_borrow: Dict[int, Dict[str, Any]] = {}
+        for borrow_id, book_id, user_id, fine in returns:
+            for deltas in (
+                    per_book.setdefault(book_id, {"active_borrows": 0, "returns": 0, "fines_total": 0.0}),
+                    per_user.setdefault(user_id, {"active_borrows": 0, "returns": 0, "fines_total": 0.0}),
+                    per_borrow.setdefault(borrow_id, {"active_borrows": 0, "returns": 0, "fines_total": 0.0}),
+            ):
+                deltas["active_borrows"] -= 1
+                deltas["returns"] += 1
+                deltas["fines_total"] += fine
+        self._bump_many(db, BookStats, "book_id", per_book)
+        self._bump_many(db, CategoryStats, "category_id", self._per_category(db, per_borrow))
+        self._bump_many(db, UserStats, "user_id", per_user)
+        self._bump_library(db, {
+            "active_borrows": -len(returns),
+            "returns": len(returns),
+            "fines_total": sum(fine for _, _, _, fine in returns),
+        })
+
+    def record_copies(self, db: Session, delta: int) -> None:
+        """
+        Track the total number of copies for the utilization figure
+        """
+        self._bump_library(db, {"total_copies": delta})
+
+    def _record_categories(self, db: Session, source: Select) -> None:
+        # (borrow_id, category_id) rows, taken from the book's links at checkout
+        db.execute(insert(BorrowCategory).from_select(["borrow_id", "category_id"], source))
+
+    def _borrow_categories(self, borrow_id: int) -> Select:
+        return select(BorrowCategory.category_id).where(BorrowCategory.borrow_id == borrow_id)
+
+    def _per_category(self, db: Session, per_borrow: Dict[int, Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Sum the deltas of the borrows over their checkout categories (one read)
+        """
+        per_category: Dict[int, Dict[str, Any]] = {}
+        links = db.exec(
+            select(BorrowCategory.borrow_id, BorrowCategory.category_id)
+            .where(BorrowCategory.borrow_id.in_(per_borrow))
+        )
+        for borrow_id, category_id in links:
+            totals = per_category.setdefault(category_id, {})
+            for name, delta in per_borrow[borrow_id].items():
+                totals[name] = totals.get(name, 0) + delta
+        return per_category
+
+    def _bump_library(self, db: Session, deltas: Dict[str, Any]) -> None:
+        # Only the sum over all shards is meaningful, so a single shard may go negative
+        self._bump(db, LibraryStatsShard, "shard", deltas, key=random.randrange(LIBRARY_SHARDS), clamp=False)
+
+    def _bump(
+            self,
+            db: Session,
+            model: Type[SQLModel],
+            key_column: str,
+            deltas: Dict[str, Any],
+            *,
+            key: Optional[int] = None,
+            key_source: Optional[Select] = None,
+            latest: Optional[Dict[str, Any]] = None,
+            clamp: bool = True
+    ) -> None:
+        """
+        Add deltas to the counters of one row (key) or of every row selected by
+        key_source, creating missing rows. With clamp, counters never go below zero.
+        """
+        deltas = {name: delta for name, delta in deltas.items() if name in model.model_fields and delta}
+        latest = latest or {}
+        if not deltas and not latest:
+            return
+
+        initial = {name: max(delta, 0) if clamp else delta for name, delta in deltas.items()}
+        initial.update(latest)
+        statement = self._upsert(db, model)
+        if key_source is not None:
+            source = key_source.add_columns(*(literal(value) for value in initial.values()))
+            statement = statement.from_select([key_column, *initial], source)
+        else:
+            statement = statement.values({key_column: key, **initial})
+
+        changes = {}
+        for name, delta in deltas.items():
+            column = getattr(model, name)
+            if clamp and delta < 0:
+                changes[name] = case((column + delta < 0, 0), else_=column + delta)
+            else:
+                changes[name] = column + delta
+        for name in latest:
+            changes[name] = getattr(statement.excluded, name)
+        db.execute(statement.on_conflict_do_update(index_elements=[key_column], set_=changes))
+
+    def _bump_many(
+            self,
+            db: Session,
+            model: Type[SQLModel],
+            key_column: str,
+            deltas_by_key: Dict[int, Dict[str, Any]],
+            *,
+            latest: Optional[Dict[str, Any]] = None,
+            clamp: bool = True
+    ) -> None:
+        """
+        _bump for a different set of deltas per row, in one multi-row upsert: the
+        VALUES carry the counters of new rows, a CASE on the key the delta of existing ones
+        """
+        names = [name for name in model.model_fields if any(deltas.get(name) for deltas in deltas_by_key.values())]
+        latest = latest or {}
+        if not deltas_by_key or (not names and not latest):
+            return
+
+        rows = []
+        for key, deltas in deltas_by_key.items():
+            row = {name: max(deltas.get(name, 0), 0) if clamp else deltas.get(name, 0) for name in names}
+            rows.append({key_column: key, **row, **latest})
+        statement = self._upsert(db, model).values(rows)
+
+        key_expression = getattr(model, key_column)
+        changes = {}
+        for name in names:
+            column = getattr(model, name)
+            delta = case(
+                {key: deltas.get(name, 0) for key, deltas in deltas_by_key.items()}, value=key_expression, else_=0
+            )
+            changes[name] = case((column + delta < 0, 0), else_=column + delta) if clamp else column + delta
+        for name in latest:
+            changes[name] = getattr(statement.excluded, name)
+        db.execute(statement.on_conflict_do_update(index_elements=[key_column], set_=changes))
+
+    def _upsert(self, db: Session, model: Type[SQLModel]):
+        # Dialect modules are imported on first use: a worker only ever loads its own
+        if db.get_bind().dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        return dialect_insert(model)
+
+    # Reads: every one of them is a primary key lookup, an index range or a fixed-size sum
+
+    def top_books(self, db: Session, *, limit: int = 10) -> List[BookStatsRead]:
+        rows = db.exec(
+            select(BookStats, Book.title)
+            .join(Book, Book.id == BookStats.book_id)
+            .where(BookStats.total_borrows > 0)
+            .order_by(BookStats.total_borrows.desc(), BookStats.book_id.desc())
+            .limit(limit)
+        )
+        return [BookStatsRead(title=title, **stats.model_dump()) for stats, title in rows]
+
+    def categories(self, db: Session, *, limit: int = 100) -> List[CategoryStatsRead]:
+        rows = db.exec(
+            select(CategoryStats, Category.name)
+            .join(Category, Category.id == CategoryStats.category_id)
+            .where(CategoryStats.total_borrows > 0)
+            .order_by(CategoryStats.total_borrows.desc(), CategoryStats.category_id.desc())
+            .limit(limit)
+        )
+        return [CategoryStatsRead(name=name, **stats.model_dump()) for stats, name in rows]
+
+    def top_users(self, db: Session, *, limit: int = 10) -> List[UserStatsRead]:
+        rows = db.exec(
+            select(UserStats, User.first_name, User.last_name)
+            .join(User, User.id == UserStats.user_id)
+            .where(UserStats.total_borrows > 0)
+            .order_by(UserStats.total_borrows.desc(), UserStats.user_id.desc())
+            .limit(limit)
+        )
+        return [
+            UserStatsRead(first_name=first_name, last_name=last_name, **stats.model_dump())
+            for stats, first_name, last_name in rows
+        ]
+
+    def user(self, db: Session, user_id: int) -> Optional[UserStatsRead]:
+        user = db.get(User, user_id)
+        if user is None:
+            return None
+        stats = db.get(UserStats, user_id) or UserStats(user_id=user_id)
+        return UserStatsRead(first_name=user.first_name, last_name=user.last_name, **stats.model_dump())
+
+    def library(self, db: Session) -> LibraryStatsRead:
+        totals = db.exec(select(
+            func.coalesce(func.sum(LibraryStatsShard.total_borrows), 0),
+            func.coalesce(func.sum(LibraryStatsShard.active_borrows), 0),
+            func.coalesce(func.sum(LibraryStatsShard.returns), 0),
+            func.coalesce(func.sum(LibraryStatsShard.fines_total), 0.0),
+            func.coalesce(func.sum(LibraryStatsShard.total_copies), 0),
+        )).one()
+        total_borrows, active_borrows, returns, fines_total, total_copies = totals
+        return LibraryStatsRead(
+            total_borrows=total_borrows,
+            active_borrows=active_borrows,
+            returns=returns,
+            fines_total=round(fines_total, 2),
+            total_copies=total_copies,
+            utilization=round(active_borrows / total_copies, 4) if total_copies else 0.0
+        )
+
+    def rebuild(self, db: Session) -> LibraryStatsRead:
+        """
+        Recompute every rollup from borrowedbook and the checkout categories of the borrows
+        """
+        for model in (BookStats, CategoryStats, UserStats, LibraryStatsShard):
+            db.execute(delete(model))
+
+        is_open = case((BorrowedBook.status != BorrowStatus.RETURNED, 1), else_=0)
+        is_returned = case((BorrowedBook.status == BorrowStatus.RETURNED, 1), else_=0)
+        returned_fine = case((BorrowedBook.status == BorrowStatus.RETURNED, BorrowedBook.fine), else_=0.0)
+
+        db.execute(insert(BookStats).from_select(
+            ["book_id", "total_borrows", "active_borrows", "last_borrowed_at"],
+            select(BorrowedBook.book_id, func.count(), func.sum(is_open), func.max(BorrowedBook.borrow_date))
+            .group_by(BorrowedBook.book_id)
+        ))
+        db.execute(insert(CategoryStats).from_select(
+            ["category_id", "total_borrows", "active_borrows"],
+            select(BorrowCategory.category_id, func.count(), func.sum(is_open))
+            .join(BorrowedBook, BorrowedBook.id == BorrowCategory.borrow_id)
+            .group_by(BorrowCategory.category_id)
+        ))
+        db.execute(insert(UserStats).from_select(
+            ["user_id", "total_borrows", "active_borrows", "returns", "fines_total", "last_borrowed_at"],
+            select(
+                BorrowedBook.user_id,
+                func.count(),
+                func.sum(is_open),
+                func.sum(is_returned),
+                func.sum(returned_fine),
+                func.max(BorrowedBook.borrow_date)
+            ).group_by(BorrowedBook.user_id)
+        ))
+        total_copies = select(func.coalesce(func.sum(Book.quantity), 0)).scalar_subquery()
+        db.execute(insert(LibraryStatsShard).from_select(
+            ["shard", "total_borrows", "active_borrows", "returns", "fines_total", "total_copies"],
+            select(
+                literal(0),
+                func.count(),
+                func.coalesce(func.sum(is_open), 0),
+                func.coalesce(func.sum(is_returned), 0),
+                func.coalesce(func.sum(returned_fine), 0.0),
+                total_copies
+            ).select_from(BorrowedBook)
+        ))
+        db.commit()
+        logger.info("Statistics rollups rebuilt")
+        return self.library(db)
+
+    def ensure_initialized(self, db: Session) -> None:
+        """
+        Build the rollups once for a database that predates them
+        """
+        if db.exec(select(LibraryStatsShard.shard).limit(1)).first() is None:
+            self.rebuild(db)
+
+
+stats_service = StatsService()
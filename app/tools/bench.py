@@ -0,0 +1,341 @@
+# app/tools/bench.py
+"""
+Load and latency benchmark of the API routes.
+
+Seeds a synthetic library (app.tools.seed) into the database of DATABASE_URL
+when it has no books yet, then drives every router through an in-process ASGI client at the
+given concurrency levels and writes p50/p95/p99 latency, throughput and SQL
+statement counts as JSON, so runs can be compared between commits.
+
+    DATABASE_URL=sqlite:////tmp/library_bench.db \\
+        python -m app.tools.bench --books 100000 --authors 20000 --borrows 1000000 \\
+        --concurrency 1,8,32 --requests 500 --output bench.json
+
+Write scenarios change the data; reseed (a fresh database) for strictly
+comparable runs. The scheduler does not run because the app lifespan is not started.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+from sqlalchemy import Engine, func
+from sqlmodel import Session, SQLModel, select
+
+from app.config import get_settings
+from app.db import query_stats
+from app.db.database import create_db_and_tables, engine
+from app.models.authors import Author
+from app.models.books import Book
+from app.models.borrowed_books import BorrowedBook
+from app.models.categories import Category
+from app.models.users import User
+from app.tools.seed import TITLE_WORDS, reset_schema, seed_library
+
+settings = get_settings()
+
+
+class Scenario(NamedTuple):
+    name: str
+    # Returns (method, url, json body) for one request
+    build: Callable[[random.Random, Dict[str, Any]], Tuple[str, str, Optional[dict]]]
+    on_response: Optional[Callable[[httpx.Response, Dict[str, Any]], None]] = None
+
+
+def _remember_borrow(response: httpx.Response, state: Dict[str, Any]) -> None:
+    if response.status_code == 201:
+        state["open_borrows"].append(response.json()["id"])
+
+
+def _return_borrow(rng: random.Random, state: Dict[str, Any]):
+    if state["open_borrows"]:
+        borrow_id = state["open_borrows"].pop()
+        return "PUT", f"/api/borrowed-books/{borrow_id}", {"return_date": datetime.utcnow().isoformat()}
+    return "GET", f"/api/borrowed-books/{rng.randint(1, state['borrows'])}", None
+
+
+def _remember_batch(response: httpx.Response, state: Dict[str, Any]) -> None:
+    if response.status_code == 200:
+        state["open_borrows"].extend(item["borrow"]["id"] for item in response.json()["items"] if item["borrow"])
+
+
+def _return_batch(rng: random.Random, state: Dict[str, Any]):
+    if state["open_borrows"]:
+        borrow_ids = [state["open_borrows"].pop() for _ in range(min(5, len(state["open_borrows"])))]
+        return "POST", "/api/borrowed-books/batch-return", {"borrow_ids": borrow_ids}
+    return "GET", f"/api/borrowed-books/{rng.randint(1, state['borrows'])}", None
+
+
+def _create_book(rng: random.Random, state: Dict[str, Any]):
+    state["isbn"] += 1
+    return "POST", "/api/books/", {
+        "title": f"Bench {rng.choice(TITLE_WORDS)} {state['isbn']}",
+        "publication_year": 2024,
+        "isbn": f"bench-{state['isbn']}",
+        "quantity": 2,
+        "author_ids": [rng.randint(1, state["authors"])],
+        "category_ids": [rng.randint(1, state["categories"])],
+    }
+
+
+SCENARIOS = [
+    Scenario("books.list", lambda rng, s: ("GET", f"/api/books/?limit=20&skip={rng.randint(0, 1000)}", None)),
+    Scenario("books.list_by_author", lambda rng, s: ("GET", f"/api/books/?author_id={rng.randint(1, s['authors'])}", None)),
+    Scenario("books.list_by_category", lambda rng, s: ("GET", f"/api/books/?category_id={rng.randint(1, s['categories'])}&limit=20", None)),
+    Scenario("books.list_by_title", lambda rng, s: ("GET", f"/api/books/?title={rng.choice(TITLE_WORDS)}&limit=20", None)),
+    Scenario("books.search", lambda rng, s: ("GET", f"/api/books/search?q={rng.choice(TITLE_WORDS)}", None)),
+    Scenario("books.detail", lambda rng, s: ("GET", f"/api/books/{rng.randint(1, s['books'])}", None)),
+    Scenario("books.available", lambda rng, s: ("GET", f"/api/books/{rng.randint(1, s['books'])}/available", None)),
+    Scenario("books.create", _create_book),
+    Scenario("authors.list", lambda rng, s: ("GET", f"/api/authors/?limit=50&skip={rng.randint(0, 1000)}", None)),
+    Scenario("authors.detail", lambda rng, s: ("GET", f"/api/authors/{rng.randint(1, s['authors'])}", None)),
+    Scenario("categories.list", lambda rng, s: ("GET", "/api/categories/", None)),
+    Scenario("categories.detail", lambda rng, s: ("GET", f"/api/categories/{rng.randint(1, s['categories'])}", None)),
+    Scenario("users.list", lambda rng, s: ("GET", f"/api/users/?limit=50&skip={rng.randint(0, 1000)}", None)),
+    Scenario("users.detail", lambda rng, s: ("GET", f"/api/users/{rng.randint(1, s['users'])}", None)),
+    Scenario("borrowed_books.list", lambda rng, s: ("GET", f"/api/borrowed-books/?limit=50&skip={rng.randint(0, 1000)}", None)),
+    Scenario("borrowed_books.detail", lambda rng, s: ("GET", f"/api/borrowed-books/{rng.randint(1, s['borrows'])}", None)),
+    Scenario(
+        "borrowed_books.checkout",
+        lambda rng, s: ("POST", "/api/borrowed-books/", {
+            "book_id": rng.randint(1, s["books"]), "user_id": rng.randint(1, s["users"])
+        }),
+        _remember_borrow,
+    ),
+    Scenario("borrowed_books.return", _return_borrow),
+    Scenario(
+        "borrowed_books.batch_checkout",
+        lambda rng, s: ("POST", "/api/borrowed-books/batch", {
+            "user_id": rng.randint(1, s["users"]), "book_ids": [rng.randint(1, s["books"]) for _ in range(5)]
+        }),
+        _remember_batch,
+    ),
+    Scenario("borrowed_books.batch_return", _return_batch),
+    Scenario("stats.library", lambda rng, s: ("GET", "/api/stats/library", None)),
+    Scenario("stats.top_books", lambda rng, s: ("GET", "/api/stats/books/top", None)),
+    Scenario("stats.categories", lambda rng, s: ("GET", "/api/stats/categories", None)),
+    Scenario("stats.top_users", lambda rng, s: ("GET", "/api/stats/users/top", None)),
+    Scenario("stats.user", lambda rng, s: ("GET", f"/api/stats/users/{rng.randint(1, s['users'])}", None)),
+]
+
+
+class QueryCounter:
+    """
+    Outermost ASGI wrapper that reports the statements of each request in a header;
+    the app's own middlewares share its collector
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = query_stats.QueryStats()
+        token = query_stats.activate(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-bench-queries", str(stats.count).encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            query_stats.deactivate(token)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(
+        client: httpx.AsyncClient,
+        scenario: Scenario,
+        *,
+        concurrency: int,
+        requests: int,
+        warmup: int,
+        rng: random.Random,
+        state: Dict[str, Any]
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    queries: List[int] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+
+    async def one(record: bool) -> None:
+        nonlocal errors
+        method, url, body = scenario.build(rng, state)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, json=body)
+        except Exception:
+            errors += 1
+            return
+        elapsed = time.perf_counter() - start
+        if scenario.on_response is not None:
+            scenario.on_response(response, state)
+        if not record:
+            return
+        latencies.append(elapsed)
+        queries.append(int(response.headers.get("x-bench-queries", 0)))
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+        if response.status_code >= 500:
+            errors += 1
+
+    for _ in range(warmup):
+        await one(record=False)
+
+    remaining = requests
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await one(record=True)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "queries": {
+            "mean": round(sum(queries) / len(queries), 2) if queries else 0.0,
+            "max": max(queries, default=0),
+        },
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _table_sizes(engine: Engine) -> Dict[str, int]:
+    with Session(engine) as session:
+        return {
+            model.__tablename__: session.exec(select(func.count()).select_from(model)).one()
+            for model in (Book, Author, Category, User, BorrowedBook)
+        }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.main import app
+
+    SQLModel.metadata.create_all(engine)
+    seeded = None
+    if args.reseed or _table_sizes(engine)["book"] == 0:
+        if args.reseed:
+            reset_schema(engine)
+        start = time.perf_counter()
+        seeded = seed_library(
+            engine, books=args.books, authors=args.authors, categories=args.categories,
+            users=args.users, borrows=args.borrows, seed=args.seed, skew=args.skew
+        )
+        seeded["seconds"] = round(time.perf_counter() - start, 2)
+        print(f"Seeded {seeded}", file=sys.stderr)
+    create_db_and_tables()
+
+    sizes = _table_sizes(engine)
+    state = {
+        "books": sizes["book"], "authors": sizes["author"], "categories": sizes["category"],
+        "users": sizes["user"], "borrows": sizes["borrowedbook"], "open_borrows": [], "isbn": int(time.time()),
+    }
+    selected = [s for s in SCENARIOS if not args.scenarios or any(s.name.startswith(p) for p in args.scenarios)]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    rng = random.Random(args.seed)
+
+    results = []
+    transport = httpx.ASGITransport(app=QueryCounter(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for concurrency in levels:
+            for scenario in selected:
+                result = await run_scenario(
+                    client, scenario, concurrency=concurrency, requests=args.requests,
+                    warmup=args.warmup, rng=rng, state=state
+                )
+                results.append(result)
+                latency = result["latency_ms"]
+                print(
+                    f"{scenario.name:<26} c={concurrency:<3} {result['throughput_rps']:>9.1f} rps  "
+                    f"p50 {latency['p50']:>8.2f}  p95 {latency['p95']:>8.2f}  p99 {latency['p99']:>8.2f} ms  "
+                    f"{result['queries']['mean']:>5.1f} q/req  errors {result['errors']}",
+                    file=sys.stderr
+                )
+
+    return {
+        "commit": _git_commit(),
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "settings": {
+            "cache_enabled": settings.CACHE_ENABLED,
+            "response_serialization": settings.RESPONSE_SERIALIZATION,
+            "db_pool_size": settings.DB_POOL_SIZE,
+        },
+        "dataset": sizes,
+        "seeded": seeded,
+        "requests_per_scenario": args.requests,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--authors", type=int, default=2000)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--borrows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of popularity, see app.tools.seed")
+    parser.add_argument("--reseed", action="store_true", help="drop all tables and seed again")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated levels")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--scenarios", nargs="*", help="name prefixes, e.g. books stats.library")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
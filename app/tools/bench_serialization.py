@@ -0,0 +1,79 @@
+# app/tools/bench_serialization.py
+"""
+Microbenchmark of the response serialization modes on a books page.
+
+    python -m app.tools.bench_serialization --rows 100 --repeat 200
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from app.models.authors import Author
+from app.models.books import Book, BookRead
+from app.models.categories import Category
+from app.utils.serialization import MODES, dump_json, orjson
+
+
+def build_books(rows: int, authors_per_book: int, categories_per_book: int) -> List[Book]:
+    # Transient ORM rows shaped like a search_books() page; naive UTC like rows read back from the DB
+    now = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    authors = [
+        Author(id=i, first_name=f"First{i}", last_name=f"Last{i}", created_at=now, updated_at=now)
+        for i in range(1, 51)
+    ]
+    categories = [
+        Category(id=i, name=f"Category {i}", description="Lorem ipsum dolor sit amet", created_at=now, updated_at=now)
+        for i in range(1, 21)
+    ]
+    books = []
+    for i in range(1, rows + 1):
+        book = Book(
+            id=i,
+            title=f"Book title number {i}",
+            publication_year=1950 + i % 70,
+            isbn=f"978{i:010d}",
+            quantity=3,
+            available_copies=2,
+            created_at=now,
+            updated_at=now + timedelta(seconds=i),
+        )
+        book.authors = [authors[(i + k) % len(authors)] for k in range(authors_per_book)]
+        book.categories = [categories[(i + k) % len(categories)] for k in range(categories_per_book)]
+        books.append(book)
+    return books
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--authors", type=int, default=2)
+    parser.add_argument("--categories", type=int, default=2)
+    args = parser.parse_args()
+
+    books = build_books(args.rows, args.authors, args.categories)
+    response_type = List[BookRead]
+    modes = [mode for mode in MODES if mode != "trusted" or orjson is not None]
+
+    reference = json.loads(dump_json(response_type, books, "default"))
+    results = {}
+    for mode in modes:
+        if json.loads(dump_json(response_type, books, mode)) != reference:
+            raise SystemExit(f"{mode}: output differs from the default encoder")
+        dump_json(response_type, books, mode)  # warm up the adapters
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            body = dump_json(response_type, books, mode)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        results[mode] = elapsed
+        print(f"{mode:>8}: {elapsed * 1000:8.3f} ms/response  {len(body):>8} bytes")
+
+    baseline = results["default"]
+    for mode in modes[1:]:
+        print(f"{mode:>8}: {baseline / results[mode]:.1f}x faster than default")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# app/tools/explain_indexes.py
+"""
+Checks that the hot borrowedbook filters are served by their indexes
+(migrations/versions/0003_borrowedbook_indexes.py).
+
+Each statement below is the one the service builds, compiled with its parameters
+inlined and run through EXPLAIN QUERY PLAN (SQLite) or EXPLAIN (FORMAT JSON)
+(PostgreSQL, with sequential scans disabled so a small table still shows whether
+the index is usable at all). Prints a JSON report and exits with 1 when a plan
+does not use the expected index.
+
+    DATABASE_URL=sqlite:////tmp/library.db python -m app.tools.explain_indexes
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import Connection, Engine, or_, text
+from sqlmodel import select
+
+from app.models.borrowed_books import BorrowedBook, BorrowStatus
+from app.services.circulation import IS_OPEN
+
+# (name, expected index, statement)
+HOT_QUERIES: List[Tuple[str, str, Any]] = [
+    (
+        # BookService.has_active_borrows
+        "book_open_borrows",
+        "ix_borrowedbook_book_id_status",
+        select(BorrowedBook.id).where(BorrowedBook.book_id == 1, IS_OPEN).limit(1),
+    ),
+    (
+        # The open borrows of a user (delete guard, per-user limit)
+        "user_open_borrows",
+        "ix_borrowedbook_user_id_status",
+        select(BorrowedBook.id).where(BorrowedBook.user_id == 1, IS_OPEN),
+    ),
+    (
+        # OverdueSweeper.sweep, the rows of one batch
+        "overdue_sweep_batch",
+        "ix_borrowedbook_open_status_due_date",
+        select(BorrowedBook.id)
+        .where(
+            IS_OPEN,
+            BorrowedBook.due_date < datetime(2030, 1, 1),
+            or_(BorrowedBook.status == BorrowStatus.ACTIVE, BorrowedBook.fine != 0.0)
+        )
+        .order_by(BorrowedBook.id)
+        .limit(500),
+    ),
+]
+
+
+def _compile(statement, engine: Engine) -> str:
+    return str(statement.compile(engine, compile_kwargs={"literal_binds": True}))
+
+
+def _postgres_indexes(node: Dict[str, Any]) -> List[str]:
+    found = [node["Index Name"]] if "Index Name" in node else []
+    for child in node.get("Plans", []):
+        found.extend(_postgres_indexes(child))
+    return found
+
+
+def explain(conn: Connection, sql: str) -> Tuple[Any, List[str]]:
+    """
+    The plan and the names of the indexes it reads
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar_one()
+        return plan, _postgres_indexes(plan[0]["Plan"])
+    rows = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    return rows, [word for row in rows for word in row.split() if word.startswith("ix_")]
+
+
+def check(engine: Engine) -> Dict[str, Any]:
+    queries = {}
+    with engine.connect() as conn:
+        for name, index, statement in HOT_QUERIES:
+            sql = _compile(statement, engine)
+            with conn.begin():
+                plan, used = explain(conn, sql)
+            queries[name] = {"expected_index": index, "uses_index": index in used, "sql": sql, "plan": plan}
+    return {
+        "dialect": engine.dialect.name,
+        "ok": all(query["uses_index"] for query in queries.values()),
+        "queries": queries,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    from app.db.database import engine
+    import app.main  # noqa: F401  every model, so the mappers configure
+
+    report = check(engine)
+    print(json.dumps(report, indent=2, default=str))
+    if not report["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
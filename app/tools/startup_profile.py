@@ -0,0 +1,159 @@
+# app/tools/startup_profile.py
+"""
+Cold start profile of an API worker.
+
+Starts fresh interpreters that import app.main, run the lifespan hook and serve one
+request through an in-process ASGI client, and reports for each STARTUP_MODE the time
+from process spawn to the first response, the import time and the lifespan phase
+timings (see app/utils/startup.py). One more run under `python -X importtime` gives the
+per-module and per-package import times.
+
+    DATABASE_URL=sqlite:////tmp/library.db \\
+        python -m app.tools.startup_profile --modes full,fast --runs 5 --output startup.json
+
+Uses the database of DATABASE_URL; fast mode expects its schema to exist already.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+_MARKER = "STARTUP_PROFILE "
+
+# Runs in the child interpreter; nothing may be imported before app.main
+_CHILD = """
+import asyncio, json, sys, time
+from app.main import app
+import httpx
+
+async def first_request():
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get(sys.argv[1])
+        served_at = time.time()
+    return response.status_code, served_at
+
+status_code, served_at = asyncio.run(first_request())
+print(%r + json.dumps({"served_at": served_at, "status": status_code, "startup": app.state.startup}), flush=True)
+""" % _MARKER
+
+
+def _child_env(mode: str) -> Dict[str, str]:
+    return dict(os.environ, STARTUP_MODE=mode)
+
+
+def cold_start(mode: str, url: str) -> Dict[str, Any]:
+    """
+    One worker start: spawn to first response, as seen from outside the process
+    """
+    spawned_at = time.time()
+    completed = subprocess.run(
+        [sys.executable, "-c", _CHILD, url], env=_child_env(mode), capture_output=True, text=True, check=True
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(_MARKER):
+            result = json.loads(line[len(_MARKER):])
+            break
+    else:
+        raise RuntimeError(f"No profile from the {mode} start:\n{completed.stdout}\n{completed.stderr}")
+    if result["status"] >= 500:
+        raise RuntimeError(f"First request of the {mode} start failed with {result['status']}")
+    return {"first_response_seconds": result["served_at"] - spawned_at, **result["startup"]}
+
+
+def import_times(mode: str) -> List[Tuple[str, int, int]]:
+    """
+    (module, self us, cumulative us) from `python -X importtime -c "import app.main"`
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=_child_env(mode), capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def package_of(module: str) -> str:
+    # The application is split by its subpackages, third party code by distribution
+    parts = module.split(".")
+    return ".".join(parts[:2]) if parts[0] == "app" else parts[0]
+
+
+def summarize_imports(modules: List[Tuple[str, int, int]], top: int) -> Dict[str, Any]:
+    packages: Dict[str, int] = {}
+    for name, self_us, _ in modules:
+        packages[package_of(name)] = packages.get(package_of(name), 0) + self_us
+    slowest = sorted(modules, key=lambda module: module[1], reverse=True)[:top]
+    return {
+        "total_ms": round(sum(self_us for _, self_us, _ in modules) / 1000, 1),
+        "modules": len(modules),
+        "packages_ms": {
+            name: round(self_us / 1000, 1)
+            for name, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+        "slowest_modules_ms": [
+            {"module": name, "self": round(self_us / 1000, 1), "cumulative": round(cumulative_us / 1000, 1)}
+            for name, self_us, cumulative_us in slowest
+        ],
+    }
+
+
+def _median(runs: List[Dict[str, Any]], key: str) -> float:
+    return round(statistics.median(run[key] for run in runs) * 1000, 1)
+
+
+def profile_mode(mode: str, runs: int, url: str) -> Dict[str, Any]:
+    samples = [cold_start(mode, url) for _ in range(runs)]
+    phases = {
+        name: round(statistics.median(sample["phases"][name] for sample in samples) * 1000, 1)
+        for name in samples[0]["phases"]
+    }
+    return {
+        "runs": runs,
+        "first_response_ms": {
+            "median": _median(samples, "first_response_seconds"),
+            "min": round(min(sample["first_response_seconds"] for sample in samples) * 1000, 1),
+            "max": round(max(sample["first_response_seconds"] for sample in samples) * 1000, 1),
+        },
+        "import_ms": _median(samples, "import_seconds"),
+        "lifespan_ms": _median(samples, "lifespan_seconds"),
+        "phases_ms": phases,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="full,fast", help="comma separated STARTUP_MODE values")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per mode")
+    parser.add_argument("--url", default="/api/books/?limit=1", help="the first request")
+    parser.add_argument("--top", type=int, default=25, help="modules and packages listed")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    report = {
+        "python": sys.version.split()[0],
+        "url": args.url,
+        "modes": {mode: profile_mode(mode, args.runs, args.url) for mode in modes},
+        "imports": summarize_imports(import_times(modes[0]), args.top),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
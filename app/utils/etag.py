@@ -0,0 +1,67 @@
+# app/utils/etag.py
+import hashlib
+from datetime import datetime, timezone
+from typing import Any
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Strong ETag from a version fingerprint (IDs, updated_at values, counts)
+    """
+    raw = "|".join(_normalize(part) for part in parts)
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+
+def content_etag(body: bytes) -> str:
+    """
+    Strong ETag of an encoded response body
+    """
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _normalize(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return ",".join(_normalize(item) for item in value)
+    if isinstance(value, datetime):
+        # Timestamps are stored as naive UTC
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    return "" if value is None else str(value)
+
+
+def page_etag(request: Request, version: tuple) -> str:
+    # The same fingerprint means different pages under different filters
+    return make_etag(request.url.path, request.url.query, *version)
+
+
+def has_validator(request: Request) -> bool:
+    """
+    Whether the version lookup is worth a query
+    """
+    return "if-none-match" in request.headers
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    # Clients may store the body but must revalidate before reusing it
+    response.headers["Cache-Control"] = "no-cache"
+
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    set_etag(response, etag)
+    return response
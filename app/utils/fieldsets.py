@@ -0,0 +1,184 @@
+# app/utils/fieldsets.py
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Type, get_origin
+
+from fastapi import Request, Response, status
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import load_only, selectinload
+from sqlmodel import SQLModel
+
+from app.utils.etag import content_etag, etag_matches, not_modified, set_etag
+from app.utils.exceptions import LibraryException
+from app.utils.serialization import dump_json, encoded_response
+
+FIELDS_HELP = "Comma separated fields to return, e.g. title,isbn or authors.last_name for an expanded relation"
+INCLUDE_HELP = "Comma separated relations to expand; an empty value expands none"
+
+
+class InvalidFieldsetException(LibraryException):
+    """Exception raised when fields= or include= names something the resource does not have"""
+    def __init__(self, detail: str):
+        super().__init__(detail, status_code=status.HTTP_400_BAD_REQUEST)
+
+
+def _split(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+@lru_cache(maxsize=None)
+def scalar_fields(read_model: Type[BaseModel]) -> Tuple[str, ...]:
+    """
+    Fields of a read model that are not embedded read models
+    """
+    names = []
+    for name, field in read_model.model_fields.items():
+        annotation = field.annotation
+        if get_origin(annotation) in (list, List):
+            continue
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            continue
+        names.append(name)
+    return tuple(names)
+
+
+@lru_cache(maxsize=None)
+def sparse_model(
+        read_model: Type[BaseModel],
+        fields: Tuple[str, ...],
+        expanded: Tuple[Tuple[str, Type[BaseModel], Tuple[str, ...]], ...] = ()
+) -> Type[BaseModel]:
+    """
+    A read model cut down to the given fields plus the expanded relations as
+    (name, read model of the items, their fields). Built once per shape.
+    """
+    definitions: Dict[str, Any] = {
+        name: (read_model.model_fields[name].annotation, read_model.model_fields[name]) for name in fields
+    }
+    for name, item_model, item_fields in expanded:
+        definitions[name] = (List[sparse_model(item_model, item_fields)], ...)
+    return create_model(
+        f"{read_model.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **definitions
+    )
+
+
+class Projection:
+    """
+    What a client asked for with fields= and include=: the columns of the entity, the
+    relationships to expand and the columns of those. Drives both the query (load_only
+    for the columns, one selectinload per expanded relation) and the model the result
+    is encoded with, so a request costs one query plus one per expansion.
+    """
+
+    def __init__(
+            self,
+            model: Type[SQLModel],
+            read_model: Type[BaseModel],
+            fields: Tuple[str, ...],
+            expanded: Dict[str, Tuple[Type[BaseModel], Tuple[str, ...]]],
+            required: Sequence[str] = (),
+            is_default: bool = False
+    ):
+        self.model = model
+        self.read_model = read_model
+        self.fields = fields
+        self.expanded = expanded
+        self.required = tuple(required)
+        self.is_default = is_default
+
+    @classmethod
+    def parse(
+            cls,
+            model: Type[SQLModel],
+            read_model: Type[BaseModel],
+            expansions: Mapping[str, Type[BaseModel]],
+            default_includes: Sequence[str],
+            fields: Optional[str],
+            include: Optional[str],
+            required: Sequence[str] = ()
+    ) -> "Projection":
+        own_fields = scalar_fields(read_model)
+        # Without either parameter the response keeps its usual shape; otherwise only what is named is expanded
+        includes = list(default_includes) if fields is None and include is None else _split(include or "")
+        for name in includes:
+            if name not in expansions:
+                raise InvalidFieldsetException(
+                    f"Cannot include '{name}'; expandable: {', '.join(expansions) or 'none'}"
+                )
+
+        selected: Optional[List[str]] = None
+        nested: Dict[str, List[str]] = {}
+        if fields is not None:
+            selected = []
+            for name in _split(fields):
+                relation, _, field = name.rpartition(".")
+                if relation:
+                    if relation not in expansions or field not in scalar_fields(expansions[relation]):
+                        raise InvalidFieldsetException(f"Unknown field '{name}'")
+                    nested.setdefault(relation, []).append(field)
+                    if relation not in includes:
+                        includes.append(relation)
+                elif field in own_fields:
+                    selected.append(field)
+                elif field in expansions:
+                    if field not in includes:
+                        includes.append(field)
+                else:
+                    raise InvalidFieldsetException(f"Unknown field '{name}'; available: {', '.join(own_fields)}")
+
+        expanded = {}
+        for name in includes:
+            item_model = expansions[name]
+            item_fields = scalar_fields(item_model)
+            if name in nested:
+                # Read model order, so equal requests share one response model
+                item_fields = tuple(field for field in item_fields if field in nested[name] or field == "id")
+            expanded[name] = (item_model, item_fields)
+        if selected is not None:
+            # The id is always returned
+            own_fields = tuple(field for field in own_fields if field in selected or field == "id")
+        return cls(
+            model,
+            read_model,
+            own_fields,
+            expanded,
+            required=required,
+            is_default=fields is None and include is None
+        )
+
+    def load_options(self) -> list:
+        mapper = sa_inspect(self.model)
+        columns = {"id", *self.required, *self.fields}
+        options = [load_only(*(getattr(self.model, key) for key in mapper.column_attrs.keys() if key in columns))]
+        for name, (_, item_fields) in self.expanded.items():
+            relationship = mapper.relationships[name]
+            item_class = relationship.mapper.class_
+            # The keys that tie the items to their owner stay loaded for selectinload
+            item_columns = {"id", *item_fields, *(column.key for column in relationship.remote_side)}
+            options.append(selectinload(getattr(self.model, name)).load_only(*(
+                getattr(item_class, key) for key in relationship.mapper.column_attrs.keys() if key in item_columns
+            )))
+        return options
+
+    @property
+    def response_model(self) -> Type[BaseModel]:
+        return sparse_model(
+            self.read_model,
+            self.fields,
+            tuple((name, item_model, item_fields) for name, (item_model, item_fields) in self.expanded.items())
+        )
+
+
+def sparse_response(request: Request, response: Response, response_type: Any, content: Any) -> Response:
+    """
+    Encode a projected result and answer it with an ETag of the encoded body,
+    since the version fingerprints of the read models do not cover every shape
+    """
+    body = dump_json(response_type, content)
+    etag = content_etag(body)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    return encoded_response(body, response)
@@ -1,53 +1,222 @@
+import json
 import logging
 import os
+import queue
+import re
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
 from app.config import get_settings
 
 settings = get_settings()
 
+LOGGER_NAME = "library_api"
+
+# Id of the request being served; "-" outside of requests (startup, jobs)
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else was passed with extra= and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamps the current request id on the record in the thread that logs it
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "source": f"{record.filename}:{record.lineno}",
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records on a bounded queue without ever blocking the caller. When the
+    queue is full the record is dropped and counted; the next record that fits is
+    preceded by a warning with the number of records lost.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self._unreported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only the cheap part runs on the caller's thread; JSON/text formatting happens in the listener
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._unreported:
+            with self._lock:
+                lost, self._unreported = self._unreported, 0
+            if lost:
+                notice = logging.makeLogRecord({
+                    "name": LOGGER_NAME, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "filename": os.path.basename(__file__), "request_id": "-", "dropped": lost,
+                    "msg": f"{lost} log records dropped, the log queue was full",
+                })
+                try:
+                    self.queue.put_nowait(notice)
+                except queue.Full:
+                    # Still full: report them with the next record instead
+                    with self._lock:
+                        self._unreported += lost
+        self._put(record)
+
+    def _put(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._unreported += 1
+
+
+_configure_lock = threading.Lock()
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def _build_formatter() -> logging.Formatter:
+    if settings.LOG_FORMAT == "text":
+        return logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+    return JsonFormatter()
+
+
+def setup_logging() -> logging.Logger:
+    """
+    Return the application logger. Its records go through the pipeline once
+    start_logging() has run, and to the root logger before that.
+    """
+    return logging.getLogger(LOGGER_NAME)
+
+
+def start_logging(log_level_str: Optional[str] = None) -> None:
+    """
+    Configure the pipeline for the whole process: a bounded queue drained by one
+    listener thread that writes to stdout and the rotating file. Called once at startup;
+    calling it again while it runs does nothing.
+    """
+    global _handler, _listener
+    with _configure_lock:
+        if _handler is not None:
+            return
+        log_level = getattr(logging, (log_level_str or settings.LOG_LEVEL).upper(), logging.INFO)
+
+        log_dir = os.environ.get("LOG_DIR", settings.LOG_DIR)
+        os.makedirs(log_dir, exist_ok=True)
+        formatter = _build_formatter()
+
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+        file_handler = RotatingFileHandler(
+            os.path.join(log_dir, "app.log"),
+            maxBytes=10485760,  # 10MB
+            backupCount=10
+        )
+        file_handler.setFormatter(formatter)
+
+        handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+        handler.addFilter(RequestIdFilter())
+        listener = QueueListener(handler.queue, console_handler, file_handler, respect_handler_level=False)
+        listener.start()
+
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.handlers = [handler]
+        logger.setLevel(log_level)
+        logger.propagate = False  # Prevent duplicate logs
+        _handler, _listener = handler, listener
+
+
+def shutdown_logging() -> None:
+    """
+    Write out everything still queued, stop the listener thread and hand the logger
+    back to the root logger
+    """
+    global _handler, _listener
+    with _configure_lock:
+        handler, listener = _handler, _listener
+        _handler = _listener = None
+        if handler is None:
+            return
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.removeHandler(handler)
+        logger.propagate = True
+    listener.stop()
+    for target in listener.handlers:
+        target.close()
+
+
+def logging_stats() -> Dict[str, int]:
+    if _handler is None:
+        return {"queued": 0, "capacity": settings.LOG_QUEUE_SIZE, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "capacity": _handler.queue.maxsize, "dropped": _handler.dropped}
+
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class RequestIdMiddleware:
+    """
+    Pure ASGI middleware: reuses a sane incoming X-Request-ID or generates one, makes
+    it available to log records and returns it in the response headers
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _VALID_REQUEST_ID.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or uuid.uuid4().hex
+        header = (b"x-request-id", request_id.encode("latin-1"))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
 
-def setup_logging(log_level_str="INFO"):
-    log_level = getattr(logging, log_level_str.upper(), logging.INFO)
-
-    # Create logs directory if it doesn't exist
-    log_dir = os.environ.get("LOG_DIR", "logs")
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-
-    # Configure logger
-    logger = logging.getLogger("library_api")
-
-    # Clear any existing handlers to prevent duplicates on reloads
-    if logger.handlers:
-        logger.handlers = []
-
-    logger.setLevel(log_level)
-    logger.propagate = False  # Prevent duplicate logs
-
-    # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(log_level)
-    console_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    console_handler.setFormatter(console_formatter)
-
-    # File handler
-    log_file_path = os.path.join(log_dir, "app.log")
-    file_handler = RotatingFileHandler(
-        log_file_path,
-        maxBytes=10485760,  # 10MB
-        backupCount=10
-    )
-    file_handler.setLevel(log_level)
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
-    )
-    file_handler.setFormatter(file_formatter)
-
-    # Add handlers to logger
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-
-    return logger
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
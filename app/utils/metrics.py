@@ -0,0 +1,368 @@
+# app/utils/metrics.py
+"""
+Request metrics in Prometheus text format.
+
+Each worker process counts into its own MetricsRegistry. Observations happen on
+the event loop thread only, so the counters are plain ints and lists without
+locks. With METRICS_DIR set, a worker periodically writes a JSON snapshot of its
+registry there and GET /metrics merges the snapshots of every worker, so any worker
+can answer for the whole server; the directory must belong to one deployment. Without
+it, /metrics reports the worker that serves it.
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import get_settings
+from app.db import query_stats
+from app.utils.logger import logging_stats, setup_logging
+
+logger = setup_logging()
+settings = get_settings()
+
+PREFIX = "library_api"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Requests that did not match any route share one label value to bound cardinality
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # Per bucket (not cumulative); the last slot is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class RouteSeries:
+    __slots__ = ("latency", "db_time", "size", "queries")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_time = Histogram(DB_TIME_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.queries = 0
+
+
+class MetricsRegistry:
+    """
+    Metrics of one worker process, keyed by (route template, method, status)
+    """
+
+    def __init__(self):
+        self.series: Dict[Tuple[str, str, str], RouteSeries] = {}
+        self.in_flight = 0
+
+    def observe_request(
+            self,
+            route: str,
+            method: str,
+            status: int,
+            seconds: float,
+            db_seconds: float,
+            db_queries: int,
+            size: int
+    ) -> None:
+        key = (route, method, str(status))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = RouteSeries()
+        series.latency.observe(seconds)
+        series.db_time.observe(db_seconds)
+        series.size.observe(size)
+        series.queries += db_queries
+
+    def snapshot(self) -> Dict[str, Any]:
+        # Called on the event loop thread, so the dicts do not change underneath
+        return {
+            "pid": os.getpid(),
+            "in_flight": self.in_flight,
+            "log_records_dropped": logging_stats()["dropped"],
+            "series": [
+                {
+                    "labels": list(key),
+                    "latency": [list(series.latency.counts), series.latency.sum],
+                    "db_time": [list(series.db_time.counts), series.db_time.sum],
+                    "size": [list(series.size.counts), series.size.sum],
+                    "queries": series.queries,
+                }
+                for key, series in self.series.items()
+            ],
+        }
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware) so it neither buffers responses nor
+    breaks the context variable that collects the request's database time
+    """
+
+    def __init__(self, app, registry: MetricsRegistry, exclude_paths: Iterable[str] = ("/metrics",)):
+        self.app = app
+        self.registry = registry
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        registry = self.registry
+        # An outer wrapper (e.g. the benchmark) may already collect for this request
+        stats = query_stats.current()
+        token = None
+        if stats is None:
+            stats = query_stats.QueryStats()
+            token = query_stats.activate(stats)
+        registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.in_flight -= 1
+            if token is not None:
+                query_stats.deactivate(token)
+            registry.observe_request(
+                route_template(scope), scope["method"], status_code, elapsed, stats.seconds, stats.count, size
+            )
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsExporter:
+    """
+    Shares the registry of this worker with the others through snapshot files in
+    directory; with no directory it shares nothing and renders this worker alone
+    """
+
+    def __init__(self, registry: MetricsRegistry, directory: Optional[str], interval_seconds: float):
+        self.registry = registry
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"worker-{pid}.json")
+
+    def write_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(snapshot["pid"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        # Readers never see a half-written file
+        os.replace(tmp_path, path)
+
+    def read_snapshots(self) -> List[Tuple[Dict[str, Any], bool]]:
+        snapshots = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return snapshots
+        for name in names:
+            if not (name.startswith("worker-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            snapshots.append((snapshot, _pid_alive(snapshot["pid"])))
+        return snapshots
+
+    def remove_stale(self) -> None:
+        # Counters of workers that are gone restart from zero, which Prometheus treats as a reset
+        for snapshot, alive in self.read_snapshots():
+            if not alive:
+                try:
+                    os.remove(self._path(snapshot["pid"]))
+                except OSError:
+                    pass
+
+    async def flush(self) -> None:
+        await asyncio.to_thread(self.write_snapshot, self.registry.snapshot())
+
+    def start(self) -> None:
+        if not self.directory:
+            return
+        self.remove_stale()
+        self._task = asyncio.create_task(self._loop(), name="metrics:flush")
+
+    async def stop(self) -> None:
+        if not self.directory:
+            return
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.flush()
+            except OSError:
+                logger.exception("Could not write the metrics snapshot")
+
+    async def render(self) -> str:
+        # This worker's own numbers are always current; the others are at most one interval old
+        snapshot = self.registry.snapshot()
+        if not self.directory:
+            return render_prometheus(merge_snapshots([(snapshot, True)]))
+        await asyncio.to_thread(self.write_snapshot, snapshot)
+        snapshots = await asyncio.to_thread(self.read_snapshots)
+        return render_prometheus(merge_snapshots(snapshots))
+
+
+def merge_snapshots(snapshots: List[Tuple[Dict[str, Any], bool]]) -> Dict[str, Any]:
+    merged: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+    in_flight = 0
+    workers = 0
+    log_records_dropped = 0
+    for snapshot, alive in snapshots:
+        log_records_dropped += snapshot.get("log_records_dropped", 0)
+        if alive:
+            # Gauges only make sense for running workers; counters of dead ones are kept
+            workers += 1
+            in_flight += snapshot["in_flight"]
+        for item in snapshot["series"]:
+            key = tuple(item["labels"])
+            target = merged.get(key)
+            if target is None:
+                merged[key] = {
+                    "latency": [list(item["latency"][0]), item["latency"][1]],
+                    "db_time": [list(item["db_time"][0]), item["db_time"][1]],
+                    "size": [list(item["size"][0]), item["size"][1]],
+                    "queries": item["queries"],
+                }
+                continue
+            for name in ("latency", "db_time", "size"):
+                counts, total = item[name]
+                target[name][0] = [a + b for a, b in zip(target[name][0], counts)]
+                target[name][1] += total
+            target["queries"] += item["queries"]
+    return {"series": merged, "in_flight": in_flight, "workers": workers, "log_records_dropped": log_records_dropped}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(key: Tuple[str, ...], extra: str = "") -> str:
+    route, method, status = key
+    labels = f'route="{_escape(route)}",method="{method}",status="{status}"'
+    return "{" + labels + (f",{extra}" if extra else "") + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def _render_histogram(lines: List[str], name: str, help_text: str, buckets, series, field: str) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, values in series:
+        counts, total = values[field]
+        cumulative = 0
+        for bound, count in zip((*buckets, math.inf), counts):
+            cumulative += count
+            le = f'le="{_format_bound(bound)}"'
+            lines.append(f"{name}_bucket{_labels(key, le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(key)} {round(total, 6)}")
+        lines.append(f"{name}_count{_labels(key)} {cumulative}")
+
+
+def render_prometheus(merged: Dict[str, Any]) -> str:
+    series = sorted(merged["series"].items())
+    lines: List[str] = []
+    _render_histogram(
+        lines, f"{PREFIX}_http_request_duration_seconds", "Request latency by route template",
+        LATENCY_BUCKETS, series, "latency"
+    )
+    _render_histogram(
+        lines, f"{PREFIX}_http_request_db_seconds", "Time spent in database statements per request",
+        DB_TIME_BUCKETS, series, "db_time"
+    )
+    _render_histogram(
+        lines, f"{PREFIX}_http_response_size_bytes", "Response body size",
+        SIZE_BUCKETS, series, "size"
+    )
+
+    name = f"{PREFIX}_http_request_db_queries_total"
+    lines.append(f"# HELP {name} Database statements executed while serving requests")
+    lines.append(f"# TYPE {name} counter")
+    for key, values in series:
+        lines.append(f"{name}{_labels(key)} {values['queries']}")
+
+    name = f"{PREFIX}_http_request_db_time_share"
+    lines.append(f"# HELP {name} Share of request time spent in the database")
+    lines.append(f"# TYPE {name} gauge")
+    for key, values in series:
+        total = values["latency"][1]
+        share = values["db_time"][1] / total if total else 0.0
+        lines.append(f"{name}{_labels(key)} {round(share, 6)}")
+
+    name = f"{PREFIX}_http_requests_in_flight"
+    lines.append(f"# HELP {name} Requests currently being served")
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f"{name} {merged['in_flight']}")
+
+    name = f"{PREFIX}_log_records_dropped_total"
+    lines.append(f"# HELP {name} Log records dropped because the log queue was full")
+    lines.append(f"# TYPE {name} counter")
+    lines.append(f"{name} {merged['log_records_dropped']}")
+
+    name = f"{PREFIX}_workers"
+    lines.append(f"# HELP {name} Worker processes reporting metrics")
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f"{name} {merged['workers']}")
+    return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+exporter = MetricsExporter(
+    registry,
+    settings.METRICS_DIR or None,
+    settings.METRICS_FLUSH_INTERVAL_SECONDS,
+)
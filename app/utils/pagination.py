@@ -0,0 +1,84 @@
+# app/utils/pagination.py
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import Request, Response, status
+
+from app.utils.exceptions import LibraryException
+
+
+class InvalidCursorException(LibraryException):
+    """Exception raised when a pagination cursor cannot be decoded"""
+    def __init__(self, detail: str = "Invalid pagination cursor"):
+        super().__init__(detail, status_code=status.HTTP_400_BAD_REQUEST)
+
+
+class InvalidIdsException(LibraryException):
+    """Exception raised when the ids= list of a multi-get cannot be used"""
+    def __init__(self, detail: str):
+        super().__init__(detail, status_code=status.HTTP_400_BAD_REQUEST)
+
+
+# Most IDs one multi-get may ask for
+MAX_IDS_PER_REQUEST = 100
+IDS_HELP = f"Comma separated IDs (at most {MAX_IDS_PER_REQUEST}) to fetch in this order; missing ones are listed in X-Missing-Ids"
+
+
+def parse_ids(value: str) -> List[int]:
+    try:
+        ids = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise InvalidIdsException("ids must be a comma separated list of integers")
+    if not ids:
+        raise InvalidIdsException("ids must not be empty")
+    if len(ids) > MAX_IDS_PER_REQUEST:
+        raise InvalidIdsException(f"At most {MAX_IDS_PER_REQUEST} ids may be requested at once")
+    return ids
+
+
+def set_missing_ids_header(response: Response, missing: Sequence[int]) -> None:
+    if missing:
+        response.headers["X-Missing-Ids"] = ",".join(str(id) for id in missing)
+
+
+TOTAL_HELP = "Send the number of matching rows in X-Total-Count (estimated for very large unfiltered tables)"
+
+
+def set_total_count_header(response: Response, total: int, estimated: bool) -> None:
+    response.headers["X-Total-Count"] = str(total)
+    if estimated:
+        response.headers["X-Total-Count-Estimated"] = "true"
+
+
+def encode_cursor(sort_value: Any, id: int) -> str:
+    """
+    Build an opaque cursor from the last row's (sort_key, id) pair
+    """
+    if isinstance(sort_value, datetime):
+        sort_value = {"dt": sort_value.isoformat()}
+    raw = json.dumps([sort_value, id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value["dt"])
+        return sort_value, int(id)
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursorException()
+
+
+def set_pagination_headers(request: Request, response: Response, next_cursor: Optional[str]) -> None:
+    """
+    Advertise the next keyset page through the Link and X-Next-Cursor headers
+    """
+    if not next_cursor:
+        return
+    next_url = request.url.remove_query_params("skip").include_query_params(cursor=next_cursor)
+    response.headers["Link"] = f'<{next_url}>; rel="next"'
+    response.headers["X-Next-Cursor"] = next_cursor
@@ -0,0 +1,174 @@
+# app/utils/query_accounting.py
+import json
+from typing import Dict, Optional, Tuple
+
+from app.config import get_settings
+from app.db import query_stats
+from app.utils.logger import setup_logging
+from app.utils.metrics import route_template
+
+logger = setup_logging()
+settings = get_settings()
+
+# Most statements a route may run: what its costliest request runs on either dialect, with
+# the CRUD cache on (a miss also loads the cached relations) or off, plus a margin of two so
+# that a harmless extra statement such as a lazy refresh is not a 500 in strict mode. Routes
+# that never touch the database stay at 0. No route creates schema, and none may grow with
+# the size of a page or the number of linked rows; tests/test_query_budgets.py runs them all.
+# None marks a streaming route: it runs a fixed number of statements per chunk of rows
+# sent (app/services/export.py), so neither the budget nor the N+1 check applies.
+QUERY_BUDGETS: Dict[Tuple[str, str], Optional[int]] = {
+    ("GET", "/"): 0,
+    ("GET", "/metrics"): 0,
+
+    # Writes set both link lists and the search document (on SQLite also its vocabulary of
+    # corrections), then the route reads the book back with its relations.
+    ("POST", "/api/books/"): 14,
+    ("GET", "/api/books/"): 8,
+    ("GET", "/api/books/search"): 7,
+    ("GET", "/api/books/export"): None,
+    ("GET", "/api/books/{book_id}"): 6,
+    ("PUT", "/api/books/{book_id}"): 21,
+    ("PUT", "/api/books/by-isbn/{isbn}"): 21,
+    ("DELETE", "/api/books/{book_id}"): 8,
+    ("GET", "/api/books/{book_id}/available"): 6,
+
+    # A rename rebuilds the search documents of the linked books.
+    ("POST", "/api/authors/"): 4,
+    ("GET", "/api/authors/"): 6,
+    ("GET", "/api/authors/{author_id}"): 4,
+    ("PUT", "/api/authors/{author_id}"): 10,
+    ("DELETE", "/api/authors/{author_id}"): 6,
+
+    ("POST", "/api/categories/"): 4,
+    ("GET", "/api/categories/"): 6,
+    ("GET", "/api/categories/{category_id}"): 4,
+    ("PUT", "/api/categories/{category_id}"): 10,
+    ("DELETE", "/api/categories/{category_id}"): 6,
+
+    ("POST", "/api/users/"): 4,
+    ("GET", "/api/users/"): 6,
+    ("GET", "/api/users/{user_id}"): 4,
+    ("PUT", "/api/users/{user_id}"): 6,
+    ("DELETE", "/api/users/{user_id}"): 6,
+
+    # A checkout or return moves the book and user counters and four statistics rows.
+    ("POST", "/api/borrowed-books/"): 11,
+    ("GET", "/api/borrowed-books/"): 4,
+    ("GET", "/api/borrowed-books/export"): None,
+    ("GET", "/api/borrowed-books/{borrow_id}"): 4,
+    ("PUT", "/api/borrowed-books/{borrow_id}"): 11,
+    ("DELETE", "/api/borrowed-books/{borrow_id}"): 11,
+    ("POST", "/api/borrowed-books/batch"): 13,
+    ("POST", "/api/borrowed-books/batch-return"): 11,
+
+    ("GET", "/api/stats/library"): 3,
+    ("GET", "/api/stats/books/top"): 3,
+    ("GET", "/api/stats/categories"): 3,
+    ("GET", "/api/stats/users/top"): 3,
+    ("GET", "/api/stats/users/{user_id}"): 4,
+
+    ("GET", "/internal/pool"): 0,
+    ("GET", "/internal/replicas"): 0,
+    ("GET", "/internal/cache"): 0,
+    ("GET", "/internal/logging"): 0,
+    ("GET", "/internal/startup"): 0,
+    ("GET", "/internal/jobs"): 3,
+    # Four tables of statistics rebuilt with DELETE and INSERT ... SELECT.
+    ("POST", "/internal/stats/rebuild"): 11,
+}
+
+
+class QueryAccountingMiddleware:
+    """
+    Per-request statement accounting: logs N+1 suspects (one statement shape repeated
+    QUERY_REPEAT_THRESHOLD times or more) and routes over their query budget,
+    optionally adds X-Query-* debug headers, and in strict mode turns a response
+    over budget into a 500 so test runs fail on query regressions.
+    """
+
+    def __init__(
+            self,
+            app,
+            budgets: Optional[Dict[Tuple[str, str], int]] = None,
+            default_budget: Optional[int] = None,
+            strict: Optional[bool] = None,
+            debug_headers: Optional[bool] = None,
+            repeat_threshold: Optional[int] = None
+    ):
+        self.app = app
+        self.budgets = QUERY_BUDGETS if budgets is None else budgets
+        self.default_budget = settings.QUERY_BUDGET_DEFAULT if default_budget is None else default_budget
+        self.strict = settings.QUERY_BUDGET_STRICT if strict is None else strict
+        self.debug_headers = settings.QUERY_DEBUG_HEADERS if debug_headers is None else debug_headers
+        self.repeat_threshold = settings.QUERY_REPEAT_THRESHOLD if repeat_threshold is None else repeat_threshold
+
+    def budget_for(self, method: str, route: str) -> Optional[int]:
+        return self.budgets.get((method, route), self.default_budget)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Share the collector of an outer middleware (metrics) when there is one
+        stats = query_stats.current()
+        token = None
+        if stats is None:
+            stats = query_stats.QueryStats()
+            token = query_stats.activate(stats)
+
+        method = scope["method"]
+        over_budget = False
+
+        async def send_wrapper(message):
+            nonlocal over_budget
+            if message["type"] == "http.response.start":
+                budget = self.budget_for(method, route_template(scope))
+                over_budget = budget is not None and stats.count > budget
+                if over_budget and self.strict:
+                    await self._send_budget_error(send, method, route_template(scope), stats.count, budget)
+                    return
+                if self.debug_headers:
+                    message = {**message, "headers": [*message.get("headers", []), *self._debug_headers(stats)]}
+            elif over_budget and self.strict:
+                # The original body is replaced by the error
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if token is not None:
+                query_stats.deactivate(token)
+            self._report(method, route_template(scope), stats)
+
+    def _debug_headers(self, stats: query_stats.QueryStats):
+        _, repeats = stats.most_repeated()
+        return [
+            (b"x-query-count", str(stats.count).encode()),
+            (b"x-query-time-ms", f"{stats.seconds * 1000:.3f}".encode()),
+            (b"x-query-max-repeat", str(repeats).encode()),
+        ]
+
+    async def _send_budget_error(self, send, method: str, route: str, count: int, budget: int) -> None:
+        body = json.dumps({
+            "detail": f"Query budget exceeded for {method} {route}: {count} statements, budget {budget}"
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 500,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def _report(self, method: str, route: str, stats: query_stats.QueryStats) -> None:
+        logger.debug(f"{method} {route}: {stats.count} statements in {stats.seconds * 1000:.2f} ms")
+        budget = self.budget_for(method, route)
+        if budget is None:
+            return
+        shape, repeats = stats.most_repeated()
+        if repeats >= self.repeat_threshold:
+            logger.warning(f"Possible N+1 in {method} {route}: {repeats} x {shape[:300]}")
+        if stats.count > budget:
+            logger.warning(f"{method} {route} ran {stats.count} statements, over its budget of {budget}")
@@ -0,0 +1,112 @@
+# app/utils/serialization.py
+import json
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Type, get_args, get_origin
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+from app.config import get_settings
+
+try:
+    import orjson
+except ImportError:  # optional, only needed for the trusted mode
+    orjson = None
+
+# default - FastAPI validates through response_model and encodes with the stdlib json
+# adapter - cached TypeAdapter validates from attributes and dumps JSON in pydantic-core
+# trusted - ORM rows are read straight into dicts following the read model and dumped by orjson
+MODES = ("default", "adapter", "trusted")
+
+
+def serialization_mode() -> str:
+    mode = get_settings().RESPONSE_SERIALIZATION
+    if mode not in MODES:
+        return "default"
+    if mode == "trusted" and orjson is None:
+        # orjson is not installed
+        return "adapter"
+    return mode
+
+
+@lru_cache(maxsize=None)
+def get_adapter(response_type: Any) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+@lru_cache(maxsize=None)
+def _field_plan(model: Type[BaseModel]) -> Tuple[Tuple[str, Optional[Type[BaseModel]], bool], ...]:
+    """
+    (name, nested read model, is list) for every field of a read model
+    """
+    plan = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        is_list = get_origin(annotation) in (list, List)
+        if is_list:
+            annotation = get_args(annotation)[0]
+        nested = annotation if isinstance(annotation, type) and issubclass(annotation, BaseModel) else None
+        plan.append((name, nested, is_list))
+    return tuple(plan)
+
+
+def _trusted_dict(model: Type[BaseModel], obj: Any) -> dict:
+    # Values come from rows that were validated on the way in, so they are copied as is
+    data = {}
+    for name, nested, is_list in _field_plan(model):
+        value = getattr(obj, name)
+        if nested is not None and value is not None:
+            if is_list:
+                value = [_trusted_dict(nested, item) for item in value]
+            else:
+                value = _trusted_dict(nested, value)
+        data[name] = value
+    return data
+
+
+def dump_json(response_type: Any, content: Any, mode: Optional[str] = None) -> bytes:
+    """
+    Encode ORM content as the given response type (a read model or List[read model])
+    """
+    mode = mode or serialization_mode()
+    if mode == "trusted":
+        if get_origin(response_type) in (list, List):
+            model = get_args(response_type)[0]
+            return orjson.dumps([_trusted_dict(model, item) for item in content])
+        return orjson.dumps(_trusted_dict(response_type, content))
+    adapter = get_adapter(response_type)
+    validated = adapter.validate_python(content, from_attributes=True)
+    if mode == "adapter":
+        return adapter.dump_json(validated)
+    # What FastAPI does for a response_model
+    return json.dumps(
+        adapter.dump_python(validated, mode="json"),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def render(response_type: Any, content: Any, response: Response) -> Any:
+    """
+    Return the content for FastAPI to serialize, or an already encoded response when a
+    fast mode is enabled. The route's response_model (and OpenAPI schema) stays the same;
+    headers set on the injected response are carried over.
+    """
+    mode = serialization_mode()
+    if mode == "default":
+        return content
+    return encoded_response(dump_json(response_type, content, mode), response)
+
+
+def encoded_response(body: bytes, response: Response) -> Response:
+    """
+    A JSON response with the body and the headers set on the injected response
+    """
+    encoded = Response(content=body, status_code=response.status_code or 200, media_type="application/json")
+    encoded.raw_headers.extend(
+        (name, value) for name, value in response.raw_headers
+        if name not in (b"content-length", b"content-type")
+    )
+    return encoded
@@ -0,0 +1,50 @@
+# app/utils/startup.py
+# Лише стандартна бібліотека: імпортується першим у app.main, до всього іншого
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class StartupProfile:
+    """
+    Wall-clock timings of one worker start: importing the application and each phase
+    of the lifespan hook. Created when app.main starts importing.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.import_seconds: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self.ready_seconds: Optional[float] = None
+
+    def mark_imported(self) -> None:
+        self.import_seconds = time.perf_counter() - self.started_at
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started_at
+
+    def mark_ready(self) -> None:
+        self.ready_seconds = time.perf_counter() - self.started_at
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "import_seconds": self.import_seconds,
+            "phases": dict(self.phases),
+            "lifespan_seconds": sum(self.phases.values()),
+            "ready_seconds": self.ready_seconds,
+        }
+
+    def summary(self) -> str:
+        phases = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.phases.items())
+        return (
+            f"imports {(self.import_seconds or 0) * 1000:.1f} ms, {phases or 'no lifespan phases'}; "
+            f"ready after {(self.ready_seconds or 0) * 1000:.1f} ms"
+        )
+
+
+startup_profile = StartupProfile()
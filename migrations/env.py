@@ -0,0 +1,64 @@
+# migrations/env.py
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+from sqlmodel import SQLModel
+
+from app.config import get_settings
+from app.services.book_search import include_name
+
+# Every table module, so autogenerate sees the whole schema
+from app.models import authors, books, borrowed_books, categories, jobs, links, stats, users  # noqa: F401
+
+config = context.config
+# The app keeps its own logging when it runs a command itself (app/db/migrations.py)
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+settings = get_settings()
+target_metadata = SQLModel.metadata
+
+
+def run_migrations_offline() -> None:
+    """
+    Emit the SQL to stdout (alembic upgrade head --sql)
+    """
+    context.configure(
+        url=settings.DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=settings.DATABASE_URL.startswith("sqlite"),
+        include_name=include_name,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def _run(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite can only change a table by copying it
+        render_as_batch=connection.dialect.name == "sqlite",
+        include_name=include_name,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    # The app passes its own connection when it stamps a new database (app/db/migrations.py)
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+        return
+    with create_engine(settings.DATABASE_URL, poolclass=pool.NullPool).connect() as connection:
+        _run(connection)
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
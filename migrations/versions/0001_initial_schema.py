@@ -0,0 +1,116 @@
+"""initial schema
+
+The tables as SQLModel.metadata.create_all built them before migrations (the
+models of the first release). A table that already exists is left alone, so such
+a database can simply be upgraded; 0002 then brings it up to the current models.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 18:44:47.804367
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlmodel.sql.sqltypes import AutoString
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _create_table(name: str, *elements) -> bool:
+    """
+    Create a table with its indexes unless it exists; True when it was created.
+    Offline (--sql) there is no database to look at and every table is created.
+    """
+    if not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table(name):
+        return False
+    op.create_table(name, *elements)
+    return True
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _create_table(
+        'author',
+        sa.Column('first_name', AutoString(), nullable=False),
+        sa.Column('last_name', AutoString(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'book',
+        sa.Column('title', AutoString(), nullable=False),
+        sa.Column('publication_year', sa.Integer(), nullable=False),
+        sa.Column('isbn', AutoString(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.Index('ix_book_isbn', 'isbn', unique=True),
+        sa.Index('ix_book_title', 'title'),
+    )
+    _create_table(
+        'category',
+        sa.Column('name', AutoString(), nullable=False),
+        sa.Column('description', AutoString(), nullable=True),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _create_table(
+        'user',
+        sa.Column('first_name', AutoString(), nullable=False),
+        sa.Column('last_name', AutoString(), nullable=False),
+        sa.Column('email', AutoString(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('registration_date', sa.DateTime(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.Index('ix_user_email', 'email', unique=True),
+    )
+    _create_table(
+        'book_author_link',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['author_id'], ['author.id']),
+        sa.ForeignKeyConstraint(['book_id'], ['book.id']),
+        sa.PrimaryKeyConstraint('book_id', 'author_id'),
+    )
+    _create_table(
+        'book_category_link',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['book_id'], ['book.id']),
+        sa.ForeignKeyConstraint(['category_id'], ['category.id']),
+        sa.PrimaryKeyConstraint('book_id', 'category_id'),
+    )
+    _create_table(
+        'borrowedbook',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('borrow_date', sa.DateTime(), nullable=False),
+        sa.Column('return_date', sa.DateTime(), nullable=True),
+        sa.Column('due_date', sa.DateTime(), nullable=False),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['book_id'], ['book.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('borrowedbook', 'book_category_link', 'book_author_link', 'user', 'category', 'book', 'author'):
+        op.drop_table(table)
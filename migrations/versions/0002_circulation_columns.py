@@ -0,0 +1,202 @@
+"""circulation counters, borrow status, background jobs and statistics
+
+Brings a database at 0001 up to the current models and backfills what they maintain:
+
+- book.available_copies: quantity minus the open borrows of the book (never below 0)
+- user.active_borrows: the user's open borrows; user.updated_at: registration_date
+- borrowedbook.status: RETURNED when return_date is set, ACTIVE otherwise; the
+  overdue sweep (app/services/overdue.py) marks the ones past due and sets their fine
+- borrowedbook.fine: 0, the first release charged no fines
+- job_lease, job_run and the statistics rollups, which are computed from the borrows
+
+A column or table that already exists is left alone, together with its backfill.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:12:40.227915
+
+"""
+from typing import List, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlmodel.sql.sqltypes import AutoString
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BORROW_STATUS = sa.Enum('ACTIVE', 'RETURNED', 'OVERDUE', name='borrowstatus')
+# Open borrows before status existed
+OPEN_BORROWS = "return_date IS NULL"
+
+
+def _exists(table: str, column: str = None) -> bool:
+    # Offline (--sql) there is no database to look at and everything is created
+    if op.get_context().as_sql:
+        return False
+    inspector = sa.inspect(op.get_bind())
+    if column is None:
+        return inspector.has_table(table)
+    return inspector.has_table(table) and column in {c['name'] for c in inspector.get_columns(table)}
+
+
+def _create_table(name: str, *elements) -> bool:
+    """
+    Create a table with its indexes unless it exists; True when it was created
+    """
+    if _exists(name):
+        return False
+    op.create_table(name, *elements)
+    return True
+
+
+def _add_column(table: str, column: sa.Column) -> bool:
+    """
+    Add a column unless it exists; True when it was added
+    """
+    if _exists(table, column.name):
+        return False
+    op.add_column(table, column)
+    return True
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if _add_column('borrowedbook', sa.Column('fine', sa.Float(), nullable=False, server_default='0')):
+        op.execute("UPDATE borrowedbook SET fine = 0")
+    if op.get_context().dialect.name == 'postgresql':
+        BORROW_STATUS.create(op.get_bind(), checkfirst=not op.get_context().as_sql)
+    if _add_column('borrowedbook', sa.Column('status', BORROW_STATUS, nullable=False, server_default='ACTIVE')):
+        op.execute("UPDATE borrowedbook SET status = 'RETURNED' WHERE return_date IS NOT NULL")
+
+    if _add_column('book', sa.Column('available_copies', sa.Integer(), nullable=False, server_default='0')):
+        open_borrows = f"(SELECT count(*) FROM borrowedbook b WHERE b.book_id = book.id AND b.{OPEN_BORROWS})"
+        op.execute(f"""
+            UPDATE book SET available_copies =
+                CASE WHEN quantity > {open_borrows} THEN quantity - {open_borrows} ELSE 0 END
+        """)
+    if _add_column('user', sa.Column('active_borrows', sa.Integer(), nullable=False, server_default='0')):
+        op.execute(f"""
+            UPDATE "user" SET active_borrows =
+                (SELECT count(*) FROM borrowedbook b WHERE b.user_id = "user".id AND b.{OPEN_BORROWS})
+        """)
+    # SQLite cannot add a NOT NULL column without a constant default: add, fill, then tighten
+    if _add_column('user', sa.Column('updated_at', sa.DateTime(), nullable=True)):
+        op.execute('UPDATE "user" SET updated_at = registration_date')
+        with op.batch_alter_table('user') as batch:
+            batch.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+    _create_table(
+        'job_lease',
+        sa.Column('name', AutoString(), nullable=False),
+        sa.Column('owner', AutoString(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    _create_table(
+        'job_run',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_name', AutoString(), nullable=False),
+        sa.Column('owner', AutoString(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('duration_ms', sa.Float(), nullable=True),
+        sa.Column('rows_updated', sa.Integer(), nullable=False),
+        sa.Column('batches', sa.Integer(), nullable=False),
+        sa.Column('error', AutoString(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.Index('ix_job_run_job_name', 'job_name'),
+    )
+
+    created_stats: List[bool] = [
+        _create_table(
+            'book_stats',
+            sa.Column('book_id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('total_borrows', sa.Integer(), nullable=False),
+            sa.Column('active_borrows', sa.Integer(), nullable=False),
+            sa.Column('last_borrowed_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('book_id'),
+            sa.Index('ix_book_stats_rank', 'total_borrows', 'book_id'),
+        ),
+        _create_table(
+            'category_stats',
+            sa.Column('category_id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('total_borrows', sa.Integer(), nullable=False),
+            sa.Column('active_borrows', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('category_id'),
+            sa.Index('ix_category_stats_rank', 'total_borrows', 'category_id'),
+        ),
+        _create_table(
+            'user_stats',
+            sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('total_borrows', sa.Integer(), nullable=False),
+            sa.Column('active_borrows', sa.Integer(), nullable=False),
+            sa.Column('returns', sa.Integer(), nullable=False),
+            sa.Column('fines_total', sa.Float(), nullable=False),
+            sa.Column('last_borrowed_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('user_id'),
+            sa.Index('ix_user_stats_rank', 'total_borrows', 'user_id'),
+        ),
+        _create_table(
+            'library_stats',
+            sa.Column('shard', sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column('total_borrows', sa.Integer(), nullable=False),
+            sa.Column('active_borrows', sa.Integer(), nullable=False),
+            sa.Column('returns', sa.Integer(), nullable=False),
+            sa.Column('fines_total', sa.Float(), nullable=False),
+            sa.Column('total_copies', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('shard'),
+        ),
+    ]
+    if all(created_stats):
+        _backfill_stats()
+
+
+def _backfill_stats() -> None:
+    """
+    The rollups of a database that predates them, the same sums StatsService.rebuild computes
+    """
+    is_open = "CASE WHEN b.status <> 'RETURNED' THEN 1 ELSE 0 END"
+    is_returned = "CASE WHEN b.status = 'RETURNED' THEN 1 ELSE 0 END"
+    returned_fine = "CASE WHEN b.status = 'RETURNED' THEN b.fine ELSE 0.0 END"
+    op.execute(f"""
+        INSERT INTO book_stats (book_id, total_borrows, active_borrows, last_borrowed_at)
+        SELECT b.book_id, count(*), sum({is_open}), max(b.borrow_date) FROM borrowedbook b GROUP BY b.book_id
+    """)
+    op.execute(f"""
+        INSERT INTO category_stats (category_id, total_borrows, active_borrows)
+        SELECT l.category_id, count(*), sum({is_open})
+        FROM book_category_link l JOIN borrowedbook b ON b.book_id = l.book_id
+        GROUP BY l.category_id
+    """)
+    op.execute(f"""
+        INSERT INTO user_stats (user_id, total_borrows, active_borrows, returns, fines_total, last_borrowed_at)
+        SELECT b.user_id, count(*), sum({is_open}), sum({is_returned}), sum({returned_fine}), max(b.borrow_date)
+        FROM borrowedbook b GROUP BY b.user_id
+    """)
+    op.execute(f"""
+        INSERT INTO library_stats (shard, total_borrows, active_borrows, returns, fines_total, total_copies)
+        SELECT 0, count(*), coalesce(sum({is_open}), 0), coalesce(sum({is_returned}), 0),
+               coalesce(sum({returned_fine}), 0.0), (SELECT coalesce(sum(quantity), 0) FROM book)
+        FROM borrowedbook b
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('library_stats', 'user_stats', 'category_stats', 'book_stats', 'job_run', 'job_lease'):
+        op.drop_table(table)
+    with op.batch_alter_table('user') as batch:
+        batch.drop_column('updated_at')
+        batch.drop_column('active_borrows')
+    with op.batch_alter_table('book') as batch:
+        batch.drop_column('available_copies')
+    with op.batch_alter_table('borrowedbook') as batch:
+        batch.drop_column('status')
+        batch.drop_column('fine')
+    if op.get_context().dialect.name == 'postgresql':
+        BORROW_STATUS.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,61 @@
+"""borrowedbook indexes for the circulation hot paths
+
+- (book_id, status): open borrows of a book (delete guard, has_active_borrows) and
+  the book_id foreign key
+- (user_id, status): a user's borrows by status and the user_id foreign key
+- (status, due_date) over open borrows only: the overdue sweep and the overdue
+  list. Returned borrows are most of the table and never match, so they are left out.
+
+Built with CREATE INDEX CONCURRENTLY on PostgreSQL so borrowing is not blocked while
+they build. Mirrored in BorrowedBook.__table_args__ for databases made by create_all.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 19:02:11.418203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+OPEN_BORROWS = sa.text("status IN ('ACTIVE', 'OVERDUE')")
+
+INDEXES = [
+    ('ix_borrowedbook_book_id_status', ['book_id', 'status'], {}),
+    ('ix_borrowedbook_user_id_status', ['user_id', 'status'], {}),
+    ('ix_borrowedbook_open_status_due_date', ['status', 'due_date'],
+     {'postgresql_where': OPEN_BORROWS, 'sqlite_where': OPEN_BORROWS}),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_context().dialect.name == 'postgresql':
+        # CONCURRENTLY cannot run inside a transaction block
+        with op.get_context().autocommit_block():
+            for name, columns, options in INDEXES:
+                op.create_index(
+                    name, 'borrowedbook', columns, postgresql_concurrently=True, if_not_exists=True, **options
+                )
+    else:
+        for name, columns, options in INDEXES:
+            op.create_index(name, 'borrowedbook', columns, if_not_exists=True, **options)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, _, _ in reversed(INDEXES):
+                op.drop_index(name, 'borrowedbook', postgresql_concurrently=True, if_exists=True)
+    else:
+        for name, _, _ in reversed(INDEXES):
+            op.drop_index(name, 'borrowedbook', if_exists=True)
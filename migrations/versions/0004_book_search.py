@@ -0,0 +1,126 @@
+"""book search index
+
+The search table of app/services/book_search.py, filled from the catalog:
+
+- PostgreSQL: pg_trgm, the book_search table with its generated tsvector, and GIN
+  indexes on the document, the trigram body and book.title. The indexes are built
+  with CREATE INDEX CONCURRENTLY after the backfill, so writes are not blocked.
+- SQLite: an FTS5 trigram table and the vocabulary of one-letter deletions that
+  lets a misspelt word find the catalog word one edit away.
+
+Neither is a model; include_name in app/services/book_search.py keeps autogenerate
+away from them.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 10:31:05.604118
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DOCUMENTS = """
+INSERT INTO book_search ({key}, title, authors, categories)
+SELECT b.id, b.title,
+       coalesce((SELECT {agg}(a.first_name || ' ' || a.last_name, ' ')
+                 FROM book_author_link l JOIN author a ON a.id = l.author_id
+                 WHERE l.book_id = b.id), ''),
+       coalesce((SELECT {agg}(c.name, ' ')
+                 FROM book_category_link l JOIN category c ON c.id = l.category_id
+                 WHERE l.book_id = b.id), '')
+FROM book b
+WHERE NOT EXISTS (SELECT 1 FROM book_search s WHERE s.{key} = b.id)
+"""
+
+POSTGRES_INDEXES = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_book_search_document ON book_search USING gin (document)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_book_search_body_trgm ON book_search USING gin (body gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_book_title_trgm ON book USING gin (title gin_trgm_ops)",
+]
+# Words shorter than this get no corrections (MIN_CORRECTED_LENGTH in app/services/book_search.py)
+MIN_CORRECTED_LENGTH = 4
+
+
+def _upgrade_postgresql() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS book_search (
+            book_id integer PRIMARY KEY REFERENCES book(id) ON DELETE CASCADE,
+            title text NOT NULL DEFAULT '',
+            authors text NOT NULL DEFAULT '',
+            categories text NOT NULL DEFAULT '',
+            body text GENERATED ALWAYS AS (title || ' ' || authors || ' ' || categories) STORED,
+            document tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', title), 'A') ||
+                setweight(to_tsvector('simple', authors), 'B') ||
+                setweight(to_tsvector('simple', categories), 'C')
+            ) STORED
+        )
+    """)
+    op.execute(DOCUMENTS.format(key="book_id", agg="string_agg"))
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        for statement in POSTGRES_INDEXES:
+            op.execute(statement)
+
+
+def _upgrade_sqlite() -> None:
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS book_search USING fts5(title, authors, categories, tokenize='trigram')"
+    )
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS book_search_terms "
+        "(variant TEXT NOT NULL, term TEXT NOT NULL, PRIMARY KEY (variant, term)) WITHOUT ROWID"
+    )
+    op.execute(DOCUMENTS.format(key="rowid", agg="group_concat"))
+    if op.get_context().as_sql:
+        # The vocabulary is computed from the rows; the app builds it at startup when it is empty
+        return
+    bind = op.get_bind()
+    terms = {
+        word
+        for document in bind.execute(sa.text("SELECT title, authors, categories FROM book_search"))
+        for field in document
+        for word in re.findall(r"\w+", field.lower())
+        if len(word) >= MIN_CORRECTED_LENGTH
+    }
+    rows = [
+        {"variant": variant, "term": term}
+        for term in terms
+        for variant in {term} | {term[:i] + term[i + 1:] for i in range(len(term))}
+    ]
+    if rows:
+        bind.execute(
+            sa.text("INSERT OR IGNORE INTO book_search_terms (variant, term) VALUES (:variant, :term)"), rows
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        _upgrade_postgresql()
+    elif dialect == 'sqlite':
+        _upgrade_sqlite()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_book_title_trgm")
+        op.execute("DROP TABLE IF EXISTS book_search")
+    elif dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS book_search_terms")
+        op.execute("DROP TABLE IF EXISTS book_search")
@@ -0,0 +1,42 @@
+"""categories of each borrow at checkout
+
+borrow_category records the categories a borrow was counted under, so a return or
+removal takes it back from the same ones even after the book's links changed. For
+the borrows already there the links as they are now are the best record available;
+category_stats was built from them too, so the counters stay in step.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 11:48:22.951306
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'borrow_category',
+        sa.Column('borrow_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('category_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.PrimaryKeyConstraint('borrow_id', 'category_id'),
+    )
+    op.execute("""
+        INSERT INTO borrow_category (borrow_id, category_id)
+        SELECT b.id, l.category_id FROM borrowedbook b JOIN book_category_link l ON l.book_id = b.book_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('borrow_category')
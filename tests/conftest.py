@@ -0,0 +1,55 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# Settings and the engines are built when app is imported, so the test database comes first
+_DATABASE_DIR = tempfile.mkdtemp(prefix="library-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_DATABASE_DIR, "library.db")
+# A route over its query budget answers 500 instead of logging a warning
+os.environ["QUERY_BUDGET_STRICT"] = "true"
+os.environ["INTERNAL_API_TOKEN"] = "test-internal-token"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel
+
+from app.crud.cache import get_cache_backend
+from app.db.database import create_db_and_tables, engine
+from app.services.book_search import SEARCH_TABLE
+from app.services.stats_service import stats_service
+
+
+@pytest.fixture(scope="session")
+def app():
+    create_db_and_tables()
+    from app.main import app
+    return app
+
+
+def reset_database():
+    with Session(engine) as session:
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            session.execute(table.delete())
+        session.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+        session.commit()
+        stats_service.ensure_initialized(session)
+    get_cache_backend().clear()
+
+
+@pytest.fixture(autouse=True)
+def clean_database(app):
+    # Every test starts from an empty catalog and an empty cache
+    reset_database()
+
+
+@pytest.fixture
+def reset():
+    # For tests that start over more than once
+    return reset_database
+
+
+@pytest.fixture
+def client(app):
+    # Not entered as a context manager: no lifespan, so no scheduler or replica checks in the background
+    return TestClient(app)
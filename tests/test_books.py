@@ -0,0 +1,57 @@
+# tests/test_books.py
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+
+def create_book(client, isbn: str) -> dict:
+    response = client.post("/api/books/", json={
+        "title": "Dune", "publication_year": 1965, "isbn": isbn, "quantity": 1
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+@contextmanager
+def failing_commit():
+    # Any other constraint failing at commit, e.g. a link to a row deleted meanwhile
+    def fail(session):
+        raise IntegrityError("INSERT INTO bookauthorlink", {}, Exception("FOREIGN KEY constraint failed"))
+
+    event.listen(Session, "before_commit", fail)
+    try:
+        yield
+    finally:
+        event.remove(Session, "before_commit", fail)
+
+
+def test_taken_isbn_is_reported_on_update(client):
+    create_book(client, "9780441013593")
+    book = create_book(client, "9780441104024")
+
+    response = client.put(f"/api/books/{book['id']}", json={"isbn": "9780441013593"})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Book with ISBN 9780441013593 already exists"
+
+
+def test_book_keeping_its_isbn_is_not_a_duplicate_of_itself(client):
+    book = create_book(client, "9780441013593")
+
+    with failing_commit(), pytest.raises(IntegrityError, match="FOREIGN KEY"):
+        client.put(f"/api/books/{book['id']}", json={"title": "Dune Messiah"})
+
+
+def test_put_by_isbn_replaces_the_links_left_out(client):
+    author = client.post("/api/authors/", json={"first_name": "Frank", "last_name": "Herbert"}).json()
+    category = client.post("/api/categories/", json={"name": "Science fiction"}).json()
+    body = {"title": "Dune", "publication_year": 1965, "quantity": 3,
+            "author_ids": [author["id"]], "category_ids": [category["id"]]}
+    assert client.put("/api/books/by-isbn/9780441013593", json=body).status_code == 201
+
+    response = client.put("/api/books/by-isbn/9780441013593", json={"title": "Dune", "publication_year": 1965})
+    assert response.status_code == 200, response.text
+    book = response.json()
+    assert (book["quantity"], book["authors"], book["categories"]) == (1, [], [])
@@ -0,0 +1,25 @@
+# tests/test_cache.py
+from sqlmodel import Session
+
+from app.crud.books import crud_books
+from app.db.database import engine
+from app.models.books import Book
+
+
+def test_row_read_before_a_write_is_not_cached_after_it(client):
+    book = client.post("/api/books/", json={
+        "title": "Dune", "publication_year": 1965, "isbn": "9780441013593", "quantity": 1
+    }).json()
+
+    with Session(engine) as session:
+        generation = crud_books.cache.generation
+        stale = session.get(Book, book["id"])
+        # The write commits and invalidates between the reader's query and its store
+        crud_books.cache.invalidate([book["id"]])
+        crud_books.cache.set_entity(book["id"], stale, generation)
+        crud_books.cache.set_query(("dune",), [stale], generation)
+
+        assert crud_books.cache.get_entity(book["id"]) is None
+        assert crud_books.cache.get_query(("dune",)) is None
+        crud_books.cache.set_entity(book["id"], stale, crud_books.cache.generation)
+        assert crud_books.cache.get_entity(book["id"]) is not None
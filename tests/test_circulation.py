@@ -0,0 +1,94 @@
+# tests/test_circulation.py
+import asyncio
+
+import httpx
+import pytest
+from sqlmodel import Session, func, select
+
+from app.db.database import engine
+from app.models.books import Book
+from app.models.borrowed_books import BorrowedBook
+from app.services.circulation import IS_OPEN
+
+
+def create_book(client, quantity: int) -> dict:
+    response = client.post("/api/books/", json={
+        "title": "Dune", "publication_year": 1965, "isbn": "9780441013593", "quantity": quantity
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def create_users(client, count: int) -> list:
+    users = []
+    for i in range(count):
+        response = client.post("/api/users/", json={
+            "first_name": "Reader", "last_name": str(i), "email": f"reader{i}@example.com"
+        })
+        assert response.status_code == 201, response.text
+        users.append(response.json())
+    return users
+
+
+def counters(book_id: int) -> tuple:
+    # Straight from the database: quantity, available_copies and the open borrows
+    with Session(engine) as session:
+        book = session.get(Book, book_id)
+        open_borrows = session.exec(
+            select(func.count()).select_from(BorrowedBook).where(BorrowedBook.book_id == book_id, IS_OPEN)
+        ).one()
+        return book.quantity, book.available_copies, open_borrows
+
+
+async def race(app, requests: list) -> list:
+    # Every request in flight at once, each with its own session
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await asyncio.gather(*(client.request(method, url, json=body) for method, url, body in requests))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_checkouts_never_oversell(app, client):
+    copies, readers = 3, 10
+    book = create_book(client, copies)
+    users = create_users(client, readers)
+
+    responses = await race(app, [
+        ("POST", "/api/borrowed-books/", {"book_id": book["id"], "user_id": user["id"]}) for user in users
+    ])
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [201] * copies + [400] * (readers - copies), [r.text for r in responses]
+    assert counters(book["id"]) == (copies, 0, copies)
+
+
+@pytest.mark.asyncio
+async def test_quantity_change_during_checkouts_keeps_availability(app, client):
+    book = create_book(client, 4)
+    users = create_users(client, 6)
+
+    responses = await race(app, [
+        ("POST", "/api/borrowed-books/", {"book_id": book["id"], "user_id": user["id"]}) for user in users
+    ] + [("PUT", f"/api/books/{book['id']}", {"quantity": 6})])
+
+    assert all(response.status_code in (200, 201, 400) for response in responses), [r.text for r in responses]
+    quantity, available, open_borrows = counters(book["id"])
+    assert quantity == 6
+    assert available == quantity - open_borrows >= 0
+
+
+def test_quantity_cannot_drop_below_copies_on_loan(client):
+    book = create_book(client, 2)
+    for user in create_users(client, 2):
+        response = client.post("/api/borrowed-books/", json={"book_id": book["id"], "user_id": user["id"]})
+        assert response.status_code == 201, response.text
+
+    response = client.put(f"/api/books/{book['id']}", json={"quantity": 1, "title": "Dune Messiah"})
+    assert response.status_code == 400
+    assert counters(book["id"]) == (2, 0, 2)
+    assert client.get(f"/api/books/{book['id']}").json()["title"] == "Dune"
+
+    response = client.put(f"/api/books/{book['id']}", json={"quantity": 5})
+    assert response.status_code == 200
+    assert response.json()["available_copies"] == 3
+    assert counters(book["id"]) == (5, 3, 2)
+    assert client.get("/api/stats/library").json()["total_copies"] == 5
@@ -0,0 +1,14 @@
+# tests/test_internal.py
+from app.config import get_settings
+
+
+def test_internal_routes_need_the_token(client):
+    token = get_settings().INTERNAL_API_TOKEN
+    assert client.get("/internal/cache").status_code == 403
+    assert client.post("/internal/stats/rebuild", headers={"X-Internal-Token": "guess"}).status_code == 403
+    assert client.get("/internal/cache", headers={"X-Internal-Token": token}).status_code == 200
+
+
+def test_internal_routes_do_not_exist_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(get_settings(), "INTERNAL_API_TOKEN", "")
+    assert client.get("/internal/cache", headers={"X-Internal-Token": ""}).status_code == 404
@@ -0,0 +1,79 @@
+# tests/test_migrations.py
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine, text
+from sqlmodel import SQLModel
+
+from app.db.migrations import ALEMBIC_INI
+from app.services.book_search import include_name
+from app.tools.explain_indexes import check
+
+
+def upgrade(engine, revision: str) -> None:
+    config = Config(ALEMBIC_INI, attributes={"configure_logger": False})
+    with engine.begin() as connection:
+        config.attributes["connection"] = connection
+        command.upgrade(config, revision)
+
+
+def test_upgrade_from_first_release_backfills_counters(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'library.db'}")
+    upgrade(engine, "0001")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO book (id, title, publication_year, isbn, quantity, created_at, updated_at)
+            VALUES (1, 'Dune', 1965, '9780441013593', 2, '2024-01-01', '2024-01-01'),
+                   (2, 'Solaris', 1961, '9780156027601', 1, '2024-01-01', '2024-01-01')
+        """))
+        conn.execute(text("""
+            INSERT INTO "user" (id, first_name, last_name, email, registration_date, is_active)
+            VALUES (1, 'Ada', 'Lovelace', 'ada@example.com', '2024-01-02', 1)
+        """))
+        conn.execute(text(
+            "INSERT INTO category (id, name, created_at, updated_at) VALUES (1, 'SF', '2024-01-01', '2024-01-01')"
+        ))
+        conn.execute(text("INSERT INTO book_category_link (book_id, category_id) VALUES (1, 1)"))
+        # Open and returned borrows of book 1; book 2 is lent out more often than it has copies
+        conn.execute(text("""
+            INSERT INTO borrowedbook (id, book_id, user_id, borrow_date, return_date, due_date, created_at, updated_at)
+            VALUES (1, 1, 1, '2024-02-01', NULL, '2024-02-15', '2024-02-01', '2024-02-01'),
+                   (2, 1, 1, '2024-02-01', '2024-02-03', '2024-02-15', '2024-02-01', '2024-02-03'),
+                   (3, 2, 1, '2024-02-01', NULL, '2024-02-15', '2024-02-01', '2024-02-01'),
+                   (4, 2, 1, '2024-02-01', NULL, '2024-02-15', '2024-02-01', '2024-02-01')
+        """))
+
+    upgrade(engine, "head")
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT id, available_copies FROM book ORDER BY id")).all() == [(1, 1), (2, 0)]
+        assert conn.execute(text('SELECT active_borrows, updated_at FROM "user"')).one() == (3, "2024-01-02")
+        assert conn.execute(text("SELECT id, status, fine FROM borrowedbook ORDER BY id")).all() == [
+            (1, "ACTIVE", 0.0), (2, "RETURNED", 0.0), (3, "ACTIVE", 0.0), (4, "ACTIVE", 0.0)
+        ]
+        assert conn.execute(text(
+            "SELECT total_borrows, active_borrows, returns, total_copies FROM library_stats"
+        )).one() == (4, 3, 1, 3)
+        assert conn.execute(text("SELECT category_id, total_borrows, active_borrows FROM category_stats")).all() == [
+            (1, 2, 1)
+        ]
+        # Borrows so far count for the categories their books have now
+        assert conn.execute(text("SELECT borrow_id, category_id FROM borrow_category ORDER BY borrow_id")).all() == [
+            (1, 1), (2, 1)
+        ]
+        # The search index covers the books that were there
+        assert conn.execute(text("SELECT rowid, title FROM book_search ORDER BY rowid")).all() == [
+            (1, "Dune"), (2, "Solaris")
+        ]
+        assert conn.execute(text("SELECT count(*) FROM book_search_terms WHERE term = 'dune'")).scalar() == 5
+        # Nothing left between the migrated schema and the models
+        context = MigrationContext.configure(conn, opts={"include_name": include_name})
+        assert compare_metadata(context, SQLModel.metadata) == []
+
+
+def test_hot_borrowedbook_queries_use_their_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'library.db'}")
+    upgrade(engine, "head")
+    report = check(engine)
+    assert report["ok"], {name: query["plan"] for name, query in report["queries"].items()}
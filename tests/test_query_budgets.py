@@ -0,0 +1,159 @@
+# tests/test_query_budgets.py
+import os
+
+import pytest
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+
+from app.crud.cache import LRUCacheBackend, NullCacheBackend, get_cache_backend, set_cache_backend
+from app.utils.query_accounting import QUERY_BUDGETS, QueryAccountingMiddleware
+
+CHANGED = {"If-None-Match": '"stale"'}
+INTERNAL = {"X-Internal-Token": os.environ["INTERNAL_API_TOKEN"]}
+RETURNED_AT = "2030-01-01T10:00:00"
+
+# The costliest request of every route: (method, route, path, body, headers, status)
+CASES = [
+    ("GET", "/", "/", None, None, 200),
+    ("GET", "/metrics", "/metrics", None, None, 200),
+
+    ("POST", "/api/books/", "/api/books/", {
+        "title": "Dune Messiah", "publication_year": 1969, "isbn": "9780593098233", "quantity": 2,
+        "author_ids": ["a1", "a2"], "category_ids": ["c1", "c2"]
+    }, None, 201),
+    ("GET", "/api/books/", "/api/books/?title=dune&author_id={a1}&category_id={c1}&total=true", None, CHANGED, 200),
+    ("GET", "/api/books/search", "/api/books/search?q=dnue", None, None, 200),
+    ("GET", "/api/books/{book_id}", "/api/books/{b1}", None, CHANGED, 200),
+    ("PUT", "/api/books/{book_id}", "/api/books/{b1}", {
+        "title": "Dune", "isbn": "9780441172719", "quantity": 6,
+        "author_ids": ["a1", "a3"], "category_ids": ["c1", "c3"]
+    }, None, 200),
+    ("PUT", "/api/books/by-isbn/{isbn}", "/api/books/by-isbn/9780441013593", {
+        "title": "Dune", "publication_year": 1965, "quantity": 6,
+        "author_ids": ["a1", "a3"], "category_ids": ["c1", "c3"]
+    }, None, 200),
+    ("DELETE", "/api/books/{book_id}", "/api/books/{b3}", None, None, 204),
+    ("GET", "/api/books/{book_id}/available", "/api/books/{b1}/available", None, None, 200),
+
+    ("POST", "/api/authors/", "/api/authors/", {"first_name": "Ursula", "last_name": "Le Guin"}, None, 201),
+    ("GET", "/api/authors/", "/api/authors/?total=true", None, CHANGED, 200),
+    ("GET", "/api/authors/{author_id}", "/api/authors/{a1}", None, CHANGED, 200),
+    ("PUT", "/api/authors/{author_id}", "/api/authors/{a1}", {"last_name": "Herbert Jr"}, None, 200),
+    ("DELETE", "/api/authors/{author_id}", "/api/authors/{a3}", None, None, 200),
+
+    ("POST", "/api/categories/", "/api/categories/", {"name": "Fantasy"}, None, 201),
+    ("GET", "/api/categories/", "/api/categories/?total=true", None, CHANGED, 200),
+    ("GET", "/api/categories/{category_id}", "/api/categories/{c1}", None, CHANGED, 200),
+    ("PUT", "/api/categories/{category_id}", "/api/categories/{c1}", {"name": "Science fiction"}, None, 200),
+    ("DELETE", "/api/categories/{category_id}", "/api/categories/{c3}", None, None, 200),
+
+    ("POST", "/api/users/", "/api/users/", {"first_name": "New", "last_name": "Reader", "email": "new@example.com"},
+     None, 201),
+    ("GET", "/api/users/", "/api/users/?total=true", None, CHANGED, 200),
+    ("GET", "/api/users/{user_id}", "/api/users/{u1}", None, CHANGED, 200),
+    ("PUT", "/api/users/{user_id}", "/api/users/{u1}", {"email": "changed@example.com"}, None, 200),
+    ("DELETE", "/api/users/{user_id}", "/api/users/{u3}", None, None, 200),
+
+    ("POST", "/api/borrowed-books/", "/api/borrowed-books/", {"book_id": "b1", "user_id": "u2"}, None, 201),
+    ("GET", "/api/borrowed-books/", "/api/borrowed-books/", None, CHANGED, 200),
+    ("GET", "/api/borrowed-books/{borrow_id}", "/api/borrowed-books/{r1}", None, CHANGED, 200),
+    ("PUT", "/api/borrowed-books/{borrow_id}", "/api/borrowed-books/{r1}", {"return_date": RETURNED_AT}, None, 200),
+    ("DELETE", "/api/borrowed-books/{borrow_id}", "/api/borrowed-books/{r2}", None, None, 200),
+    ("POST", "/api/borrowed-books/batch", "/api/borrowed-books/batch", {"user_id": "u2", "book_ids": ["b1", "b2"]},
+     None, 200),
+    ("POST", "/api/borrowed-books/batch-return", "/api/borrowed-books/batch-return", {
+        "borrow_ids": ["r1", "r2", 999999], "return_date": RETURNED_AT
+    }, None, 200),
+
+    ("GET", "/api/stats/library", "/api/stats/library", None, None, 200),
+    ("GET", "/api/stats/books/top", "/api/stats/books/top", None, None, 200),
+    ("GET", "/api/stats/categories", "/api/stats/categories", None, None, 200),
+    ("GET", "/api/stats/users/top", "/api/stats/users/top", None, None, 200),
+    ("GET", "/api/stats/users/{user_id}", "/api/stats/users/{u1}", None, None, 200),
+
+    ("GET", "/internal/pool", "/internal/pool", None, INTERNAL, 200),
+    ("GET", "/internal/replicas", "/internal/replicas", None, INTERNAL, 200),
+    ("GET", "/internal/cache", "/internal/cache", None, INTERNAL, 200),
+    ("GET", "/internal/logging", "/internal/logging", None, INTERNAL, 200),
+    ("GET", "/internal/startup", "/internal/startup", None, INTERNAL, 200),
+    ("GET", "/internal/jobs", "/internal/jobs", None, INTERNAL, 200),
+    ("POST", "/internal/stats/rebuild", "/internal/stats/rebuild", None, INTERNAL, 200),
+]
+
+
+def seed(client) -> dict:
+    """
+    Two linked books with a borrow each, and an author, a category, a user and a book
+    that nothing depends on
+    """
+    def post(path: str, body: dict) -> int:
+        response = client.post(path, json=body)
+        assert response.status_code == 201, response.text
+        return response.json()["id"]
+
+    ids = {
+        "a1": post("/api/authors/", {"first_name": "Frank", "last_name": "Herbert"}),
+        "a2": post("/api/authors/", {"first_name": "Brian", "last_name": "Herbert"}),
+        "a3": post("/api/authors/", {"first_name": "Kevin", "last_name": "Anderson"}),
+        "c1": post("/api/categories/", {"name": "Science fiction"}),
+        "c2": post("/api/categories/", {"name": "Classics"}),
+        "c3": post("/api/categories/", {"name": "Unused"}),
+        "u1": post("/api/users/", {"first_name": "Ann", "last_name": "Reader", "email": "ann@example.com"}),
+        "u2": post("/api/users/", {"first_name": "Bob", "last_name": "Reader", "email": "bob@example.com"}),
+        "u3": post("/api/users/", {"first_name": "Cy", "last_name": "Reader", "email": "cy@example.com"}),
+    }
+    book = {"publication_year": 1965, "quantity": 5}
+    ids["b1"] = post("/api/books/", {**book, "title": "Dune", "isbn": "9780441013593",
+                                     "author_ids": [ids["a1"], ids["a2"]], "category_ids": [ids["c1"], ids["c2"]]})
+    ids["b2"] = post("/api/books/", {**book, "title": "Children of Dune", "isbn": "9780441104024",
+                                     "author_ids": [ids["a1"]], "category_ids": [ids["c1"]]})
+    ids["b3"] = post("/api/books/", {**book, "title": "Chapterhouse", "isbn": "9780441102679",
+                                     "author_ids": [ids["a2"]], "category_ids": [ids["c2"]]})
+    ids["r1"] = post("/api/borrowed-books/", {"book_id": ids["b1"], "user_id": ids["u1"]})
+    ids["r2"] = post("/api/borrowed-books/", {"book_id": ids["b2"], "user_id": ids["u1"]})
+    return ids
+
+
+def resolve(value, ids: dict):
+    # Names of seeded rows in a body become their IDs
+    if isinstance(value, dict):
+        return {key: resolve(item, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve(item, ids) for item in value]
+    return ids.get(value, value) if isinstance(value, str) else value
+
+
+@pytest.fixture
+def counting_client(app):
+    # Counts what the app's own accounting counts, and is as strict about it
+    return TestClient(QueryAccountingMiddleware(app, budgets=QUERY_BUDGETS, strict=True, debug_headers=True))
+
+
+def test_every_route_has_a_budget_and_a_case(app):
+    routes = {(method, route.path) for route in app.routes if isinstance(route, APIRoute) for method in route.methods}
+    assert routes <= QUERY_BUDGETS.keys()
+    budgeted = {key for key, budget in QUERY_BUDGETS.items() if budget is not None}
+    assert {(method, route) for method, route, *_ in CASES} == budgeted
+
+
+@pytest.mark.parametrize(
+    "method, route, path, body, headers, status_code", CASES, ids=[f"{case[0]} {case[1]}" for case in CASES]
+)
+def test_route_stays_within_its_budget(client, counting_client, reset, method, route, path, body, headers, status_code):
+    cached = get_cache_backend()
+    counts = {}
+    try:
+        for name, backend in (("cache", LRUCacheBackend()), ("no cache", NullCacheBackend())):
+            reset()
+            set_cache_backend(backend)
+            ids = seed(client)
+            # The cache starts cold: a miss is the costlier path
+            backend.clear()
+            response = counting_client.request(method, path.format(**ids), json=resolve(body, ids), headers=headers)
+            # Over budget the strict middleware answers 500
+            assert response.status_code == status_code, response.text
+            counts[name] = int(response.headers["x-query-count"])
+    finally:
+        set_cache_backend(cached)
+
+    assert max(counts.values()) <= QUERY_BUDGETS[method, route], counts
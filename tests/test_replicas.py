@@ -0,0 +1,42 @@
+# tests/test_replicas.py
+import time
+
+import pytest
+
+from app.config import get_settings
+from app.crud.cache import get_cache_backend
+from app.db.database import build_async_engine, replicas
+from app.db.replicas import Replica
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    # The test database read through a replica-flagged engine, as a SQLite copy stands in locally
+    engine = build_async_engine(get_settings().DATABASE_URL, get_settings(), read_only=True)
+    replica = Replica(engine)
+    replica.healthy, replica.lag, replica.checked_at = True, 0.0, time.time()
+    monkeypatch.setattr(replicas, "replicas", [replica])
+    yield replica
+    engine.sync_engine.dispose(close=False)
+
+
+def cached_entries() -> int:
+    return get_cache_backend().stats()["entries"]
+
+
+def test_rows_read_from_a_replica_are_not_cached(client, replica):
+    book = client.post("/api/books/", json={
+        "title": "Dune", "publication_year": 1965, "isbn": "9780441013593", "quantity": 1
+    }).json()
+    get_cache_backend().clear()
+
+    for path in (f"/api/books/{book['id']}", "/api/books/", "/api/books/?title=dune"):
+        response = client.get(path)
+        assert response.status_code == 200, response.text
+    assert replica.reads == 3
+    assert cached_entries() == 0
+
+    # The same reads on the primary fill the cache
+    replica.healthy = False
+    assert client.get(f"/api/books/{book['id']}").status_code == 200
+    assert cached_entries() == 1
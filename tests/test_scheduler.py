@@ -0,0 +1,31 @@
+# tests/test_scheduler.py
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlmodel import Session
+
+from app.db.database import engine
+from app.models.jobs import JobLease
+from app.services.scheduler import PeriodicJob
+
+
+def lease_expiry() -> datetime:
+    with Session(engine) as session:
+        return session.get(JobLease, "sweep").expires_at
+
+
+def test_lease_outlasts_a_long_run_and_ends_with_the_interval():
+    during = []
+
+    def job(db):
+        # Another worker looking now must still see the lease held
+        during.append(lease_expiry())
+        return SimpleNamespace(rows_updated=0, batches=1)
+
+    start = datetime.utcnow()
+    run = PeriodicJob("sweep", 60, job, lease_seconds=3600).run_once(engine)
+    assert run is not None and run.error is None
+
+    assert during[0] >= start + timedelta(seconds=3600)
+    assert start + timedelta(seconds=60) <= lease_expiry() < start + timedelta(seconds=120)
+    assert PeriodicJob("sweep", 60, job, lease_seconds=3600).run_once(engine) is None
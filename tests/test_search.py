@@ -0,0 +1,55 @@
+# tests/test_search.py
+from sqlalchemy import event
+
+from app.db.database import async_engine
+
+
+def create_book(client, title: str, isbn: str, author: str) -> dict:
+    first_name, last_name = author.split()
+    author_id = client.post("/api/authors/", json={"first_name": first_name, "last_name": last_name}).json()["id"]
+    response = client.post("/api/books/", json={
+        "title": title, "publication_year": 1965, "isbn": isbn, "quantity": 1, "author_ids": [author_id]
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def titles(response) -> list:
+    assert response.status_code == 200, response.text
+    return [book["title"] for book in response.json()]
+
+
+def test_search_finds_a_word_one_typo_away(client):
+    create_book(client, "Dune", "9780441013593", "Frank Herbert")
+    create_book(client, "Solaris", "9780156027601", "Stanislaw Lem")
+
+    assert titles(client.get("/api/books/search", params={"q": "Dnue"})) == ["Dune"]
+    assert titles(client.get("/api/books/search", params={"q": "Solrais"})) == ["Solaris"]
+    assert titles(client.get("/api/books/search", params={"q": "Hebrert"})) == ["Dune"]
+    assert titles(client.get("/api/books/search", params={"q": "Dune"})) == ["Dune"]
+
+
+def test_renamed_author_is_found_under_the_new_name(client):
+    book = create_book(client, "Dune", "9780441013593", "Frank Herbert")
+    author_id = book["authors"][0]["id"]
+    client.put(f"/api/authors/{author_id}", json={"last_name": "Herbertson"})
+
+    assert titles(client.get("/api/books/search", params={"q": "Herbertsno"})) == ["Dune"]
+
+
+def test_requests_run_no_schema_changes(client):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        create_book(client, "Dune", "9780441013593", "Frank Herbert")
+        client.get("/api/books/", params={"title": "Du"})
+        client.get("/api/books/search", params={"q": "Dune"})
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+    assert statements
+    assert not [s for s in statements if s.lstrip().upper().startswith(("CREATE", "ALTER", "DROP"))]
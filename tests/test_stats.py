@@ -0,0 +1,78 @@
+# tests/test_stats.py
+import pytest
+from sqlmodel import Session
+
+from app.db.database import engine
+from app.services.stats_service import stats_service
+
+
+@pytest.fixture
+def catalog(client):
+    fiction = client.post("/api/categories/", json={"name": "Fiction"}).json()
+    classics = client.post("/api/categories/", json={"name": "Classics"}).json()
+    book = client.post("/api/books/", json={
+        "title": "Dune", "publication_year": 1965, "isbn": "9780441013593", "quantity": 3,
+        "category_ids": [fiction["id"]]
+    }).json()
+    user = client.post("/api/users/", json={"first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.com"})
+    return {"fiction": fiction["id"], "classics": classics["id"], "book": book["id"], "user": user.json()["id"]}
+
+
+def category_stats(client) -> dict:
+    response = client.get("/api/stats/categories")
+    assert response.status_code == 200, response.text
+    return {row["category_id"]: (row["total_borrows"], row["active_borrows"]) for row in response.json()}
+
+
+def recategorize(client, catalog) -> None:
+    response = client.put(f"/api/books/{catalog['book']}", json={"category_ids": [catalog["classics"]]})
+    assert response.status_code == 200, response.text
+
+
+def rebuilt_category_stats(client) -> dict:
+    with Session(engine) as session:
+        stats_service.rebuild(session)
+    return category_stats(client)
+
+
+def test_return_counts_against_the_categories_at_checkout(client, catalog):
+    borrow = client.post("/api/borrowed-books/", json={"book_id": catalog["book"], "user_id": catalog["user"]}).json()
+    recategorize(client, catalog)
+
+    response = client.put(f"/api/borrowed-books/{borrow['id']}", json={"return_date": "2030-01-01T00:00:00"})
+    assert response.status_code == 200, response.text
+    assert category_stats(client) == {catalog["fiction"]: (1, 0)}
+    assert rebuilt_category_stats(client) == {catalog["fiction"]: (1, 0)}
+
+
+def test_batch_return_and_removal_use_the_categories_at_checkout(client, catalog):
+    response = client.post("/api/borrowed-books/batch", json={
+        "user_id": catalog["user"], "book_ids": [catalog["book"], catalog["book"]]
+    })
+    assert response.status_code == 200, response.text
+    first, second = [item["borrow"]["id"] for item in response.json()["items"]]
+    recategorize(client, catalog)
+    third = client.post("/api/borrowed-books/", json={"book_id": catalog["book"], "user_id": catalog["user"]}).json()
+    assert category_stats(client) == {catalog["fiction"]: (2, 2), catalog["classics"]: (1, 1)}
+
+    response = client.post("/api/borrowed-books/batch-return", json={"borrow_ids": [first, third["id"]]})
+    assert response.status_code == 200, response.text
+    assert category_stats(client) == {catalog["fiction"]: (2, 1), catalog["classics"]: (1, 0)}
+
+    assert client.delete(f"/api/borrowed-books/{second}").status_code in (200, 204)
+    assert category_stats(client) == {catalog["fiction"]: (1, 0), catalog["classics"]: (1, 0)}
+    assert rebuilt_category_stats(client) == {catalog["fiction"]: (1, 0), catalog["classics"]: (1, 0)}
+
+
+def test_book_with_active_borrows_is_not_removed(client, catalog):
+    borrow = client.post("/api/borrowed-books/", json={"book_id": catalog["book"], "user_id": catalog["user"]}).json()
+
+    response = client.delete(f"/api/books/{catalog['book']}")
+    assert response.status_code == 400, response.text
+    library = client.get("/api/stats/library").json()
+    assert (library["total_copies"], library["active_borrows"]) == (3, 1)
+
+    client.put(f"/api/borrowed-books/{borrow['id']}", json={"return_date": "2030-01-01T00:00:00"})
+    assert client.delete(f"/api/books/{catalog['book']}").status_code == 204
+    library = client.get("/api/stats/library").json()
+    assert (library["total_copies"], library["active_borrows"]) == (0, 0)